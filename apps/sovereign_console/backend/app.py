@@ -1,12 +1,23 @@
 import os
+import json
+import asyncio
 from pathlib import Path
+from typing import Optional
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
-from providers import generate_reply
+from providers import agenerate_reply, generate_reply_stream, start_health_prober, aclose as aclose_providers
 import tools
+import finder
+import fileread
+import offload
+from content_cache import CACHE
+from provider_health import HEALTH
+from response_cache import RESPONSES
+from watcher import WorkspaceWatcher, watch_enabled
+from jobs import JobManager, sse_events
 
 APP_ROOT = Path(__file__).resolve().parent
 TEMPLATES = APP_ROOT / "templates"
@@ -23,6 +34,55 @@ app = FastAPI(title="Sovereign Console")
 
 app.mount("/static", StaticFiles(directory=str(STATIC)), name="static")
 
+WATCHER = None
+JOBS = JobManager()
+
+@app.on_event("startup")
+async def start_prober():
+    start_health_prober()
+
+@app.on_event("startup")
+async def prime_metrics():
+    # /api/metrics reads CPU % without sleeping: start the first window now
+    tools.prime_cpu()
+
+@app.on_event("startup")
+async def start_watcher():
+    global WATCHER
+    if not watch_enabled():
+        return
+    # the index db may live inside the workspace: its own writes must not re-trigger us
+    ignore = [tools.safe_rel(tools.index_db_path().parent)]
+    WATCHER = WorkspaceWatcher.from_env(
+        str(tools.root()),
+        tools.index_paths,
+        exclude=tools.INDEX_EXCLUDES,
+        ignore=[i for i in ignore if not os.path.isabs(i)],
+    ).start()
+
+@app.on_event("shutdown")
+async def stop_watcher():
+    if WATCHER:
+        WATCHER.stop()
+
+@app.on_event("shutdown")
+async def close_providers():
+    await aclose_providers()
+
+async def until_disconnect(req: Request, coro, poll: float = 0.5):
+    """Await coro, cancelling it if the client goes away first (None then)."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                return task.result()
+            if await req.is_disconnected():
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
 def html_template() -> str:
     return (TEMPLATES / "index.html").read_text(encoding="utf-8", errors="ignore")
 
@@ -32,43 +92,130 @@ async def home():
 
 @app.get("/api/health")
 async def health():
+    job = JOBS.running("index")
     return {
         "ok": True,
         "provider": os.getenv("AI_PROVIDER", "auto"),
         "workspace": os.getenv("WORKSPACE_ROOT", "."),
         "exec_enabled": os.getenv("EXEC_ENABLED", "false"),
         "write_enabled": os.getenv("WRITE_ENABLED", "false"),
+        "watcher": WATCHER.status() if WATCHER else None,
+        "index_job": job.snapshot() if job else None,
+        "cache": CACHE.stats(),
+        "providers": HEALTH.snapshot(),
+        "response_cache": await offload.run("metrics", RESPONSES.stats),
+        "tools": offload.stats(),
     }
 
 @app.post("/api/index")
 async def do_index():
-    res = tools.index_workspace()
-    return JSONResponse(res)
+    # walk in a background thread; progress via /api/index/jobs/{id}/events
+    job, created = JOBS.submit(
+        "index", lambda job: tools.index_workspace(progress=job.update, cancel=job.cancelled)
+    )
+    if not created:
+        return JSONResponse({"ok": False, "error": "an index job is already running", "job": job.snapshot()}, 409)
+    return JSONResponse({"ok": True, "job": job.snapshot()}, 202)
+
+@app.get("/api/index/jobs")
+async def index_jobs():
+    return {"ok": True, "jobs": JOBS.list()}
+
+@app.get("/api/index/jobs/{job_id}")
+async def index_job(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"ok": False, "error": "unknown job"}, 404)
+    return {"ok": True, "job": job.snapshot()}
+
+@app.get("/api/index/jobs/{job_id}/events")
+async def index_job_events(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"ok": False, "error": "unknown job"}, 404)
+    # sync generator: Starlette iterates it in its threadpool, the event loop stays free
+    return StreamingResponse(sse_events(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/index/jobs/{job_id}/cancel")
+async def index_job_cancel(job_id: str):
+    return {"ok": JOBS.cancel(job_id)}
 
 @app.get("/api/search")
 async def do_search(q: str = ""):
-    return JSONResponse(tools.search_workspace(q))
+    return JSONResponse(await offload.run("search", tools.search_workspace, q))
+
+@app.get("/api/find")
+async def do_find(q: str = "", limit: int = 20):
+    """Fuzzy "go to file" over the indexed paths (type-ahead)."""
+    return JSONResponse(await offload.run("find", finder.find_files, q, max(1, min(limit, 200))))
+
+@app.get("/api/search/stream")
+async def do_search_stream(q: str = "", limit: int = 50):
+    """NDJSON: one hit per line as rg finds it, then {"done": true, "count": n}."""
+    limit = max(1, min(limit, 5000))
+
+    def lines():
+        n = 0
+        try:
+            for hit in tools.iter_search(q, limit):
+                n += 1
+                yield json.dumps(hit) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        yield json.dumps({"done": True, "count": n}) + "\n"
+
+    if not q.strip():
+        return JSONResponse({"ok": False, "error": "missing q"}, 400)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.get("/api/read")
-async def do_read(path: str = ""):
-    return JSONResponse(tools.read_file(path))
+async def do_read(path: str = "", offset: int = 0, length: int = 200_000,
+                  line: Optional[int] = None, lines: int = 200):
+    length = max(1, min(length, 4 << 20))
+    return JSONResponse(await offload.run(
+        "read", tools.read_file, path, length, max(0, offset), line, max(1, min(lines, 5000))))
+
+@app.get("/api/raw")
+async def do_raw(path: str, request: Request):
+    """File bytes with HTTP Range support (206 / 416); ranges are streamed in RANGE_CHUNK pieces."""
+    p = await offload.run("read", tools.resolve_file, path)
+    if p is None:
+        return JSONResponse({"ok": False, "error": "File not found"}, 404)
+    size = (await offload.run("read", p.stat)).st_size
+    try:
+        rng = fileread.parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if rng is None:
+        # whole file: streamed in chunks by FileResponse, never held in memory
+        return FileResponse(str(p), headers={"Accept-Ranges": "bytes"})
+    start, end = rng
+    # sync generator: Starlette reads it chunk by chunk in a worker thread
+    return StreamingResponse(
+        fileread.iter_range(str(p), start, end - start + 1),
+        status_code=206, media_type="application/octet-stream", headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+        })
 
 @app.post("/api/exec")
 async def do_exec(req: Request):
     data = await req.json()
     cmd = data.get("cmd", "")
-    return JSONResponse(tools.exec_cmd(cmd))
+    return JSONResponse(await offload.run("exec", tools.exec_cmd, cmd))
 
 @app.post("/api/write")
 async def do_write(req: Request):
     data = await req.json()
     path = data.get("path", "")
     content = data.get("content", "")
-    return JSONResponse(tools.write_file(path, content))
+    return JSONResponse(await offload.run("write", tools.write_file, path, content))
 
 @app.get("/api/metrics")
 async def do_metrics():
-    return JSONResponse(tools.metrics())
+    return JSONResponse(await offload.run("metrics", tools.metrics))
 
 @app.post("/api/chat")
 async def do_chat(req: Request):
@@ -76,9 +223,28 @@ async def do_chat(req: Request):
     msg = (data.get("message") or "").strip()
     if not msg:
         return JSONResponse({"ok": False, "error": "Empty message"})
-    res = generate_reply(msg)
+    # "cache": false asks for a fresh answer
+    res = await until_disconnect(req, agenerate_reply(msg, use_cache=data.get("cache", True)))
+    if res is None:
+        return Response(status_code=499)
     return JSONResponse(res)
 
+@app.post("/api/chat/stream")
+async def do_chat_stream(req: Request):
+    """NDJSON: {"provider"}, one {"token"} per piece as the model writes it, then {"done"} or {"error"}."""
+    data = await req.json()
+    msg = (data.get("message") or "").strip()
+    if not msg:
+        return JSONResponse({"ok": False, "error": "Empty message"})
+
+    def lines():
+        # sync generator: Starlette iterates it in a worker thread, not on the loop
+        for event in generate_reply_stream(msg, use_cache=data.get("cache", True)):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/api/save_keys")
 async def save_keys(req: Request):
     """
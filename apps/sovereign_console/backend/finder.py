@@ -0,0 +1,289 @@
+"""
+"Go to file": fzf-style fuzzy matching over the indexed paths.
+
+The files table is loaded once, sorted shortest first (newest first among equal
+lengths), and reloaded when the index generation changes; each load publishes
+one immutable snapshot, so a query never mixes old and new arrays. Queries are
+narrowed by presence masks - one bit per path for a character in the path, a
+character in the basename, or an adjacent pair of the query - built lazily by
+C-level maps and ANDed as big ints. Every path that survives is ranked by a
+cheap match tier: basename starts with the term, basename contains it,
+basename subsequence (`[^a]*a[^b]*b`, anchored, one greedy pass), path
+contains it, path subsequence. Tiers are filled best first, in snapshot order,
+by compress/map chains that run no Python bytecode per path, until MAX_SCORED
+are found. Those get a Python score: word-boundary / basename / consecutive
+bonuses + recency (match positions come from the same kind of regex, with
+groups). Basename-subsequence sets are cached per term, so type-ahead only
+rechecks the previous keystroke's hits.
+"""
+import math
+import operator
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from itertools import compress, islice, repeat, tee
+from typing import Dict, Iterable, List, NamedTuple
+
+import tools
+
+MAX_SCORED = 100          # best-tier candidates that get the full Python score
+MASK_CACHE = 512          # presence / subsequence masks kept per snapshot
+RECENCY_HALF_LIFE = 7 * 86400
+RECENCY_WEIGHT = 6.0
+_BOUNDARY = "/_-. "
+
+def _term_regex(term: str, groups: bool = False) -> str:
+    # greedy subsequence for re.match: [^a]*a[^b]*b (deterministic; [^x] runs are sre's fast path)
+    # with groups=True each matched char is captured, so its span is its position
+    out = ""
+    for ch in term:
+        esc = re.escape(ch)
+        out += f"[^{esc}]*({esc})" if groups else f"[^{esc}]*{esc}"
+    return out
+
+def _positions(rx, hay: str, start: int = 0):
+    m = rx.match(hay, start)
+    return None if m is None else [a for a, _ in m.regs[1:]]
+
+def _score_positions(path: str, pos: List[int], base_at: int) -> float:
+    # `path` in original case, so camelCase humps still count for lowercase queries
+    score, prev = 0.0, -2
+    for i in pos:
+        score += 1.0
+        if i == 0 or path[i - 1] in _BOUNDARY:
+            score += 6.0
+        elif path[i].isupper() and path[i - 1].islower():
+            score += 4.0
+        if i == prev + 1:
+            score += 4.0
+        elif prev >= 0:
+            score -= min(i - prev - 1, 20) * 0.15
+        prev = i
+    if pos and pos[0] >= base_at:
+        score += 8.0
+    return score
+
+def _score_term(hay: str, path: str, rx, base_at: int):
+    """Best of: greedy from the start, greedy inside the basename. None = no match."""
+    pos = _positions(rx, hay)
+    if pos is None:
+        return None
+    best = (_score_positions(path, pos, base_at), pos)
+    if pos[0] < base_at:
+        inner = _positions(rx, hay, base_at)
+        if inner is not None:
+            s = _score_positions(path, inner, base_at)
+            if s > best[0]:
+                best = (s, inner)
+    return best
+
+class _Snapshot(NamedTuple):
+    generation: object
+    paths: List[str]
+    paths_lower: List[str]
+    bases: List[str]
+    bases_lower: List[str]
+    mtimes: List[int]
+    masks: Dict      # (field, chars, case_sensitive) -> int, bit i set when path i's field has the chars
+
+EMPTY = _Snapshot(None, [], [], [], [], [], {})
+
+_TO_BITS = bytes.maketrans(b"\0\1", b"01")
+_FROM_BITS = bytes.maketrans(b"01", b"\0\1")
+
+def _pack(flags: bytes) -> int:
+    """0/1 byte per path -> int with bit i set for path i (parsed in C as a binary literal)."""
+    return int(flags[::-1].translate(_TO_BITS) or b"0", 2)
+
+def _select(mask: int, n: int) -> Iterable[int]:
+    """Indices whose bit is set in `mask`, in snapshot order (lazy when dense)."""
+    if mask <= 0:
+        return []
+    present = format(mask, "b").zfill(n).encode().translate(_FROM_BITS)[::-1]
+    if present.count(1) * 16 >= n:
+        return compress(range(n), present)
+    # sparse: walking the set bytes beats compress() over every path
+    idx, i = [], present.find(1)
+    while i >= 0:
+        idx.append(i)
+        i = present.find(1, i + 1)
+    return idx
+
+def _where(idx, field: List[str], test, *args, negate: bool = False):
+    """Lazily keep the indices i for which test(field[i], *args) holds (fails, with negate);
+    a compress/map chain, so no Python bytecode runs per path."""
+    idx, probe = tee(idx)
+    hits = map(test, map(field.__getitem__, probe), *map(repeat, args))
+    return compress(idx, map(operator.not_, hits) if negate else hits)
+
+class PathIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snap = EMPTY
+
+    # read-only views of the current snapshot
+    generation = property(lambda self: self._snap.generation)
+    paths = property(lambda self: self._snap.paths)
+    mtimes = property(lambda self: self._snap.mtimes)
+
+    def load(self, rows, generation=None):
+        """rows: (path, mtime) pairs; stored shortest first, newest first among equal lengths."""
+        rows = sorted(rows, key=lambda r: (len(r[0]), -(r[1] or 0)))
+        paths = [r[0] for r in rows]
+        bases = [p[p.rfind("/") + 1:] for p in paths]
+        snap = _Snapshot(generation, paths, [p.lower() for p in paths], bases, [b.lower() for b in bases],
+                         [r[1] or 0 for r in rows], {})
+        with self._lock:
+            self._snap = snap
+
+    def refresh(self):
+        if self.generation == tools.INDEX_GENERATION:
+            return
+        gen = tools.INDEX_GENERATION
+        db = tools.index_db_path()
+        rows = []
+        if db.exists():
+            con = sqlite3.connect(db)
+            try:
+                rows = con.execute("SELECT path, mtime FROM files").fetchall()
+            except sqlite3.Error:
+                rows = []
+            finally:
+                con.close()
+        self.load(rows, gen)
+
+    @staticmethod
+    def _remember(snap: _Snapshot, key, mask: int) -> int:
+        # cached for the snapshot's lifetime, oldest evicted first
+        if len(snap.masks) >= MASK_CACHE:
+            snap.masks.pop(next(iter(snap.masks)), None)
+        snap.masks[key] = mask
+        return mask
+
+    def _mask(self, snap: _Snapshot, field: str, chars: str, case_sensitive: bool) -> int:
+        m = snap.masks.get((field, chars, case_sensitive))
+        if m is None:
+            if field == "base":
+                hay = snap.bases if case_sensitive else snap.bases_lower
+            else:
+                hay = snap.paths if case_sensitive else snap.paths_lower
+            # built by a C-level map
+            m = self._remember(snap, (field, chars, case_sensitive),
+                               _pack(bytes(map(operator.contains, hay, repeat(chars)))))
+        return m
+
+    def _named(self, snap: _Snapshot, term: str, case_sensitive: bool) -> int:
+        """Paths whose basename holds `term` as a subsequence. Cached like the character masks and
+        narrowed from the longest cached prefix, so type-ahead only rechecks the previous hits."""
+        m = -1
+        for ch in set(term):
+            m &= self._mask(snap, "base", ch, case_sensitive)
+        if len(term) < 2 or not m:
+            return m
+        key = ("named", term, case_sensitive)
+        if key in snap.masks:
+            return snap.masks[key]
+        for k in range(len(term) - 1, 1, -1):
+            prev = snap.masks.get(("named", term[:k], case_sensitive))
+            if prev is not None:
+                m &= prev
+                break
+        n = len(snap.paths)
+        bases = snap.bases if case_sensitive else snap.bases_lower
+        flags = bytearray(n)
+        rx = re.compile(_term_regex(term))
+        deque(map(flags.__setitem__, _where(_select(m, n), bases, rx.match), repeat(1)), maxlen=0)
+        return self._remember(snap, key, _pack(flags))
+
+    def _tiers(self, snap: _Snapshot, lead: str, chars, case_sensitive: bool):
+        """Lazy index streams for paths matching `lead`, best cheap tier first: basename starts
+        with it, basename contains it, basename subsequence, path contains it, path subsequence.
+        Tiers are disjoint; each stream is in snapshot order (shortest, then newest, first)."""
+        n = len(snap.paths)
+        hay = snap.paths if case_sensitive else snap.paths_lower
+        bases = snap.bases if case_sensitive else snap.bases_lower
+        in_path = -1
+        for ch in chars:
+            in_path &= self._mask(snap, "path", ch, case_sensitive)
+            if not in_path:
+                return
+        # a contiguous hit needs every adjacent pair of the term somewhere in the path
+        adjacent = in_path
+        for pair in set(map(operator.add, lead, lead[1:])):
+            adjacent &= self._mask(snap, "path", pair, case_sensitive)
+        in_base = adjacent
+        for ch in set(lead):
+            in_base &= self._mask(snap, "base", ch, case_sensitive)
+        yield _where(_select(in_base, n), bases, str.startswith, lead)
+        yield _where(_where(_select(in_base, n), bases, operator.contains, lead), bases, str.startswith, lead,
+                     negate=True)
+        named = self._named(snap, lead, case_sensitive) & in_path
+        yield _where(_select(named, n), bases, operator.contains, lead, negate=True)
+        # the rest spans the directory part: whatever the basename alone cannot match
+        yield _where(_select(adjacent & ~named, n), hay, operator.contains, lead)
+        rx = re.compile(_term_regex(lead))
+        scattered = _where(_select(in_path & ~named, n), hay, operator.contains, lead, negate=True)
+        yield _where(scattered, hay, rx.match)
+
+    def _candidates(self, snap: _Snapshot, terms, case_sensitive: bool) -> List[int]:
+        """The MAX_SCORED best-tier indices whose path holds every term as a subsequence."""
+        hay = snap.paths if case_sensitive else snap.paths_lower
+        lead, *rest = sorted(terms, key=len, reverse=True)
+        rest = [re.compile(_term_regex(t)) for t in rest]
+        cands: List[int] = []
+        for tier in self._tiers(snap, lead, set("".join(terms)), case_sensitive):
+            for rx in rest:
+                tier = _where(tier, hay, rx.match)
+            cands.extend(islice(tier, MAX_SCORED - len(cands)))
+            if len(cands) >= MAX_SCORED:
+                break
+        return cands
+
+    def find(self, query: str, limit: int = 20) -> List[Dict]:
+        terms = query.split()
+        if not terms:
+            return []
+        with self._lock:
+            snap = self._snap
+        case_sensitive = query != query.lower()
+        spans = [re.compile(_term_regex(t, groups=True)) for t in terms]
+        now = time.time()
+        hits = []
+        for i in self._candidates(snap, terms, case_sensitive):
+            path = snap.paths[i]
+            hay = path if case_sensitive else snap.paths_lower[i]
+            if len(hay) != len(path):   # lower() changed the length (rare unicode)
+                hay = path
+            base_at = hay.rfind("/") + 1
+            total, positions = 0.0, []
+            for rx in spans:
+                best = _score_term(hay, path, rx, base_at)
+                if best is None:
+                    break
+                total += best[0]
+                positions.extend(best[1])
+            else:
+                age = max(0.0, now - snap.mtimes[i])
+                total += RECENCY_WEIGHT * math.pow(0.5, age / RECENCY_HALF_LIFE)
+                total -= len(path) * 0.02
+                hits.append((total, i, sorted(set(positions))))
+        hits.sort(key=lambda h: -h[0])
+        return [
+            {"path": snap.paths[i], "score": round(s, 2), "mtime": snap.mtimes[i], "positions": pos}
+            for s, i, pos in hits[:limit]
+        ]
+
+PATHS = PathIndex()
+
+def find_files(query: str, limit: int = 20) -> Dict:
+    t0 = time.perf_counter()
+    PATHS.refresh()
+    hits = PATHS.find(query, limit)
+    return {
+        "ok": True,
+        "results": hits,
+        "total_paths": len(PATHS.paths),
+        "ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
@@ -0,0 +1,73 @@
+"""
+Shared HTTP transport for provider calls: one requests.Session per process,
+so OpenAI / Gemini / DeepSeek / Ollama calls reuse keep-alive TCP + TLS
+connections instead of handshaking on every chat message.
+
+- HTTP_POOL_CONNECTIONS (10): per-host pools kept
+- HTTP_POOL_MAXSIZE (10): connections kept per host
+- HTTP_RETRIES (2) with full-jitter exponential backoff (HTTP_BACKOFF 0.25 s):
+  read errors and 502/503/504 only, and only for idempotent methods, so a
+  completion POST is never sent twice
+- connect failures are not retried: every attempt would get the full timeout
+  again, blowing the caller's AI_DEADLINE and delaying the fallback to the
+  next provider (the provider chain is the retry)
+requests/urllib3 speak HTTP/1.1 only; keep-alive pooling is the win here.
+"""
+import os
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+def _env_num(k: str, d: float) -> float:
+    try:
+        return float(os.getenv(k, "") or d)
+    except ValueError:
+        return d
+
+class JitterRetry(Retry):
+    def get_backoff_time(self) -> float:
+        # full jitter: concurrent retries don't hammer a recovering host in step
+        base = super().get_backoff_time()
+        return random.uniform(0, base) if base > 0 else 0.0
+
+_SESSION = None
+_LOCK = threading.Lock()
+
+def _build() -> requests.Session:
+    n = int(_env_num("HTTP_RETRIES", 2))
+    retry = JitterRetry(
+        total=n,
+        connect=0,
+        read=n,
+        status=n,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=_env_num("HTTP_BACKOFF", 0.25),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=int(_env_num("HTTP_POOL_CONNECTIONS", 10)),
+        pool_maxsize=int(_env_num("HTTP_POOL_MAXSIZE", 10)),
+        max_retries=retry,
+    )
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+def session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                _SESSION = _build()
+    return _SESSION
+
+def post(url, **kw) -> requests.Response:
+    return session().post(url, **kw)
+
+def get(url, **kw) -> requests.Response:
+    return session().get(url, **kw)
@@ -0,0 +1,51 @@
+"""
+Blocking workspace tools (rg, subprocess exec, file reads, SQLite, psutil)
+run in worker threads instead of on the event loop.
+
+Each kind of tool has its own anyio CapacityLimiter, so a burst of slow
+/api/exec calls queues behind its own limit instead of taking every worker
+thread from reads and search. Limits: TOOL_LIMIT_<KIND> env, e.g.
+TOOL_LIMIT_EXEC=2.
+"""
+import os
+from functools import partial
+
+from anyio import CapacityLimiter, to_thread
+
+DEFAULT_LIMITS = {
+    "search": 4,
+    "find": 4,
+    "read": 8,
+    "exec": 2,
+    "write": 2,
+    "metrics": 2,
+}
+
+_LIMITERS = {}
+
+def limit_for(kind: str) -> int:
+    try:
+        return max(1, int(os.getenv(f"TOOL_LIMIT_{kind.upper()}", "") or DEFAULT_LIMITS.get(kind, 4)))
+    except ValueError:
+        return DEFAULT_LIMITS.get(kind, 4)
+
+def limiter(kind: str) -> CapacityLimiter:
+    # created on first use: anyio wants a running event loop for this
+    lim = _LIMITERS.get(kind)
+    if lim is None:
+        lim = _LIMITERS[kind] = CapacityLimiter(limit_for(kind))
+    return lim
+
+async def run(kind: str, fn, *args, **kwargs):
+    """fn(*args, **kwargs) in a worker thread, at most TOOL_LIMIT_<KIND> at a time."""
+    return await to_thread.run_sync(partial(fn, *args, **kwargs), limiter=limiter(kind))
+
+def stats() -> dict:
+    return {
+        kind: {
+            "limit": int(lim.total_tokens),
+            "busy": int(lim.borrowed_tokens),
+            "waiting": lim.statistics().tasks_waiting,
+        }
+        for kind, lim in _LIMITERS.items()
+    }
@@ -1,5 +1,19 @@
 import os
-import requests
+import json
+import time
+import asyncio
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+import http_pool
+from provider_health import HEALTH
+import response_cache
+from response_cache import RESPONSES
+
+TEMPERATURE = 0.2
 
 def _env(k: str, d: str = "") -> str:
     return os.getenv(k, d)
@@ -10,22 +24,25 @@ def _ok(provider: str, reply: str) -> dict:
 def _fail(provider: str, error: str) -> dict:
     return {"ok": False, "provider": provider, "error": error}
 
+def _ollama_request(prompt: str, stream: bool):
+    base = _env("OLLAMA_BASE_URL", "http://127.0.0.1:11434").rstrip("/")
+    model = _env("OLLAMA_MODEL", "llama3.2:1b").strip() or "llama3.2:1b"
+
+    payload = {
+        "model": model,
+        "stream": stream,
+        "messages": [
+            {"role": "system", "content": "You are FlashTM8-like assistant tied to a local workspace. Be concise and practical."},
+            {"role": "user", "content": prompt},
+        ],
+        "options": {"temperature": TEMPERATURE},
+    }
+    return f"{base}/api/chat", payload
+
 def chat_ollama(prompt: str) -> dict:
     try:
-        base = _env("OLLAMA_BASE_URL", "http://127.0.0.1:11434").rstrip("/")
-        model = _env("OLLAMA_MODEL", "llama3.2:1b").strip() or "llama3.2:1b"
-
-        payload = {
-            "model": model,
-            "stream": False,
-            "messages": [
-                {"role": "system", "content": "You are FlashTM8-like assistant tied to a local workspace. Be concise and practical."},
-                {"role": "user", "content": prompt},
-            ],
-            "options": {"temperature": 0.2},
-        }
-
-        r = requests.post(f"{base}/api/chat", json=payload, timeout=60)
+        url, payload = _ollama_request(prompt, stream=False)
+        r = http_pool.post(url, json=payload, timeout=60)
         if r.status_code != 200:
             return _fail("ollama", f"HTTP {r.status_code}: {r.text[:400]}")
 
@@ -38,6 +55,63 @@ def chat_ollama(prompt: str) -> dict:
     except Exception as e:
         return _fail("ollama", str(e))
 
+_ACLIENT = None
+
+def _aclient():
+    """Pooled keep-alive AsyncClient, created lazily on the running event loop."""
+    global _ACLIENT
+    if _ACLIENT is None or _ACLIENT.is_closed:
+        size = int(_env("HTTP_POOL_MAXSIZE", "10") or 10)
+        _ACLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+        )
+    return _ACLIENT
+
+async def aclose():
+    global _ACLIENT
+    if _ACLIENT is not None:
+        await _ACLIENT.aclose()
+        _ACLIENT = None
+
+async def achat_ollama(prompt: str) -> dict:
+    """chat_ollama without blocking the event loop; cancelling the task closes the request."""
+    try:
+        url, payload = _ollama_request(prompt, stream=False)
+        r = await _aclient().post(url, json=payload)
+        if r.status_code != 200:
+            return _fail("ollama", f"HTTP {r.status_code}: {r.text[:400]}")
+
+        data = r.json()
+        text = (data.get("message") or {}).get("content", "").strip()
+        if not text:
+            return _fail("ollama", "Empty reply from Ollama")
+        return _ok("ollama", text)
+
+    except Exception as e:
+        return _fail("ollama", str(e))
+
+def stream_ollama(prompt: str):
+    """Yield reply text pieces as Ollama produces them (NDJSON chat stream)."""
+    url, payload = _ollama_request(prompt, stream=True)
+    r = http_pool.post(url, json=payload, timeout=60, stream=True)
+    try:
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.text[:400]}")
+        for line in r.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(data["error"])
+            text = (data.get("message") or {}).get("content")
+            if text:
+                yield text
+            if data.get("done"):
+                return
+    finally:
+        r.close()
+
 def fallback_reply(prompt: str) -> dict:
     return _ok(
         "fallback",
@@ -46,17 +120,131 @@ def fallback_reply(prompt: str) -> dict:
         "Try: Index Workspace → then Search or Read files."
     )
 
-def generate_reply(prompt: str) -> dict:
-    mode = _env("AI_PROVIDER", "auto").strip().lower()
+def probe_ollama():
+    """Reachability check for the health prober (model list, nothing generated)."""
+    base = _env("OLLAMA_BASE_URL", "http://127.0.0.1:11434").rstrip("/")
+    r = http_pool.get(f"{base}/api/tags", timeout=5)
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP {r.status_code}")
 
-    if mode == "ollama":
-        res = chat_ollama(prompt)
-        if res.get("ok"):
-            return res
-        return fallback_reply(prompt)
+def start_health_prober():
+    HEALTH.start_prober({"ollama": probe_ollama})
+
+def _cache_key(prompt: str) -> str:
+    return response_cache.make_key(
+        prompt,
+        mode=_env("AI_PROVIDER", "auto").strip().lower(),
+        model=_env("OLLAMA_MODEL", "llama3.2:1b").strip() or "llama3.2:1b",
+        temperature=TEMPERATURE,
+    )
 
-    # auto → ollama → fallback
-    res = chat_ollama(prompt)
+def generate_reply(prompt: str, use_cache: bool = True) -> dict:
+    # auto / ollama → ollama → fallback; a tripped breaker goes straight to fallback.
+    # Ollama answers are kept in the response cache (use_cache=False skips it).
+    key = _cache_key(prompt) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            res = _ok(hit["provider"], hit["reply"])
+            res.update(cached=True, age=hit["age"])
+            return res
+    res = HEALTH.call("ollama", chat_ollama, prompt)
     if res.get("ok"):
+        if key:
+            RESPONSES.put(key, res["provider"], res["reply"])
         return res
     return fallback_reply(prompt)
+
+async def agenerate_reply(prompt: str, use_cache: bool = True) -> dict:
+    """
+    generate_reply for async handlers: Ollama over httpx on the event loop,
+    cache lookups in a worker thread. Without httpx installed the sync path
+    runs in a thread instead.
+    """
+    if httpx is None:
+        return await asyncio.to_thread(generate_reply, prompt, use_cache)
+    key = _cache_key(prompt) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = await asyncio.to_thread(RESPONSES.get, key)
+        if hit:
+            res = _ok(hit["provider"], hit["reply"])
+            res.update(cached=True, age=hit["age"])
+            return res
+    br = HEALTH.get("ollama")
+    if br.allow():
+        t0 = time.monotonic()
+        try:
+            res = await achat_ollama(prompt)
+        except BaseException:
+            br.record(None)   # cancelled (client left): no verdict
+            raise
+        br.record(res.get("ok"), (time.monotonic() - t0) * 1000, res.get("error"))
+        if res.get("ok"):
+            if key:
+                await asyncio.to_thread(RESPONSES.put, key, res["provider"], res["reply"])
+            return res
+    return fallback_reply(prompt)
+
+def generate_reply_stream(prompt: str, use_cache: bool = True):
+    """
+    Streaming generate_reply: yields {"provider"}, then {"token"}..., then
+    {"done": True}. If Ollama fails before its first token (or its breaker is
+    open) the fallback answers instead; a failure mid-reply ends the stream
+    with {"error"}. Finished Ollama replies go to the response cache; a hit
+    comes back as a single token.
+    """
+    key = _cache_key(prompt) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            yield {"provider": hit["provider"]}
+            yield {"token": hit["reply"]}
+            yield {"done": True, "provider": hit["provider"], "cached": True}
+            return
+    parts = []
+    for event in _stream(prompt):
+        parts.append(event.get("token", ""))
+        if key and event.get("done") and event.get("provider") == "ollama":
+            RESPONSES.put(key, "ollama", "".join(parts).strip())
+        yield event
+
+def _stream(prompt: str):
+    """The uncached stream behind generate_reply_stream."""
+    br = HEALTH.get("ollama")
+    if not br.allow():
+        res = fallback_reply(prompt)
+        yield {"provider": res["provider"]}
+        yield {"token": res["reply"]}
+        yield {"done": True, "provider": res["provider"]}
+        return
+    t0 = time.monotonic()
+    verdict = None   # (ok, error) once known
+    it = stream_ollama(prompt)
+    try:
+        try:
+            first = next(it)
+        except Exception as e:
+            # StopIteration too: an empty reply falls back like chat_ollama's
+            verdict = (False, str(e) or "Empty reply from Ollama")
+            res = fallback_reply(prompt)
+            yield {"provider": res["provider"]}
+            yield {"token": res["reply"]}
+            yield {"done": True, "provider": res["provider"]}
+            return
+        yield {"provider": "ollama"}
+        yield {"token": first}
+        try:
+            for text in it:
+                yield {"token": text}
+        except Exception as e:
+            verdict = (False, str(e))
+            yield {"error": f"ollama: {e}"}
+            return
+        verdict = (True, None)
+        yield {"done": True, "provider": "ollama"}
+    finally:
+        it.close()
+        if verdict is None:
+            br.record(None)   # client left mid-reply
+        else:
+            br.record(verdict[0], (time.monotonic() - t0) * 1000, verdict[1])
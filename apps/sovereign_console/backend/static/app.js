@@ -48,12 +48,45 @@ document.getElementById("sendChat").addEventListener("click", async ()=>{
   input.value="";
   addMsg("user", "You: " + msg);
 
-  const res = await api("/api/chat","POST",{message:msg});
-  if(res.ok){
-    addMsg("ai", `FlashTM8 (${res.provider}): ${res.reply}`);
-    document.getElementById("providerUsed").textContent = res.provider;
-  }else{
-    addMsg("ai", `Error: ${res.error || "Unknown"}\n${res.raw || ""}`);
+  // NDJSON stream: the reply grows token by token
+  addMsg("ai", "FlashTM8: …");
+  const box = document.getElementById("chatbox");
+  const div = box.lastChild;
+  let r = null;
+  try{
+    r = await fetch("/api/chat/stream", {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({message:msg})});
+  }catch(e){ /* no response at all: nothing was generated yet, fall back below */ }
+  if(!r || !r.ok || !r.body){
+    const res = await api("/api/chat","POST",{message:msg});
+    div.textContent = res.ok ? `FlashTM8 (${res.provider}): ${res.reply}` : `Error: ${res.error || "Unknown"}\n${res.raw || ""}`;
+    return;
+  }
+  const reader = r.body.getReader();
+  const dec = new TextDecoder();
+  let buf = "", provider = "", text = "";
+  try{
+    for(;;){
+      const {value, done} = await reader.read();
+      if(done) break;
+      buf += dec.decode(value, {stream:true});
+      const lines = buf.split("\n");
+      buf = lines.pop();
+      for(const line of lines){
+        if(!line) continue;
+        const ev = JSON.parse(line);
+        if(ev.provider && !ev.done){
+          provider = ev.provider;
+          document.getElementById("providerUsed").textContent = provider;
+        }
+        if(ev.token) text += ev.token;
+        if(ev.error) text += (text ? "\n" : "") + "Error: " + ev.error;
+        div.textContent = `FlashTM8 (${provider || "…"}): ${text}`;
+        box.scrollTop = box.scrollHeight;
+      }
+    }
+  }catch(e){
+    // the stream broke mid-reply: show what arrived, never re-ask the provider
+    div.textContent = `FlashTM8 (${provider || "…"}): ${text}${text ? "\n" : ""}Error: stream interrupted (${e.message})`;
   }
 });
 
@@ -64,6 +97,23 @@ document.getElementById("runCmd").addEventListener("click", async ()=>{
   document.getElementById("cmdOut").textContent = JSON.stringify(res,null,2);
 });
 
+// go-to-file type-ahead: fuzzy matches from the path index on every keystroke
+let findSeq = 0;
+document.getElementById("filePath").addEventListener("input", async (e)=>{
+  const q = e.target.value.trim();
+  const seq = ++findSeq;
+  if(!q) return;
+  const res = await api("/api/find?q="+encodeURIComponent(q)+"&limit=15");
+  if(seq !== findSeq || !res.ok) return;  // a newer keystroke already answered
+  const list = document.getElementById("fileHits");
+  list.innerHTML = "";
+  for(const h of res.results){
+    const o = document.createElement("option");
+    o.value = h.path;
+    list.appendChild(o);
+  }
+});
+
 document.getElementById("readFile").addEventListener("click", async ()=>{
   const p = document.getElementById("filePath").value.trim();
   if(!p) return;
@@ -73,13 +123,43 @@ document.getElementById("readFile").addEventListener("click", async ()=>{
 
 document.getElementById("doSearch").addEventListener("click", async ()=>{
   const q = document.getElementById("searchQ").value.trim();
-  const res = await api("/api/search?q="+encodeURIComponent(q));
-  document.getElementById("searchOut").textContent = res.ok ? (res.results||[]).join("\n") : JSON.stringify(res,null,2);
+  const out = document.getElementById("searchOut");
+  out.textContent = "";
+  if(!q) return;
+  // NDJSON stream: hits render as rg finds them
+  const r = await fetch("/api/search/stream?q="+encodeURIComponent(q));
+  const reader = r.body.getReader();
+  const dec = new TextDecoder();
+  let buf = "";
+  for(;;){
+    const {value, done} = await reader.read();
+    if(done) break;
+    buf += dec.decode(value, {stream:true});
+    const lines = buf.split("\n");
+    buf = lines.pop();
+    for(const line of lines){
+      if(!line) continue;
+      const h = JSON.parse(line);
+      if(h.path) out.textContent += `${h.path}:${h.line}:${h.column}: ${h.text}\n`;
+      else if(h.error) out.textContent += "Error: " + h.error + "\n";
+    }
+  }
 });
 
 document.getElementById("btnIndex").addEventListener("click", async ()=>{
   const res = await api("/api/index","POST",{});
-  addMsg("ai", "Index result: " + JSON.stringify(res));
+  if(!res.job){
+    addMsg("ai", "Index result: " + JSON.stringify(res));
+    return;
+  }
+  // background job: show the final counts once it ends
+  const es = new EventSource(`/api/index/jobs/${res.job.id}/events`);
+  es.addEventListener("end", e=>{
+    es.close();
+    const job = JSON.parse(e.data);
+    addMsg("ai", "Index result: " + JSON.stringify(job.result || {status: job.status, error: job.error}));
+  });
+  es.onerror = ()=> es.close();
 });
 
 document.getElementById("refreshMetrics").addEventListener("click", async ()=>{
@@ -1,9 +1,25 @@
 import os
+import base64
+import json
 import subprocess
+import threading
 import time
 import sqlite3
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+import content_cache
+import fileread
+from walker import walk_files
+
+INDEX_EXCLUDES = {".git", "node_modules", ".venv", "__pycache__"}
+
+# bumped after every write to the files table; in-memory views (finder) reload on change
+INDEX_GENERATION = 0
+
+def _bump_generation():
+    global INDEX_GENERATION
+    INDEX_GENERATION += 1
 
 def root() -> Path:
     return Path(os.getenv("WORKSPACE_ROOT", ".")).resolve()
@@ -22,6 +38,7 @@ def ensure_db():
     db.parent.mkdir(parents=True, exist_ok=True)
     con = sqlite3.connect(db)
     cur = con.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS files(
         path TEXT PRIMARY KEY,
@@ -31,56 +48,212 @@ def ensure_db():
     con.commit()
     con.close()
 
-def index_workspace(max_files: int = 5000) -> Dict:
+def index_limit() -> int:
+    # path rows are ~100 bytes: "go to file" needs the whole tree, not a sample of it
+    try:
+        return max(1, int(os.getenv("INDEX_MAX_FILES", "") or 200_000))
+    except ValueError:
+        return 200_000
+
+def index_workspace(max_files: Optional[int] = None, progress=None, cancel=None) -> Dict:
+    """
+    progress(files=, bytes=) is reported every 500 files; cancel() -> True stops
+    the walk and keeps what was collected so far. A complete walk (not
+    cancelled, under max_files - INDEX_MAX_FILES, 200000) also drops rows of
+    files that no longer exist.
+    """
+    max_files = max_files or index_limit()
     ensure_db()
     base = root()
-    files = []
-    for p in base.rglob("*"):
-        if p.is_file():
-            # skip venv/node_modules big dirs
-            sp = str(p)
-            if "/.git/" in sp or "/node_modules/" in sp or "/.venv/" in sp or "/__pycache__/" in sp:
-                continue
-            files.append(p)
-            if len(files) >= max_files:
+    rows = []
+    size = 0
+    cancelled = capped = False
+    # venv/node_modules big dirs are pruned by the walker, not descended
+    for rel, entry in walk_files(str(base), INDEX_EXCLUDES):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        rows.append((rel, int(st.st_size), int(st.st_mtime)))
+        size += st.st_size
+        if len(rows) >= max_files:
+            capped = True
+            break
+        if len(rows) % 500 == 0:
+            if progress:
+                progress(files=len(rows), bytes=size, total=max_files)
+            if cancel and cancel():
+                cancelled = True
                 break
 
     con = sqlite3.connect(index_db_path())
     cur = con.cursor()
-    n = 0
-    for f in files:
-        st = f.stat()
-        cur.execute(
-            "INSERT OR REPLACE INTO files(path,size,mtime) VALUES(?,?,?)",
-            (safe_rel(f), int(st.st_size), int(st.st_mtime)),
-        )
-        n += 1
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.executemany("INSERT OR REPLACE INTO files(path,size,mtime) VALUES(?,?,?)", rows)
+    removed = 0
+    if not cancelled and not capped:
+        # everything on disk was seen: rows for anything else are deleted files
+        cur.execute("CREATE TEMP TABLE seen(path TEXT PRIMARY KEY)")
+        cur.executemany("INSERT INTO seen(path) VALUES(?)", ((r[0],) for r in rows))
+        removed = cur.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM seen)").rowcount
     con.commit()
     con.close()
-    return {"ok": True, "count": n}
+    _bump_generation()
+    if progress:
+        progress(files=len(rows), bytes=size, total=max_files)
+    return {"ok": True, "count": len(rows), "removed": removed, "cancelled": cancelled, "capped": capped}
+
+def index_paths(rel_paths: List[str], max_files: Optional[int] = None) -> Dict:
+    """
+    Refresh only these workspace-relative paths (watcher batches); vanished ones
+    are dropped. Paths below another given directory are covered by its walk;
+    at most max_files rows are written, like index_workspace().
+    """
+    max_files = max_files or index_limit()
+    ensure_db()
+    base = root()
+    rels = sorted({os.path.normpath(r).strip(os.sep) for r in rel_paths if r} - {"", "."})
+    rels = [r for r in rels if not r.startswith("..")]
+    # cached bodies of touched files go now rather than aging out of the LRU
+    content_cache.invalidate_paths(str(base), rels)
+    scopes: List[str] = []
+    for rel in rels:
+        if not any(rel.startswith(s + os.sep) for s in scopes):
+            scopes.append(rel)
+    rows, gone = [], []
+    for rel in scopes:
+        if len(rows) >= max_files:
+            break
+        p = base / rel
+        if p.is_dir():
+            for sub, entry in walk_files(str(p), INDEX_EXCLUDES):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                rows.append((f"{rel}/{sub}", int(st.st_size), int(st.st_mtime)))
+                if len(rows) >= max_files:
+                    break
+        elif p.is_file():
+            st = p.stat()
+            rows.append((rel, int(st.st_size), int(st.st_mtime)))
+        else:
+            gone.append(rel)
+
+    con = sqlite3.connect(index_db_path())
+    cur = con.cursor()
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.executemany("INSERT OR REPLACE INTO files(path,size,mtime) VALUES(?,?,?)", rows)
+    # a vanished path may have been a directory: drop everything below it too
+    cur.executemany(
+        "DELETE FROM files WHERE path = ? OR (path > ? AND path < ?)",
+        [(rel, rel + "/", rel + "0") for rel in gone],
+    )
+    con.commit()
+    con.close()
+    _bump_generation()
+    return {"ok": True, "count": len(rows), "removed": len(gone)}
+
+def _rg_text(field: Dict) -> str:
+    # rg --json sends {"text": ...}, or {"bytes": base64} for non-UTF-8 data
+    if "text" in field:
+        return field["text"]
+    return base64.b64decode(field.get("bytes", "")).decode("utf-8", "replace")
+
+def iter_search(query: str, limit: int = 50, timeout: float = 15):
+    """
+    Stream matches from `rg --json` as they are found:
+    {path, line, column, text, spans: [[start, end], ...]} (1-based line/column,
+    0-based character spans within `text`). rg is killed as soon as `limit`
+    lines were yielded, on timeout, or when the consumer stops iterating.
+    """
+    cmd = ["rg", "--json", "--smart-case", "--max-columns", "1000", "-e", query, "--", str(root())]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    sent = 0
+    try:
+        for raw in proc.stdout:
+            msg = json.loads(raw)
+            if msg.get("type") != "match":
+                continue
+            data = msg["data"]
+            text = _rg_text(data["lines"])
+            raw_line = text.encode("utf-8")
+            # submatch offsets are byte offsets into the line
+            spans = [
+                [len(raw_line[:m["start"]].decode("utf-8", "ignore")),
+                 len(raw_line[:m["end"]].decode("utf-8", "ignore"))]
+                for m in data.get("submatches", [])
+            ]
+            yield {
+                "path": safe_rel(Path(_rg_text(data["path"]))),
+                "line": data.get("line_number"),
+                "column": spans[0][0] + 1 if spans else 1,
+                "text": text.rstrip("\r\n"),
+                "spans": spans,
+            }
+            sent += 1
+            if sent >= limit:
+                break
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
 
 def search_workspace(query: str, limit: int = 50) -> Dict:
     if not query.strip():
         return {"ok": True, "results": []}
-
-    base = root()
-    cmd = ["rg", "-n", "--no-heading", "--smart-case", query, str(base)]
     try:
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, timeout=15).decode("utf-8", "ignore")
-    except subprocess.CalledProcessError as e:
-        out = e.output.decode("utf-8", "ignore")
+        hits = list(iter_search(query, limit))
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    # `results` keeps the old rg -n line format for existing clients
+    return {
+        "ok": True,
+        "hits": hits,
+        "results": [f"{h['path']}:{h['line']}:{h['text']}" for h in hits],
+        "truncated": len(hits) >= limit,
+    }
 
-    lines = out.splitlines()[:limit]
-    return {"ok": True, "results": lines}
+def resolve_file(rel_path: str):
+    """Absolute path of an existing file inside the workspace, else None."""
+    base = root()
+    p = (base / rel_path).resolve()
+    if p != base and base not in p.parents:
+        return None
+    return p if p.is_file() else None
 
-def read_file(rel_path: str, max_bytes: int = 200_000) -> Dict:
-    p = root() / rel_path
-    if not p.exists() or not p.is_file():
+def read_file(rel_path: str, max_bytes: int = 200_000, offset: int = 0,
+              line: Optional[int] = None, lines: int = 200) -> Dict:
+    """
+    A window of a file, never the whole thing:
+    - bytes [offset, offset+max_bytes) by default (next_offset to continue)
+    - with `line`: `lines` lines from that 1-based line (next_line to continue)
+    """
+    p = resolve_file(rel_path)
+    if p is None:
         return {"ok": False, "error": "File not found"}
-    data = p.read_bytes()[:max_bytes]
-    return {"ok": True, "path": rel_path, "content": data.decode("utf-8", "ignore")}
+    try:
+        if line is not None:
+            text, total = fileread.read_lines(str(p), line, lines, max_bytes)
+            got = text.count("\n") + (0 if text.endswith("\n") or not text else 1)
+            end = line + got - 1
+            return {
+                "ok": True, "path": rel_path, "content": text,
+                "start_line": line, "end_line": end, "total_lines": total,
+                "next_line": end + 1 if end < total else None,
+            }
+        data, size = fileread.read_range(str(p), offset, max_bytes)
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    end = offset + len(data)
+    return {
+        "ok": True, "path": rel_path, "content": data.decode("utf-8", "ignore"),
+        "offset": offset, "size": size, "next_offset": end if end < size else None,
+    }
 
 def exec_cmd(cmd: str, timeout: int = 20) -> Dict:
     if os.getenv("EXEC_ENABLED", "false").lower() != "true":
@@ -111,6 +284,30 @@ def write_file(rel_path: str, content: str) -> Dict:
     p.write_text(content, encoding="utf-8", errors="ignore")
     return {"ok": True, "path": rel_path}
 
+_CPU = {"at": 0.0, "pct": 0.0}
+_CPU_LOCK = threading.Lock()
+CPU_MIN_WINDOW = 0.5   # seconds; shorter measuring windows are mostly noise
+
+def cpu_percent(psutil) -> float:
+    """
+    Non-blocking CPU %: psutil measures since its previous call, so no sleep
+    here. Calls closer than CPU_MIN_WINDOW reuse the last value.
+    """
+    with _CPU_LOCK:
+        now = time.monotonic()
+        if now - _CPU["at"] >= CPU_MIN_WINDOW:
+            _CPU["pct"] = psutil.cpu_percent(interval=None)
+            _CPU["at"] = now
+        return _CPU["pct"]
+
+def prime_cpu():
+    """Start the CPU measuring window (the first cpu_percent(None) is always 0.0)."""
+    try:
+        import psutil
+        cpu_percent(psutil)
+    except Exception:
+        pass
+
 def metrics() -> Dict:
     try:
         import psutil
@@ -118,7 +315,7 @@ def metrics() -> Dict:
         vm = psutil.virtual_memory()
         return {
             "ok": True,
-            "cpu_percent": psutil.cpu_percent(interval=0.3),
+            "cpu_percent": cpu_percent(psutil),
             "mem_percent": vm.percent,
             "disk_percent": du.percent,
             "disk_free_gb": round(du.free / (1024**3), 2),
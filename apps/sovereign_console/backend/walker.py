@@ -0,0 +1,42 @@
+"""
+Pruning workspace walker built on os.scandir.
+
+- excluded directories are dropped before descending (never listed)
+- DirEntry.stat() results are cached by the entry and reused by callers
+- entries are yielded lazily, so callers can stop early
+"""
+import os
+from typing import Iterable, Iterator, Optional, Tuple
+
+def walk_files(root: str, exclude: Iterable[str] = (), exts: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Yield (rel_path, DirEntry) for every regular file under root.
+    exclude: directory names that are pruned wherever they appear.
+    exts: lowercase suffixes (".py") to keep; None keeps everything.
+    Symlinked directories are not followed (avoids loops).
+    """
+    exclude = frozenset(exclude)
+    exts = frozenset(exts) if exts is not None else None
+    root = os.path.abspath(root)
+    cut = len(root.rstrip(os.sep)) + 1
+
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in exclude:
+                            stack.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if exts is not None and os.path.splitext(entry.name)[1].lower() not in exts:
+                    continue
+                yield entry.path[cut:], entry
@@ -0,0 +1,191 @@
+"""
+Optional background workspace watcher.
+
+- inotify (via watchdog, if installed) or a polling fallback for Termux
+- events are debounced and handed over in batches of workspace-relative paths,
+  so the indexer only re-reads what was touched
+- excluded dirs / ignored prefixes / non-indexed suffixes never reach the callback
+
+Env (read by from_env):
+  WATCH_ENABLED=1            turn it on (off by default)
+  WATCH_MODE=auto|inotify|poll
+  WATCH_DEBOUNCE=1.5         seconds of quiet before a batch is flushed
+  WATCH_INTERVAL=5           polling period (poll mode only)
+"""
+import os
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from walker import walk_files
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional dependency
+    FileSystemEventHandler = object
+    Observer = None
+
+def _env_float(k: str, d: float) -> float:
+    try:
+        return float(os.getenv(k, "") or d)
+    except ValueError:
+        return d
+
+def watch_enabled() -> bool:
+    return os.getenv("WATCH_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        for p in (getattr(event, "src_path", ""), getattr(event, "dest_path", "")):
+            if p:
+                self.watcher.notify(p, is_dir=event.is_directory)
+
+class WorkspaceWatcher:
+    """
+    Calls on_change(sorted_rel_paths) from a background thread once no new
+    event arrived for `debounce` seconds (at most `debounce * 5` after the first).
+    """
+
+    def __init__(self, root: str, on_change: Callable, exclude: Iterable[str] = (),
+                 exts: Optional[Iterable[str]] = None, ignore: Iterable[str] = (),
+                 mode: str = "auto", debounce: float = 1.5, interval: float = 5.0):
+        self.root = os.path.abspath(root)
+        self.on_change = on_change
+        self.exclude = frozenset(exclude)
+        self.exts = frozenset(exts) if exts is not None else None
+        self.ignore = tuple(i for i in ignore if i)
+        self.mode = mode if mode in ("inotify", "poll") else ("inotify" if Observer else "poll")
+        if self.mode == "inotify" and Observer is None:
+            self.mode = "poll"
+        self.debounce = debounce
+        self.interval = interval
+
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+        self.stats = {"events": 0, "batches": 0, "last_batch": None, "last_error": None}
+
+    @classmethod
+    def from_env(cls, root: str, on_change: Callable, **kw):
+        return cls(
+            root, on_change,
+            mode=os.getenv("WATCH_MODE", "auto").strip().lower(),
+            debounce=_env_float("WATCH_DEBOUNCE", 1.5),
+            interval=_env_float("WATCH_INTERVAL", 5.0),
+            **kw,
+        )
+
+    # ---- event intake ----
+    def _relevant(self, rel: str, is_dir: bool) -> bool:
+        if rel in ("", ".") or rel.startswith(".."):
+            return False
+        if any(rel.startswith(i) for i in self.ignore):
+            return False
+        parts = rel.split(os.sep)
+        if any(part in self.exclude for part in (parts if is_dir else parts[:-1])):
+            return False
+        if not is_dir and self.exts is not None:
+            return os.path.splitext(rel)[1].lower() in self.exts
+        return True
+
+    def notify(self, abs_path: str, is_dir: bool = False):
+        rel = os.path.relpath(abs_path, self.root)
+        if not self._relevant(rel, is_dir):
+            return
+        with self._lock:
+            self._pending.add(rel)
+            self.stats["events"] += 1
+        self._wake.set()
+
+    # ---- debounce / flush ----
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            if self._stop.is_set():
+                return
+            first = time.monotonic()
+            # wait for a quiet period, bounded so a busy tree still gets indexed
+            while True:
+                self._wake.clear()
+                if self._stop.wait(self.debounce):
+                    return
+                if not self._wake.is_set() or time.monotonic() - first > self.debounce * 5:
+                    break
+            with self._lock:
+                batch, self._pending = self._pending, set()
+            if not batch:
+                continue
+            try:
+                self.on_change(sorted(batch))
+                self.stats["last_error"] = None
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+            self.stats["batches"] += 1
+            self.stats["last_batch"] = len(batch)
+
+    # ---- polling fallback ----
+    def _snapshot(self):
+        snap = {}
+        for rel, entry in walk_files(self.root, self.exclude, self.exts):
+            if any(rel.startswith(i) for i in self.ignore):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snap[rel] = (st.st_mtime_ns, st.st_size)
+        return snap
+
+    def _poll_loop(self):
+        prev = self._snapshot()
+        while not self._stop.wait(self.interval):
+            cur = self._snapshot()
+            changed = {k for k, v in cur.items() if prev.get(k) != v} | (prev.keys() - cur.keys())
+            prev = cur
+            if changed:
+                with self._lock:
+                    self._pending |= changed
+                    self.stats["events"] += len(changed)
+                self._wake.set()
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._threads:
+            return self
+        t = threading.Thread(target=self._flush_loop, name="watch-flush", daemon=True)
+        t.start()
+        self._threads.append(t)
+        if self.mode == "inotify":
+            self._observer = Observer()
+            self._observer.schedule(_Handler(self), self.root, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            t = threading.Thread(target=self._poll_loop, name="watch-poll", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def status(self) -> dict:
+        return {
+            "running": bool(self._threads) and not self._stop.is_set(),
+            "mode": self.mode,
+            "pending": len(self._pending),
+            **self.stats,
+        }
@@ -14,10 +14,14 @@ This file is intentionally "boring": correctness + portability > complexity.
 from __future__ import annotations
 
 import json
+import math
 import os
+import random
 import sqlite3
+import threading
 import time
 import traceback
+from array import array
 from dataclasses import dataclass
 from hashlib import sha256
 from pathlib import Path
@@ -29,6 +33,8 @@ except ImportError:
     psutil = None
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request, send_from_directory, Blueprint, render_template
@@ -118,6 +124,20 @@ def db_connect() -> sqlite3.Connection:
     return conn
 
 
+# metric rollups: one row per (tier, metric, bucket); tier = bucket width in seconds
+METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_rollup (
+  tier INTEGER NOT NULL,
+  metric TEXT NOT NULL,
+  bucket INTEGER NOT NULL,
+  n INTEGER NOT NULL,
+  min REAL NOT NULL,
+  max REAL NOT NULL,
+  sum REAL NOT NULL,
+  PRIMARY KEY (tier, metric, bucket)
+) WITHOUT ROWID;
+"""
+
 ADMIN_USER = os.getenv("ADMIN_USER", "admin").strip() or "admin"
 ADMIN_PASS = os.getenv("ADMIN_PASS", "admin").strip() or "admin"
 
@@ -171,6 +191,7 @@ def db_init() -> None:
               status TEXT NOT NULL DEFAULT 'pending'
             );
             """
+            + METRICS_SCHEMA
         )
         conn.commit()
 
@@ -264,9 +285,41 @@ def cache_set(key: str, data: Any) -> None:
     CACHE[key] = CacheEntry(ts=time.time(), data=data)
 
 
+class _JitterRetry(Retry):
+    def get_backoff_time(self) -> float:
+        base = super().get_backoff_time()
+        return random.uniform(0, base) if base > 0 else 0.0
+
+
+_HTTP: Optional[requests.Session] = None
+_HTTP_LOCK = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    """
+    One keep-alive session for outbound calls (per-host connection pools).
+    GETs retry connect/read errors and 502/503/504 with jittered backoff.
+    Env: HTTP_POOL_MAXSIZE (10), HTTP_RETRIES (2).
+    """
+    global _HTTP
+    if _HTTP is None:
+        with _HTTP_LOCK:
+            if _HTTP is None:
+                n = int(os.getenv("HTTP_RETRIES", "2") or 2)
+                retry = _JitterRetry(total=n, connect=n, read=n, status=n, backoff_factor=0.25,
+                                     status_forcelist=(502, 503, 504), raise_on_status=False)
+                size = int(os.getenv("HTTP_POOL_MAXSIZE", "10") or 10)
+                adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=retry)
+                s = requests.Session()
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _HTTP = s
+    return _HTTP
+
+
 def fetch_json(url: str, timeout: float = 10.0) -> Any:
     try:
-        r = requests.get(
+        r = http_session().get(
             url,
             timeout=timeout,
             headers={"User-Agent": f"{APP_NAME}/{APP_VERSION}"},
@@ -353,6 +406,386 @@ def system_status():
     return st
 
 
+class MetricsSampler:
+    """
+    One background thread calls system_status() every METRICS_INTERVAL seconds
+    (default 2) and keeps the last METRICS_HISTORY samples (default 1800, one
+    hour) in fixed-size array('d') rings, NaN where a value was unavailable.
+
+    Requests and sockets read latest() / history() instead of calling psutil
+    themselves, so another viewer costs nothing extra. cpu_percent(interval=0.0)
+    now always covers exactly one sampling interval.
+    """
+
+    FIELDS = ("cpu_percent", "mem_percent", "disk_percent", "proc_count", "net_sent_rate", "net_recv_rate")
+
+    def __init__(self, interval: float = 2.0, capacity: int = 1800):
+        self.interval = max(0.2, interval)
+        self.capacity = max(2, capacity)
+        self.ts = array("d", [math.nan]) * self.capacity
+        self.rings = {f: array("d", [math.nan]) * self.capacity for f in self.FIELDS}
+        self.count = 0          # samples ever taken; next slot = count % capacity
+        self._latest: Optional[Dict[str, Any]] = None
+        self._prev_net: Optional[Tuple[float, int, int]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._listeners: list = []
+
+    @classmethod
+    def from_env(cls) -> "MetricsSampler":
+        try:
+            interval = float(os.getenv("METRICS_INTERVAL", "2") or 2)
+            capacity = int(os.getenv("METRICS_HISTORY", "1800") or 1800)
+        except ValueError:
+            interval, capacity = 2.0, 1800
+        return cls(interval, capacity)
+
+    def start(self) -> "MetricsSampler":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def subscribe(self, fn) -> None:
+        """fn(ts, values, status) after every sample, on the sampler thread."""
+        self._listeners.append(fn)
+
+    def _run(self) -> None:
+        if psutil:
+            try:
+                psutil.cpu_percent(interval=None)  # open the first measuring window
+            except Exception:
+                pass
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception:
+                log_line("WARN", "metrics sample failed:\n" + traceback.format_exc())
+            # fixed cadence: don't drift by the time the sample itself took
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at, delay = time.monotonic(), 0
+            self._stop.wait(delay)
+
+    def sample(self) -> Dict[str, Any]:
+        st = system_status()
+        now = time.time()
+        sent, recv = st["net"].get("bytes_sent"), st["net"].get("bytes_recv")
+        rates = (None, None)
+        if sent is not None and self._prev_net is not None:
+            dt = now - self._prev_net[0]
+            if dt > 0:
+                rates = (max(0, sent - self._prev_net[1]) / dt, max(0, recv - self._prev_net[2]) / dt)
+        if sent is not None:
+            self._prev_net = (now, sent, recv)
+        st["net"]["sent_rate"], st["net"]["recv_rate"] = (round(r) if r is not None else None for r in rates)
+        values = {
+            "cpu_percent": st["cpu_percent"],
+            "mem_percent": st["mem_percent"],
+            "disk_percent": st["disk_percent"],
+            "proc_count": st["proc_count"],
+            "net_sent_rate": rates[0],
+            "net_recv_rate": rates[1],
+        }
+        with self._lock:
+            i = self.count % self.capacity
+            self.ts[i] = now
+            for f in self.FIELDS:
+                v = values[f]
+                self.rings[f][i] = math.nan if v is None else float(v)
+            self.count += 1
+            self._latest = st
+        for fn in list(self._listeners):
+            try:
+                fn(now, values, st)
+            except Exception:
+                log_line("WARN", "metrics listener failed:\n" + traceback.format_exc())
+        return st
+
+    def latest(self) -> Dict[str, Any]:
+        """Last sample (taken on the spot if the sampler hasn't produced one yet)."""
+        with self._lock:
+            st = self._latest
+        return st if st is not None else self.sample()
+
+    def history(self, seconds: Optional[float] = None, points: int = 300) -> Dict[str, Any]:
+        """
+        Oldest-first series over the last `seconds` (all kept samples when None),
+        thinned to at most `points` by taking every n-th sample.
+        """
+        with self._lock:
+            n = min(self.count, self.capacity)
+            start = (self.count - n) % self.capacity
+            order = [(start + k) % self.capacity for k in range(n)]
+            if seconds is not None and n:
+                cutoff = time.time() - seconds
+                order = [i for i in order if self.ts[i] >= cutoff]
+            step = max(1, math.ceil(len(order) / max(1, points)))
+            order = order[::-1][::step][::-1]   # keep the newest sample in
+            out: Dict[str, Any] = {"interval": self.interval, "t": [round(self.ts[i], 3) for i in order]}
+            for f in self.FIELDS:
+                ring = self.rings[f]
+                out[f] = [None if math.isnan(ring[i]) else round(ring[i], 2) for i in order]
+        return out
+
+
+SAMPLER = MetricsSampler.from_env()
+
+
+class MetricsStore:
+    """
+    Downsampled metric history in dashboard.db (metrics_rollup).
+
+    Every sample is folded into three tiers at once - 1 s buckets kept 1 hour,
+    1 min kept 7 days, 1 h kept 1 year - as (n, min, max, sum) rows, so a
+    range query reads pre-aggregated buckets and never scans raw samples.
+    Samples are buffered and upserted every METRICS_FLUSH seconds (30) in one
+    transaction (flash-friendly on phones); compaction drops rows past each
+    tier's retention every 10 minutes, which keeps the table bounded
+    (a few MB). METRICS_STORE=0 disables it.
+    """
+
+    TIERS = ((1, 3600), (60, 7 * 86400), (3600, 365 * 86400))   # (bucket s, retention s)
+    COMPACT_EVERY = 600.0
+
+    def __init__(self, flush_every: float = 30.0):
+        self.flush_every = flush_every
+        self._pending: Dict[Tuple[int, str, int], list] = {}   # -> [n, min, max, sum]
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_compact: Optional[float] = None   # None: compact on the first sample (catch up after downtime)
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = db_connect()
+        if not self._ready:
+            conn.executescript(METRICS_SCHEMA)
+            self._ready = True
+        return conn
+
+    def add(self, ts: float, values: Dict[str, Optional[float]], status: Any = None) -> None:
+        with self._lock:
+            for metric, v in values.items():
+                if v is None:
+                    continue
+                for width, _ in self.TIERS:
+                    key = (width, metric, int(ts // width) * width)
+                    agg = self._pending.get(key)
+                    if agg is None:
+                        self._pending[key] = [1, v, v, v]
+                    else:
+                        agg[0] += 1
+                        agg[1] = min(agg[1], v)
+                        agg[2] = max(agg[2], v)
+                        agg[3] += v
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_every:
+            self.flush()
+        if self._last_compact is None or now - self._last_compact >= self.COMPACT_EVERY:
+            self.compact()
+
+    def flush(self) -> None:
+        with self._lock:
+            rows = [(t, m, b, a[0], a[1], a[2], a[3]) for (t, m, b), a in self._pending.items()]
+            self._pending = {}
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO metrics_rollup(tier, metric, bucket, n, min, max, sum) VALUES(?,?,?,?,?,?,?) "
+                "ON CONFLICT(tier, metric, bucket) DO UPDATE SET "
+                "n = n + excluded.n, min = MIN(min, excluded.min), "
+                "max = MAX(max, excluded.max), sum = sum + excluded.sum",
+                rows,
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def compact(self) -> int:
+        self._last_compact = time.monotonic()
+        now = time.time()
+        conn = self._connect()
+        try:
+            dropped = 0
+            for width, keep in self.TIERS:
+                cur = conn.execute("DELETE FROM metrics_rollup WHERE tier = ? AND bucket < ?", (width, int(now - keep)))
+                dropped += cur.rowcount
+            conn.commit()
+            return dropped
+        finally:
+            conn.close()
+
+    def query(self, metrics, start: float, end: float, points: int = 300) -> Dict[str, Any]:
+        """
+        min / avg / max per bucket for each metric over [start, end]. Uses the
+        finest tier whose retention still covers `start`; buckets are merged
+        further so at most `points` come back.
+        """
+        self.flush()
+        now = time.time()
+        width = self.TIERS[-1][0]
+        for w, keep in self.TIERS:
+            if start >= now - keep:
+                width = w
+                break
+        step = max(width, math.ceil((end - start) / max(1, points) / width) * width)
+        out: Dict[str, Any] = {"tier": width, "step": step, "start": start, "end": end, "series": {}}
+        conn = self._connect()
+        try:
+            for metric in metrics:
+                rows = conn.execute(
+                    "SELECT (bucket / ?) * ? AS b, MIN(min), SUM(sum) / SUM(n), MAX(max), SUM(n) "
+                    "FROM metrics_rollup WHERE tier = ? AND metric = ? AND bucket BETWEEN ? AND ? "
+                    "GROUP BY b ORDER BY b",
+                    (step, step, width, metric, int(start // width) * width, int(end)),
+                ).fetchall()
+                out["series"][metric] = {
+                    "t": [r[0] for r in rows],
+                    "min": [round(r[1], 2) for r in rows],
+                    "avg": [round(r[2], 2) for r in rows],
+                    "max": [round(r[3], 2) for r in rows],
+                    "n": [r[4] for r in rows],
+                }
+        finally:
+            conn.close()
+        return out
+
+
+METRICS_STORE = MetricsStore(float(os.getenv("METRICS_FLUSH", "30") or 30))
+
+
+class StatusBroadcaster:
+    """
+    Pushes SAMPLER's status to every dashboard tab over Socket.IO ("system_update").
+
+    Once per interval (SOCKET_INTERVAL, default the sampler's) the latest
+    sample is diffed against the previous broadcast and only changed top-level
+    fields go out, as one emit to the "system" room: one collection, one diff,
+    one packet encoding no matter how many tabs are open. Payloads carry a
+    "seq"; a connecting client first gets the full state ("full": true).
+
+    Emits happen outside the lock. A client that sees a seq gap (a diff that
+    overtook its snapshot) asks for "system_resync" and gets the full state again.
+
+    Clients ack with "system_ack" {seq}. A tab more than SOCKET_MAX_LAG (3)
+    updates behind - or one that never acks - moves to the "system_slow" room,
+    which gets a full snapshot every SOCKET_SLOW_EVERY (5) intervals instead of
+    diffs; acking the current snapshot in time moves it back.
+    """
+
+    ROOM, SLOW_ROOM = "system", "system_slow"
+
+    def __init__(self, socketio: SocketIO, sampler: MetricsSampler):
+        self.socketio = socketio
+        self.sampler = sampler
+        self.interval = float(os.getenv("SOCKET_INTERVAL", "0") or 0) or sampler.interval
+        self.max_lag = int(os.getenv("SOCKET_MAX_LAG", "3") or 3)
+        self.slow_every = max(1, int(os.getenv("SOCKET_SLOW_EVERY", "5") or 5))
+        self.seq = 0
+        self._state: Dict[str, Any] = {}
+        self._acked: Dict[str, int] = {}     # sid -> last seq acked (fast room)
+        self._slow: Dict[str, int] = {}      # sid -> last seq acked (slow room)
+        self._lock = threading.Lock()
+        self._task = None
+        self.sent = 0
+        self.demoted = 0
+
+    def _move(self, sid: str, to_slow: bool) -> None:
+        src, dst = (self.ROOM, self.SLOW_ROOM) if to_slow else (self.SLOW_ROOM, self.ROOM)
+        self.socketio.server.leave_room(sid, src, namespace="/")
+        self.socketio.server.enter_room(sid, dst, namespace="/")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        latest = None if self._state else self.sampler.latest()
+        with self._lock:
+            if not self._state:
+                self._state = dict(latest)   # baseline for the first diff
+            return dict(self._state, seq=self.seq, full=True)
+
+    def connect(self, sid: str) -> None:
+        snap = self._snapshot()
+        with self._lock:
+            self._acked[sid] = snap["seq"]
+            self.socketio.server.enter_room(sid, self.ROOM, namespace="/")
+        # emits never happen under the lock (eventlet isn't monkey-patched, it would stall
+        # the sampler); a diff overtaking this snapshot shows up as a seq gap -> resync
+        self.socketio.emit("system_update", snap, to=sid)
+
+    def resync(self, sid: str) -> None:
+        """Full state for a client that saw a seq gap."""
+        self.socketio.emit("system_update", self._snapshot(), to=sid)
+
+    def disconnect(self, sid: str) -> None:
+        with self._lock:
+            self._acked.pop(sid, None)
+            self._slow.pop(sid, None)
+
+    def ack(self, sid: str, seq: Any) -> None:
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            if sid in self._acked:
+                self._acked[sid] = max(self._acked[sid], seq)
+            elif sid in self._slow and seq >= self.seq:
+                # it holds the current full state: diffs from here on are valid
+                del self._slow[sid]
+                self._acked[sid] = seq
+                self._move(sid, to_slow=False)
+
+    def tick(self) -> None:
+        st = self.sampler.latest()
+        with self._lock:
+            diff = {k: v for k, v in st.items() if k not in self._state or self._state[k] != v}
+            if not diff:
+                return
+            self.seq += 1
+            seq = self.seq
+            self._state = dict(st)
+            for sid, acked in list(self._acked.items()):
+                if seq - 1 - acked > self.max_lag:
+                    del self._acked[sid]
+                    self._slow[sid] = acked
+                    self._move(sid, to_slow=True)
+                    self.demoted += 1
+            fast, slow = bool(self._acked), bool(self._slow) and seq % self.slow_every == 0
+        if fast:
+            diff["seq"] = seq
+            self.socketio.emit("system_update", diff, to=self.ROOM)
+            self.sent += 1
+        if slow:
+            self.socketio.emit("system_update", dict(st, seq=seq, full=True), to=self.SLOW_ROOM)
+            self.sent += 1
+
+    def _run(self) -> None:
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception:
+                log_line("WARN", "status broadcast failed:\n" + traceback.format_exc())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = self.socketio.start_background_task(self._run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"seq": self.seq, "clients": len(self._acked), "slow": len(self._slow),
+                    "sent": self.sent, "demoted": self.demoted}
+
+
 def create_app() -> Tuple[Flask, SocketIO]:
     app = Flask(__name__)
     app.register_blueprint(legacy_bp)
@@ -361,7 +794,69 @@ def create_app() -> Tuple[Flask, SocketIO]:
 
     app.register_blueprint(assets_bp)
 
+    # one sampler per process feeds every status / history reader (and the rollup store)
+    if os.getenv("METRICS_STORE", "1").lower() not in ("0", "false", "no", "off") \
+            and METRICS_STORE.add not in SAMPLER._listeners:
+        SAMPLER.subscribe(METRICS_STORE.add)
+    SAMPLER.start()
+
+    @app.get("/api/system/status")
+    def api_system_status():
+        return jsonify(SAMPLER.latest())
+
+    @app.get("/api/system/history")
+    def api_system_history():
+        seconds = request.args.get("seconds", type=float)
+        points = max(1, min(request.args.get("points", 300, type=int), 5000))
+        return jsonify(SAMPLER.history(seconds, points))
+
+    @app.get("/api/system/range")
+    def api_system_range():
+        """Stored min/avg/max buckets: ?metrics=cpu_percent,mem_percent&seconds=86400 (or start=&end=) &points=300."""
+        now = time.time()
+        end = request.args.get("end", now, type=float)
+        start = request.args.get("start", type=float)
+        if start is None:
+            start = end - request.args.get("seconds", 3600, type=float)
+        names = [m for m in (request.args.get("metrics") or "cpu_percent").split(",") if m in MetricsSampler.FIELDS]
+        if not names or start >= end:
+            return jsonify({"ok": False, "error": "bad metrics or range"}), 400
+        points = max(1, min(request.args.get("points", 300, type=int), 5000))
+        return jsonify(METRICS_STORE.query(names, start, end, points))
+
     # --- ensure create_app returns (app, socketio) ---
+    socketio: Optional[SocketIO] = None
+    if os.getenv("SOCKETIO", "1").lower() not in ("0", "false", "no", "off"):
+        try:
+            # async_mode None picks eventlet when installed, else threading
+            socketio = SocketIO(app, async_mode=os.getenv("SOCKETIO_ASYNC_MODE") or None,
+                                cors_allowed_origins=os.getenv("SOCKETIO_CORS", "*"))
+        except Exception:
+            log_line("WARN", "Socket.IO unavailable, serving HTTP only:\n" + traceback.format_exc())
+    if socketio is not None:
+        broadcaster = StatusBroadcaster(socketio, SAMPLER)
+
+        @socketio.on("connect")
+        def on_connect(auth=None):
+            broadcaster.connect(request.sid)
+
+        @socketio.on("disconnect")
+        def on_disconnect(*args):
+            broadcaster.disconnect(request.sid)
+
+        @socketio.on("system_ack")
+        def on_system_ack(data=None):
+            broadcaster.ack(request.sid, (data or {}).get("seq") if isinstance(data, dict) else data)
+
+        @socketio.on("system_resync")
+        def on_system_resync(data=None):
+            broadcaster.resync(request.sid)
+
+        @app.get("/api/system/sockets")
+        def api_system_sockets():
+            return jsonify(broadcaster.stats())
+
+        broadcaster.start()
 
     # Home page
     @app.get("/")
@@ -372,7 +867,7 @@ def create_app() -> Tuple[Flask, SocketIO]:
         except Exception:
             return render_template("dashboard.html")
 
-    return app, locals().get('socketio')
+    return app, socketio
 
 
 
@@ -411,7 +906,7 @@ def main() -> None:
         if socketio is None:
             app.run(host=host, port=port, debug=False)
         else:
-            socketio.run(app, host=host, port=int(os.environ.get('PORT','5000')), debug=False)
+            socketio.run(app, host=host, port=port, debug=False, allow_unsafe_werkzeug=True)
 
     except Exception:
         log_line("ERROR", "Server crashed:\n" + traceback.format_exc())
@@ -1,33 +1,79 @@
-import os, json, requests, traceback
+import os, json, queue, threading, time, traceback
 from typing import Tuple
 
+import http_pool
+from ai_fallback_patch import fallback_answer
+from local_model import POOL as MODEL_POOL
+from provider_health import HEALTH
+import response_cache
+from response_cache import RESPONSES
+
+TEMPERATURE = 0.2
+
 def _env(k, d=""):
     return os.getenv(k, d)
 
 def _ok(provider: str, reply: str):
     return {"ok": True, "provider": provider, "reply": reply}
 
-def _fail(provider: str, err: str):
-    return {"ok": False, "provider": provider, "error": err}
+def _fail(provider: str, err: str, unconfigured: bool = False):
+    # unconfigured: missing key / model, skipped without counting as an outage
+    res = {"ok": False, "provider": provider, "error": err}
+    if unconfigured:
+        res["unconfigured"] = True
+    return res
+
+class NotConfigured(RuntimeError):
+    pass
+
+def _env_float(k, d):
+    try:
+        return float(_env(k, "") or d)
+    except ValueError:
+        return d
+
+# per-thread call budget, set while a provider runs under AI_DEADLINE / hedging:
+# deadline (monotonic) caps each socket timeout, cancel aborts a losing race
+_CALL = threading.local()
 
 def _post_json(url, headers=None, payload=None, timeout=40):
-    r = requests.post(url, headers=headers or {}, json=payload or {}, timeout=timeout)
-    return r.status_code, r.text
+    deadline = getattr(_CALL, "deadline", None)
+    cancel = getattr(_CALL, "cancel", None)
+    if deadline is not None:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError("deadline exceeded")
+        timeout = min(timeout, left)
+    if cancel is None:
+        r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout)
+        return r.status_code, r.text
+    if cancel.is_set():
+        raise RuntimeError("cancelled")
+    # read in chunks so a hedge loser stops as soon as the race is decided
+    r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout, stream=True)
+    try:
+        body = bytearray()
+        for chunk in r.iter_content(16384):
+            if cancel.is_set():
+                raise RuntimeError("cancelled")
+            body += chunk
+        return r.status_code, body.decode(r.encoding or "utf-8", "replace")
+    finally:
+        r.close()
 
 def provider_local_llama(prompt: str):
     model_path = _env("LOCAL_MODEL_PATH", "")
     if not model_path or not os.path.exists(model_path):
-        return _fail("local", "LOCAL_MODEL_PATH missing or file not found")
+        return _fail("local", "LOCAL_MODEL_PATH missing or file not found", unconfigured=True)
 
     try:
-        from llama_cpp import Llama
+        import llama_cpp  # noqa: F401  (only checking it is installed)
     except Exception:
-        return _fail("local", "llama-cpp-python not installed")
+        return _fail("local", "llama-cpp-python not installed", unconfigured=True)
 
     try:
-        llm = Llama(model_path=model_path, n_ctx=4096)
-        out = llm(prompt, max_tokens=512, stop=["</s>"])
-        text = out["choices"][0]["text"].strip()
+        # loaded once and reused (local_model.POOL), not per message
+        text = MODEL_POOL.complete(prompt, max_tokens=512, stop=["</s>"]).strip()
         return _ok("local", text or "[empty reply]")
     except Exception as e:
         return _fail("local", str(e))
@@ -51,7 +97,7 @@ def provider_ollama(prompt: str):
 def provider_openai(prompt: str):
     key = _env("OPENAI_API_KEY", "")
     if not key:
-        return _fail("openai", "OPENAI_API_KEY missing")
+        return _fail("openai", "OPENAI_API_KEY missing", unconfigured=True)
     model = _env("OPENAI_MODEL", "gpt-4o-mini")
     try:
         url = "https://api.openai.com/v1/chat/completions"
@@ -59,7 +105,7 @@ def provider_openai(prompt: str):
         payload = {
             "model": model,
             "messages": [{"role":"user","content": prompt}],
-            "temperature": 0.2
+            "temperature": TEMPERATURE
         }
         code, txt = _post_json(url, headers=headers, payload=payload, timeout=60)
         if code != 200:
@@ -73,7 +119,7 @@ def provider_openai(prompt: str):
 def provider_gemini(prompt: str):
     key = _env("GEMINI_API_KEY", "")
     if not key:
-        return _fail("gemini", "GEMINI_API_KEY missing")
+        return _fail("gemini", "GEMINI_API_KEY missing", unconfigured=True)
     model = _env("GEMINI_MODEL", "gemini-1.5-flash")
     try:
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
@@ -90,7 +136,7 @@ def provider_gemini(prompt: str):
 def provider_deepseek(prompt: str):
     key = _env("DEEPSEEK_API_KEY", "")
     if not key:
-        return _fail("deepseek", "DEEPSEEK_API_KEY missing")
+        return _fail("deepseek", "DEEPSEEK_API_KEY missing", unconfigured=True)
     model = _env("DEEPSEEK_MODEL", "deepseek-chat")
     base = _env("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
     try:
@@ -99,7 +145,7 @@ def provider_deepseek(prompt: str):
         payload = {
             "model": model,
             "messages": [{"role":"user","content": prompt}],
-            "temperature": 0.2
+            "temperature": TEMPERATURE
         }
         code, txt = _post_json(url, headers=headers, payload=payload, timeout=60)
         if code != 200:
@@ -110,8 +156,10 @@ def provider_deepseek(prompt: str):
     except Exception as e:
         return _fail("deepseek", str(e))
 
-def provider_fallback(prompt: str):
+def provider_fallback(prompt: str, ctx=None):
     # Always works: minimal helpful answer without LLM
+    if ctx:
+        return _ok("fallback", fallback_answer(prompt, ctx))
     return _ok(
         "fallback",
         "FlashTM8 is running ✅\n"
@@ -119,32 +167,312 @@ def provider_fallback(prompt: str):
         "Try: Index Workspace → Search → Ask about run scripts."
     )
 
-def generate_reply(prompt: str) -> Tuple[str, dict]:
-    mode = _env("AI_PROVIDER", "auto").strip().lower()
+def _stream_lines(url, headers=None, payload=None, timeout=60):
+    """POST with a streamed body; yields non-empty text lines as they arrive."""
+    r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout, stream=True)
+    try:
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.text[:240]}")
+        # not decode_unicode: that silently stays bytes when no charset is sent
+        for line in r.iter_lines():
+            if line:
+                yield line.decode("utf-8", "replace")
+    finally:
+        r.close()
+
+def stream_ollama(prompt: str):
+    base = _env("OLLAMA_BASE_URL", "http://127.0.0.1:11434").rstrip("/")
+    model = _env("OLLAMA_MODEL", "llama3")
+    # NDJSON: {"response": "...", "done": false} per token batch
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    for line in _stream_lines(f"{base}/api/generate", payload=payload, timeout=40):
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        if data.get("response"):
+            yield data["response"]
+        if data.get("done"):
+            return
+
+def _stream_chat_completions(url, key, model, prompt):
+    # OpenAI-compatible SSE: `data: {...choices[0].delta.content...}` then `data: [DONE]`
+    headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+    payload = {
+        "model": model,
+        "messages": [{"role":"user","content": prompt}],
+        "temperature": TEMPERATURE,
+        "stream": True
+    }
+    for line in _stream_lines(url, headers=headers, payload=payload, timeout=60):
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        choices = json.loads(data).get("choices") or [{}]
+        text = (choices[0].get("delta") or {}).get("content")
+        if text:
+            yield text
+
+def stream_openai(prompt: str):
+    key = _env("OPENAI_API_KEY", "")
+    if not key:
+        raise NotConfigured("OPENAI_API_KEY missing")
+    model = _env("OPENAI_MODEL", "gpt-4o-mini")
+    yield from _stream_chat_completions("https://api.openai.com/v1/chat/completions", key, model, prompt)
+
+def stream_deepseek(prompt: str):
+    key = _env("DEEPSEEK_API_KEY", "")
+    if not key:
+        raise NotConfigured("DEEPSEEK_API_KEY missing")
+    model = _env("DEEPSEEK_MODEL", "deepseek-chat")
+    base = _env("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
+    yield from _stream_chat_completions(f"{base}/v1/chat/completions", key, model, prompt)
+
+# providers that can relay tokens; the rest answer in one piece
+STREAMERS = {
+    provider_ollama: ("ollama", stream_ollama),
+    provider_openai: ("openai", stream_openai),
+    provider_deepseek: ("deepseek", stream_deepseek),
+}
 
-    chain = []
+NAMES = {
+    provider_local_llama: "local",
+    provider_ollama: "ollama",
+    provider_gemini: "gemini",
+    provider_openai: "openai",
+    provider_deepseek: "deepseek",
+}
+
+def _call(fn, prompt: str):
+    """One provider call through its circuit breaker (provider_health)."""
+    return HEALTH.call(NAMES[fn], fn, prompt)
+
+def _probe_get(url, headers=None):
+    r = http_pool.get(url, headers=headers or {}, timeout=5)
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP {r.status_code}")
+
+def _bearer(key_env):
+    return {"Authorization": f"Bearer {_env(key_env, '')}"}
+
+# cheap reachability checks (model lists, no tokens spent) for the prober
+PROBES = {
+    "local": lambda: os.path.exists(_env("LOCAL_MODEL_PATH", "")),
+    "ollama": lambda: _probe_get(_env("OLLAMA_BASE_URL", "http://127.0.0.1:11434").rstrip("/") + "/api/tags"),
+    "gemini": lambda: _probe_get("https://generativelanguage.googleapis.com/v1beta/models?key=" + _env("GEMINI_API_KEY", "")),
+    "openai": lambda: _probe_get("https://api.openai.com/v1/models", _bearer("OPENAI_API_KEY")),
+    "deepseek": lambda: _probe_get(_env("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/") + "/v1/models", _bearer("DEEPSEEK_API_KEY")),
+}
+
+def start_health_prober():
+    HEALTH.start_prober(PROBES)
+
+def _chain(mode: str):
     if mode == "auto":
         # Best order for Termux reliability:
         # local → ollama → gemini → openai → deepseek → fallback
-        chain = [provider_local_llama, provider_ollama, provider_gemini, provider_openai, provider_deepseek, provider_fallback]
-    elif mode == "local":
-        chain = [provider_local_llama, provider_fallback]
-    elif mode == "ollama":
-        chain = [provider_ollama, provider_fallback]
-    elif mode == "gemini":
-        chain = [provider_gemini, provider_fallback]
-    elif mode == "openai":
-        chain = [provider_openai, provider_fallback]
-    elif mode == "deepseek":
-        chain = [provider_deepseek, provider_fallback]
-    else:
-        chain = [provider_fallback]
+        return [provider_local_llama, provider_ollama, provider_gemini, provider_openai, provider_deepseek, provider_fallback]
+    if mode == "local":
+        return [provider_local_llama, provider_fallback]
+    if mode == "ollama":
+        return [provider_ollama, provider_fallback]
+    if mode == "gemini":
+        return [provider_gemini, provider_fallback]
+    if mode == "openai":
+        return [provider_openai, provider_fallback]
+    if mode == "deepseek":
+        return [provider_deepseek, provider_fallback]
+    return [provider_fallback]
+
+def _hedged(chain, prompt: str, ctx, deadline: float):
+    """
+    Race the chain (AI_HEDGE=1): start the first provider, add the next one
+    every AI_HEDGE_DELAY seconds or as soon as a running one fails, and take
+    the first good answer. Losers get the cancel flag (checked between body
+    chunks) and their socket timeouts never outlive the deadline; a local
+    llama generation can't be interrupted and just finishes in the background.
+    """
+    delay = max(0.0, _env_float("AI_HEDGE_DELAY", 2.0))
+    racers = [fn for fn in chain if fn is not provider_fallback]
+    cancel = threading.Event()
+    results = queue.Queue()
+
+    def run(fn):
+        def attempt(p):
+            res = fn(p)
+            if not res.get("ok") and cancel.is_set():
+                res["cancelled"] = True   # lost the race: says nothing about its health
+            return res
+        _CALL.deadline, _CALL.cancel = deadline, cancel
+        try:
+            res = HEALTH.call(NAMES[fn], attempt, prompt)
+        finally:
+            _CALL.deadline = _CALL.cancel = None
+        results.put(res)
+
+    started, pending = 0, 0
+    next_start = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if started < len(racers) and (pending == 0 or now >= next_start):
+                threading.Thread(target=run, args=(racers[started],), name="hedge", daemon=True).start()
+                started += 1
+                pending += 1
+                next_start = now + delay
+                continue
+            if pending == 0:
+                break   # everyone failed
+            wait = deadline - now
+            if started < len(racers):
+                wait = min(wait, next_start - now)
+            try:
+                res = results.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                continue
+            pending -= 1
+            if res.get("ok"):
+                return res.get("provider","unknown"), res
+            next_start = time.monotonic()   # failed: hedge right away
+    finally:
+        cancel.set()
+    return "fallback", provider_fallback(prompt, ctx)
+
+def _generate(prompt: str, ctx=None) -> Tuple[str, dict]:
+    """
+    prompt goes to the provider chain as-is (callers pack any context into it);
+    ctx (retrieved chunks) lets the offline fallback still answer from the workspace.
+
+    AI_DEADLINE (seconds) bounds the whole walk: each provider's timeout is cut
+    to what is left. AI_HEDGE=1 (auto mode) races providers instead, see _hedged.
+    Providers whose circuit breaker is open are skipped (provider_health).
+    """
+    mode = _env("AI_PROVIDER", "auto").strip().lower()
+    chain = _chain(mode)
+    hedge = mode == "auto" and _env("AI_HEDGE", "0").lower() in ("1", "true", "yes", "on")
+    budget = _env_float("AI_DEADLINE", 30.0 if hedge else 0.0)
+    deadline = time.monotonic() + budget if budget > 0 else None
+
+    if hedge:
+        return _hedged(chain, prompt, ctx, deadline or time.monotonic() + 30.0)
 
     last = None
     for fn in chain:
-        res = fn(prompt)
+        if fn is provider_fallback:
+            res = fn(prompt, ctx)
+        elif deadline is not None and time.monotonic() >= deadline:
+            continue
+        else:
+            _CALL.deadline = deadline
+            try:
+                res = _call(fn, prompt)
+            finally:
+                _CALL.deadline = None
         last = res
         if res.get("ok"):
             return res.get("provider","unknown"), res
 
-    return "fallback", last or provider_fallback(prompt)
+    return "fallback", last or provider_fallback(prompt, ctx)
+
+def _generate_stream(prompt: str, ctx=None):
+    """
+    Same chain as generate_reply, relaying tokens as they arrive.
+    Yields ("provider", name), then ("token", text)..., then ("done", name);
+    or ("error", message). A provider that fails before its first token is
+    skipped like in generate_reply; once tokens went out there is no switching,
+    so a mid-stream failure ends with an error event.
+    """
+    errors = []
+    for fn in _chain(_env("AI_PROVIDER", "auto").strip().lower()):
+        if fn in STREAMERS:
+            name, stream = STREAMERS[fn]
+            br = HEALTH.get(name)
+            if not br.allow():
+                errors.append(f"{name}: circuit open")
+                continue
+            t0 = time.monotonic()
+            verdict = None
+            it = stream(prompt)
+            try:
+                try:
+                    first = next(it)
+                except StopIteration:
+                    verdict = (False, "[empty]", True)
+                    errors.append(f"{name}: [empty]")
+                    continue
+                except Exception as e:
+                    verdict = (False, str(e), not isinstance(e, NotConfigured))
+                    errors.append(f"{name}: {e}")
+                    continue
+                yield "provider", name
+                yield "token", first
+                try:
+                    for text in it:
+                        yield "token", text
+                except Exception as e:
+                    verdict = (False, str(e), True)
+                    yield "error", f"{name}: {e}"
+                    return
+                verdict = (True, None, True)
+                yield "done", name
+                return
+            finally:
+                it.close()   # client went away: drop the upstream connection now
+                if verdict is None:
+                    br.record(None)   # client left mid-stream: no verdict
+                else:
+                    br.record(verdict[0], (time.monotonic() - t0) * 1000, verdict[1], configured=verdict[2])
+
+        res = fn(prompt, ctx) if fn is provider_fallback else _call(fn, prompt)
+        if res.get("ok"):
+            yield "provider", res["provider"]
+            yield "token", res.get("reply", "")
+            yield "done", res["provider"]
+            return
+        errors.append(f"{res.get('provider')}: {res.get('error')}")
+
+    yield "error", "; ".join(errors) or "no provider"
+
+def _cache_key(prompt: str, ctx) -> str:
+    return response_cache.make_key(
+        prompt,
+        mode=_env("AI_PROVIDER", "auto").strip().lower(),
+        models=[_env(k) for k in ("LOCAL_MODEL_PATH", "OLLAMA_MODEL", "GEMINI_MODEL", "OPENAI_MODEL", "DEEPSEEK_MODEL")],
+        temperature=TEMPERATURE,
+        ctx=response_cache.context_hash(ctx),
+    )
+
+def generate_reply(prompt: str, ctx=None, use_cache: bool = True) -> Tuple[str, dict]:
+    """_generate behind the persistent response cache (response_cache); use_cache=False bypasses it."""
+    key = _cache_key(prompt, ctx) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            res = _ok(hit["provider"], hit["reply"])
+            res.update(cached=True, age=hit["age"])
+            return hit["provider"], res
+    provider, res = _generate(prompt, ctx)
+    if key and res.get("ok") and provider != "fallback":
+        RESPONSES.put(key, provider, res.get("reply", ""))
+    return provider, res
+
+def generate_reply_stream(prompt: str, ctx=None, use_cache: bool = True):
+    """_generate_stream behind the response cache: a hit comes back as one token."""
+    key = _cache_key(prompt, ctx) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            yield "provider", hit["provider"]
+            yield "token", hit["reply"]
+            yield "done", hit["provider"]
+            return
+    parts = []
+    for kind, value in _generate_stream(prompt, ctx):
+        if kind == "token":
+            parts.append(value)
+        elif kind == "done" and key and value != "fallback":
+            RESPONSES.put(key, value, "".join(parts).strip())
+        yield kind, value
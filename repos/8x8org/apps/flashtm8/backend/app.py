@@ -1,13 +1,20 @@
 import os, json
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
 
 from dotenv import load_dotenv
 
 # local imports
-from workspace_index import index_workspace, search as search_index
-from ai_providers import generate_reply
+from workspace_index import index_workspace, index_paths, search as search_index, DEFAULT_EXCLUDES, TEXT_EXTS
+from ai_providers import generate_reply, generate_reply_stream, start_health_prober
 from tools import safe_exec, safe_write
+from watcher import WorkspaceWatcher, watch_enabled
+import retrieval
+from jobs import JobManager, sse_events
+from local_model import POOL as MODEL_POOL, warm_enabled
+from content_cache import CACHE
+from provider_health import HEALTH
+from response_cache import RESPONSES
 
 HERE = Path(__file__).resolve().parent
 APPROOT = HERE.parent
@@ -27,7 +34,27 @@ def _mask(v: str):
         return "****"
     return v[:4] + "…" + v[-4:]
 
+WATCHER = None
+JOBS = JobManager()
+
+def start_watcher():
+    """Keep the index fresh from file events (WATCH_ENABLED=1); one per process."""
+    global WATCHER
+    if WATCHER is None and watch_enabled():
+        root = env("WORKSPACE_ROOT", str(Path.cwd()))
+        WATCHER = WorkspaceWatcher.from_env(
+            root,
+            lambda rels: (index_paths(root, str(DBPATH), rels), retrieval.schedule_build(str(DBPATH))),
+            exclude=DEFAULT_EXCLUDES,
+            exts=TEXT_EXTS,
+        ).start()
+    return WATCHER
+
 def create_app():
+    start_watcher()
+    if warm_enabled():
+        MODEL_POOL.warm()
+    start_health_prober()
     app = Flask(
         __name__,
         template_folder=str(HERE / "templates"),
@@ -40,19 +67,73 @@ def create_app():
 
     @app.get("/api/health")
     def health():
+        job = JOBS.running("index")
         return jsonify({
             "ok": True,
             "provider": env("AI_PROVIDER","auto"),
             "workspace_root": env("WORKSPACE_ROOT",""),
             "db": str(DBPATH),
-            "indexed_exists": DBPATH.exists()
+            "indexed_exists": DBPATH.exists(),
+            "watcher": WATCHER.status() if WATCHER else None,
+            "index_job": job.snapshot() if job else None,
+            "cache": CACHE.stats(),
+            "local_model": MODEL_POOL.status(),
+            "providers": HEALTH.snapshot(),
+            "response_cache": RESPONSES.stats(),
         })
 
     @app.post("/api/index")
     def api_index():
+        """
+        Starts a background index job and returns it right away (202).
+        409 + the running job if one is already going. {"wait": true} blocks
+        until the job ends and returns its counts, like the old endpoint.
+        """
+        data = request.get_json(silent=True) or {}
         root = env("WORKSPACE_ROOT", str(Path.cwd()))
-        count = index_workspace(root, str(DBPATH))
-        return jsonify({"ok": True, "indexed_files": count})
+        full = bool(data.get("full", False))
+
+        def run(job):
+            stats = index_workspace(root, str(DBPATH), full=full,
+                                    progress=job.update, cancel=job.cancelled)
+            # a no-op pass leaves the chunks as they were: only build if the vectors are missing
+            touched = any(stats.get(k) for k in ("added", "changed", "removed"))
+            if not job.cancelled() and (touched or not retrieval.vectors_path(str(DBPATH)).exists()):
+                stats["vectors"] = retrieval.build_vectors(str(DBPATH))
+            return stats
+
+        job, created = JOBS.submit("index", run)
+        if data.get("wait"):
+            version = job.version
+            while not job.done:
+                version = job.wait_change(version)
+            return jsonify({"ok": job.status == "done", **(job.result or {}), "job": job.snapshot()})
+        if not created:
+            return jsonify({"ok": False, "error": "an index job is already running", "job": job.snapshot()}), 409
+        return jsonify({"ok": True, "job": job.snapshot()}), 202
+
+    @app.get("/api/index/jobs")
+    def api_index_jobs():
+        return jsonify({"ok": True, "jobs": JOBS.list()})
+
+    @app.get("/api/index/jobs/<job_id>")
+    def api_index_job(job_id):
+        job = JOBS.get(job_id)
+        if job is None:
+            return jsonify({"ok": False, "error": "unknown job"}), 404
+        return jsonify({"ok": True, "job": job.snapshot()})
+
+    @app.get("/api/index/jobs/<job_id>/events")
+    def api_index_job_events(job_id):
+        job = JOBS.get(job_id)
+        if job is None:
+            return jsonify({"ok": False, "error": "unknown job"}), 404
+        return Response(sse_events(job), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/api/index/jobs/<job_id>/cancel")
+    def api_index_job_cancel(job_id):
+        return jsonify({"ok": JOBS.cancel(job_id)})
 
     @app.post("/api/search")
     def api_search():
@@ -62,6 +143,16 @@ def create_app():
         hits = search_index(str(DBPATH), q, limit=12)
         return jsonify({"ok": True, "hits": hits})
 
+    @app.post("/api/semantic")
+    def api_semantic():
+        data = request.get_json(silent=True) or {}
+        q = (data.get("q") or "").strip()
+        if not q:
+            return jsonify({"ok": False, "error": "missing q"}), 400
+        k = max(1, min(int(data.get("k") or 8), 50))
+        hits = retrieval.semantic_search(str(DBPATH), q, k)
+        return jsonify({"ok": True, "hits": hits})
+
     @app.post("/api/chat")
     def api_chat():
         data = request.json or {}
@@ -69,7 +160,12 @@ def create_app():
         if not msg:
             return jsonify({"ok": False, "error": "missing message"}), 400
 
-        provider_used, res = generate_reply(msg)
+        # workspace-grounded: the best chunks ride along instead of whole files
+        ctx = []
+        if retrieval.enabled() and data.get("context", True):
+            ctx = retrieval.build_context(str(DBPATH), msg)
+        # "cache": false asks for a fresh answer
+        provider_used, res = generate_reply(retrieval.pack_prompt(msg, ctx), ctx, use_cache=data.get("cache", True))
         # res is dict {"ok":bool, "provider":str, "reply":str} or {"error":...}
         if isinstance(res, str):
             res = {"ok": True, "provider": provider_used, "reply": res}
@@ -81,9 +177,34 @@ def create_app():
         return jsonify({
             "ok": True,
             "provider": provider_used,
-            "reply": res.get("reply","")
+            "reply": res.get("reply",""),
+            "cached": bool(res.get("cached")),
+            "context": [{k: c[k] for k in ("path", "start_line", "end_line", "score")} for c in ctx],
         })
 
+    @app.post("/api/chat/stream")
+    def api_chat_stream():
+        """Server-sent events: meta (context), provider, token..., then done or error."""
+        data = request.get_json(silent=True) or {}
+        msg = (data.get("message") or "").strip()
+        if not msg:
+            return jsonify({"ok": False, "error": "missing message"}), 400
+
+        ctx = []
+        if retrieval.enabled() and data.get("context", True):
+            ctx = retrieval.build_context(str(DBPATH), msg)
+        prompt = retrieval.pack_prompt(msg, ctx)
+
+        def events():
+            meta = [{k: c[k] for k in ("path", "start_line", "end_line", "score")} for c in ctx]
+            yield f"event: meta\ndata: {json.dumps({'context': meta})}\n\n"
+            for kind, value in generate_reply_stream(prompt, ctx, use_cache=data.get("cache", True)):
+                key = "text" if kind == "token" else ("error" if kind == "error" else "provider")
+                yield f"event: {kind}\ndata: {json.dumps({key: value})}\n\n"
+
+        return Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     @app.get("/api/config")
     def api_get_config():
         # send masked keys for UI
@@ -0,0 +1,170 @@
+"""
+Per-provider health: recent latency / error rate plus a circuit breaker.
+
+- closed: calls go through; BREAKER_FAILURES (3) failures in a row open it
+- open: the provider is skipped for BREAKER_COOLDOWN seconds (30), doubled
+  on every re-open up to BREAKER_MAX_COOLDOWN (600)
+- half_open: one trial call (a real request or the prober's) decides:
+  success closes the breaker, failure re-opens it
+- unconfigured (missing key / model file) is not an outage: nothing counts
+  against the breaker, the provider just shows up as such
+A background prober (PROVIDER_PROBE_INTERVAL seconds, 0 = off) runs cheap
+reachability checks against open breakers, so a recovered backend closes
+again without a user request paying for the trial.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+WINDOW = 50    # recent calls kept for error rate / latency
+
+def _env_num(k: str, d: float) -> float:
+    try:
+        return float(os.getenv(k, "") or d)
+    except ValueError:
+        return d
+
+class Breaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0           # consecutive
+        self.cooldown = 0.0
+        self.opened_at = 0.0
+        self.trial = False          # a half-open trial is in flight
+        self.configured = True
+        self.calls = deque(maxlen=WINDOW)   # (ok, ms)
+        self.last_error = None
+        self.last_failure = None
+        self.last_ok = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a call go out now? A True in half-open state claims the single trial."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+            if self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok, ms: float = 0.0, error: str = None, configured: bool = True):
+        """ok=None: no verdict (cancelled race loser); releases a trial without counting."""
+        with self._lock:
+            self.trial = False
+            self.configured = configured
+            if not configured or ok is None:
+                if self.state == "half_open":
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+                return
+            self.calls.append((bool(ok), ms))
+            if ok:
+                self.failures = 0
+                self.state = "closed"
+                self.cooldown = 0.0
+                self.last_ok = time.time()
+                return
+            self.failures += 1
+            self.last_error = error
+            self.last_failure = time.time()
+            if self.state == "half_open" or self.failures >= int(_env_num("BREAKER_FAILURES", 3)):
+                base = _env_num("BREAKER_COOLDOWN", 30)
+                reopened = self.state == "half_open"
+                self.cooldown = min(self.cooldown * 2 if reopened and self.cooldown else base,
+                                    _env_num("BREAKER_MAX_COOLDOWN", 600))
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def probe_due(self) -> bool:
+        with self._lock:
+            return (self.configured and self.state == "open"
+                    and time.monotonic() - self.opened_at >= self.cooldown)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+            ms = sorted(m for ok, m in calls if ok)
+            retry = self.cooldown - (time.monotonic() - self.opened_at) if self.state == "open" else 0
+            return {
+                "state": self.state if self.configured else "unconfigured",
+                "calls": len(calls),
+                "error_rate": round(sum(1 for ok, _ in calls if not ok) / len(calls), 3) if calls else None,
+                "p50_ms": round(ms[len(ms) // 2]) if ms else None,
+                "last_ms": round(calls[-1][1]) if calls else None,
+                "consecutive_failures": self.failures,
+                "retry_in": round(max(0.0, retry), 1) if self.state == "open" else None,
+                "last_error": self.last_error,
+                "last_failure": self.last_failure,
+                "last_ok": self.last_ok,
+            }
+
+class HealthRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._prober = None
+
+    def get(self, name: str) -> Breaker:
+        with self._lock:
+            br = self._breakers.get(name)
+            if br is None:
+                br = self._breakers[name] = Breaker(name)
+            return br
+
+    def call(self, name: str, fn, *args):
+        """
+        Run fn(*args) -> {"ok", "error", ...} through the breaker. Skipped calls
+        return a failure dict without touching the provider.
+        """
+        br = self.get(name)
+        if not br.allow():
+            snap = br.snapshot()
+            return {"ok": False, "provider": name, "skipped": True,
+                    "error": f"circuit open (retry in {snap['retry_in'] or 0}s): {snap['last_error']}"}
+        t0 = time.monotonic()
+        try:
+            res = fn(*args)
+        except Exception as e:
+            res = {"ok": False, "provider": name, "error": str(e)}
+        ms = (time.monotonic() - t0) * 1000
+        if res.get("cancelled"):
+            br.record(None)
+        else:
+            br.record(res.get("ok"), ms, res.get("error"), configured=not res.get("unconfigured"))
+        return res
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = list(self._breakers.items())
+        return {name: br.snapshot() for name, br in items}
+
+    def start_prober(self, probes: dict):
+        """probes: name -> callable that raises (or returns False) when the backend is down."""
+        if self._prober is not None or _env_num("PROVIDER_PROBE_INTERVAL", 30) <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(max(1.0, _env_num("PROVIDER_PROBE_INTERVAL", 30)))
+                for name, probe in probes.items():
+                    br = self.get(name)
+                    if not br.probe_due() or not br.allow():
+                        continue
+                    t0 = time.monotonic()
+                    try:
+                        ok, err = probe() is not False, None
+                    except Exception as e:
+                        ok, err = False, str(e)
+                    br.record(ok, (time.monotonic() - t0) * 1000, err and f"probe: {err}")
+
+        self._prober = threading.Thread(target=loop, name="provider-prober", daemon=True)
+        self._prober.start()
+
+HEALTH = HealthRegistry()
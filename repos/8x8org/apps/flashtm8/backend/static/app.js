@@ -7,6 +7,31 @@ async function get(url){
   return await r.json();
 }
 
+// POST, then parse the text/event-stream body: onEvent(name, data) per event
+async function postStream(url, body, onEvent){
+  const r = await fetch(url, {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(body||{})});
+  if(!r.ok || !r.body) throw new Error("HTTP " + r.status);
+  const reader = r.body.getReader();
+  const dec = new TextDecoder();
+  let buf = "";
+  for(;;){
+    const {value, done} = await reader.read();
+    if(done) break;
+    buf += dec.decode(value, {stream:true});
+    let i;
+    while((i = buf.indexOf("\n\n")) >= 0){
+      const block = buf.slice(0, i);
+      buf = buf.slice(i + 2);
+      let name = "message", data = "";
+      block.split("\n").forEach(line=>{
+        if(line.startsWith("event:")) name = line.slice(6).trim();
+        else if(line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if(data) onEvent(name, JSON.parse(data));
+    }
+  }
+}
+
 const el = id => document.getElementById(id);
 
 function addChat(cls, text){
@@ -38,8 +63,23 @@ async function health(){
 el("btnIndex").onclick = async ()=>{
   el("searchOut").textContent = "Indexing...";
   const res = await post("/api/index",{});
-  el("searchOut").textContent = JSON.stringify(res,null,2);
-  await health();
+  if(!res.job){
+    el("searchOut").textContent = JSON.stringify(res,null,2);
+    return;
+  }
+  // follow the background job (also attaches to an already running one)
+  const es = new EventSource(`/api/index/jobs/${res.job.id}/events`);
+  es.addEventListener("progress", e=>{
+    const p = JSON.parse(e.data).progress || {};
+    const eta = p.eta != null ? ` • ETA ${p.eta}s` : "";
+    el("searchOut").textContent = `Indexing... ${p.files||0} files • ${((p.bytes||0)/1048576).toFixed(1)} MB • ${p.rate||0} files/s${eta}`;
+  });
+  es.addEventListener("end", async e=>{
+    es.close();
+    el("searchOut").textContent = JSON.stringify(JSON.parse(e.data),null,2);
+    await health();
+  });
+  es.onerror = ()=> es.close();
 };
 
 el("btnSearch").onclick = async ()=>{
@@ -55,12 +95,29 @@ el("btnSend").onclick = async ()=>{
   if(!m) return;
   el("msg").value = "";
   addChat("msgUser", "You: " + m);
-  const res = await post("/api/chat",{message:m});
-  if(res.ok){
-    addChat("msgBot", "FlashTM8: " + res.reply);
-    el("provider").textContent = "Provider used: " + (res.provider || "unknown");
-  } else {
-    addChat("msgBot", "FlashTM8: Error: " + (res.error || "unknown"));
+  const d = document.createElement("div");
+  d.className = "msgBot";
+  d.textContent = "FlashTM8: …";
+  el("chatOut").appendChild(d);
+  let text = "", started = false;
+  try{
+    await postStream("/api/chat/stream", {message:m}, (ev, data)=>{
+      if(ev === "provider") el("provider").textContent = "Provider used: " + data.provider;
+      else if(ev === "token"){ started = true; text += data.text; }
+      else if(ev === "error") text += (text ? "\n" : "") + "Error: " + data.error;
+      else return;
+      d.textContent = "FlashTM8: " + text;
+      el("chatOut").scrollTop = el("chatOut").scrollHeight;
+    });
+  }catch(e){
+    if(started){
+      // the provider already answered part of it: asking again would repeat or change the reply
+      d.textContent = "FlashTM8: " + text + "\nError: stream interrupted (" + e.message + ")";
+      return;
+    }
+    // older backend / proxy without streaming: one-shot request
+    const res = await post("/api/chat",{message:m});
+    d.textContent = "FlashTM8: " + (res.ok ? res.reply : "Error: " + (res.error || "unknown"));
     el("provider").textContent = "Provider used: " + (res.provider || "unknown");
   }
 };
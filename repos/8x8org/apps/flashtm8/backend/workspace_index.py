@@ -1,96 +1,645 @@
-import os, sqlite3, hashlib, time
+import os, re, sqlite3, hashlib, threading, time, zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
+try:
+    import zstandard  # optional: faster/smaller than zlib
+except ImportError:
+    zstandard = None
+
+from content_cache import CACHE
+from walker import walk_files
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
+
 DEFAULT_EXCLUDES = {
     ".git", ".venv", "node_modules", "__pycache__", ".pytest_cache",
     "dist", "build", ".mypy_cache", ".cache"
 }
 
+# only index text-like files
+TEXT_EXTS = {
+    ".py",".js",".ts",".tsx",".json",".md",".txt",".sh",".html",".css",".yml",".yaml",".toml",".ini"
+}
+
+# bump when the index layout changes; older index DBs are dropped and rebuilt
+SCHEMA_VERSION = 4
+
+# files are split into overlapping line windows; search hits are chunks, not file heads
+CHUNK_LINES = 40
+CHUNK_OVERLAP = 10
+
+UPSERT_SQL = """
+INSERT INTO files(path, mtime, size, sha)
+VALUES(?,?,?,?)
+ON CONFLICT(path) DO UPDATE SET
+  mtime=excluded.mtime,
+  size=excluded.size,
+  sha=excluded.sha
+"""
+
 def _hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8", "ignore")).hexdigest()
 
+def _pack(text: str):
+    data = text.encode("utf-8", "ignore")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+def _unpack(codec, data) -> str:
+    if data is None:
+        return ""
+    if codec == "zstd":
+        if zstandard is None:
+            return ""
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8", "ignore")
+
+def _lines_size(lines) -> int:
+    # text plus a rough per-str object overhead
+    return sum(map(len, lines)) + 56 * len(lines)
+
+def _unpack_lines(sha, codec, data, start, end) -> str:
+    """SQL helper: lines start..end (1-based, inclusive) of a blob."""
+    # decompressed bodies are shared with reads / chat context through the byte-bounded LRU
+    lines = CACHE.get_or_load(("blob", sha), lambda: _unpack(codec, data).split("\n"), _lines_size)
+    return "\n".join(lines[start - 1:end])
+
+def _chunk_spans(text: str):
+    """Overlapping (start_line, end_line) windows covering the text."""
+    n = max(1, text.count("\n") + (0 if text.endswith("\n") else 1))
+    step = CHUNK_LINES - CHUNK_OVERLAP
+    spans, start = [], 1
+    while True:
+        end = min(start + CHUNK_LINES - 1, n)
+        spans.append((start, end))
+        if end >= n:
+            return spans
+        start += step
+
+def _env_int(k: str, d: int) -> int:
+    try:
+        return max(1, int(os.getenv(k, "") or d))
+    except ValueError:
+        return d
+
+def _connect(db_path: str):
+    con = sqlite3.connect(db_path)
+    # WAL: searches keep reading while the indexer writes; NORMAL is durable enough for a rebuildable cache
+    con.execute("PRAGMA synchronous=NORMAL;")
+    # file bodies are stored compressed; the FTS view/triggers decompress through this
+    con.create_function("unpack_blob", 2, _unpack, deterministic=True)
+    con.create_function("unpack_lines", 5, _unpack_lines, deterministic=True)
+    return con
+
 def init_db(db_path: str):
+    """
+    files  : metadata only (path, mtime, size, sha) - path scans never page in content
+    blobs  : one compressed body per distinct sha, reference-counted from files
+    chunks : overlapping line ranges of each file, the unit FTS indexes and returns
+    """
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(db_path)
+    con = _connect(db_path)
     cur = con.cursor()
-    cur.execute("""
+    cur.execute("PRAGMA journal_mode=WAL;")
+    if cur.execute("PRAGMA user_version;").fetchone()[0] != SCHEMA_VERSION:
+        # the index is a cache of the workspace: drop old layouts, next index refills it
+        cur.executescript("""
+        DROP TABLE IF EXISTS chunks_tri;
+        DROP TABLE IF EXISTS chunks_fts;
+        DROP VIEW IF EXISTS chunks_text;
+        DROP TABLE IF EXISTS chunks;
+        DROP TABLE IF EXISTS files_fts;
+        DROP VIEW IF EXISTS files_text;
+        DROP TABLE IF EXISTS files;
+        DROP TABLE IF EXISTS blobs;
+        """)
+        cur.execute(f"PRAGMA user_version={SCHEMA_VERSION};")
+    cur.executescript("""
     CREATE TABLE IF NOT EXISTS files (
-        path TEXT PRIMARY KEY,
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
         mtime REAL,
         size INTEGER,
-        sha TEXT,
-        content TEXT
+        sha TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS blobs (
+        sha TEXT PRIMARY KEY,
+        refs INTEGER NOT NULL DEFAULT 0,
+        codec TEXT NOT NULL,
+        data BLOB
+    );
+
+    CREATE TRIGGER IF NOT EXISTS files_ref_ai AFTER INSERT ON files BEGIN
+        UPDATE blobs SET refs = refs + 1 WHERE sha = new.sha;
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_ref_ad AFTER DELETE ON files BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE sha = old.sha;
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_ref_au AFTER UPDATE OF sha ON files BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE sha = old.sha;
+        UPDATE blobs SET refs = refs + 1 WHERE sha = new.sha;
+    END;
+
+    CREATE VIEW IF NOT EXISTS files_text AS
+        SELECT f.id AS id, f.path AS path, unpack_blob(b.codec, b.data) AS content
+        FROM files f JOIN blobs b ON b.sha = f.sha;
+
+    CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL,
+        sha TEXT NOT NULL,
+        start_line INTEGER NOT NULL,
+        end_line INTEGER NOT NULL
     );
+    CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id);
+
+    CREATE TRIGGER IF NOT EXISTS files_chunks_bd BEFORE DELETE ON files BEGIN
+        DELETE FROM chunks WHERE file_id = old.id;
+    END;
+
+    CREATE VIEW IF NOT EXISTS chunks_text AS
+        SELECT c.id AS id, f.path AS path,
+               unpack_lines(b.sha, b.codec, b.data, c.start_line, c.end_line) AS text
+        FROM chunks c
+        JOIN files f ON f.id = c.file_id
+        JOIN blobs b ON b.sha = c.sha;
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_path ON files(path);")
+    _init_fts(cur)
     con.commit()
     con.close()
 
-def index_workspace(root: str, db_path: str, max_bytes: int = 250_000, exclude=None):
+def _init_fts(cur):
+    """
+    FTS5 index over chunks_text(path, text), kept in sync by triggers on chunks.
+    External-content table: FTS only holds the index, chunk text is cut from
+    the compressed blob on demand (highlight()).
+    """
+    try:
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            path, text,
+            content='chunks_text', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        """)
+    except sqlite3.OperationalError:
+        # sqlite built without FTS5 -> search() falls back to LIKE
+        return
+    # chunk rows carry their own sha, and blobs are GC'd only after the
+    # index run, so the old text still resolves when a chunk is deleted
+    cur.executescript("""
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts(rowid, path, text)
+        SELECT id, path, text FROM chunks_text WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_bd BEFORE DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, path, text)
+        SELECT 'delete', id, path, text FROM chunks_text WHERE id = old.id;
+    END;
+    """)
+    _init_trigram(cur)
+
+def _init_trigram(cur):
+    """
+    Trigram posting index over chunk text (FTS5 'trigram' tokenizer, sqlite >= 3.34).
+    Used to narrow candidates for substring / regex search before verifying in Python.
+    """
+    try:
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_tri USING fts5(
+            text,
+            content='chunks_text', content_rowid='id',
+            tokenize='trigram case_sensitive 0'
+        );
+        """)
+    except sqlite3.OperationalError:
+        # no trigram tokenizer -> substring/regex search scans chunks
+        return
+    cur.executescript("""
+    CREATE TRIGGER IF NOT EXISTS chunks_tri_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_tri(rowid, text)
+        SELECT id, text FROM chunks_text WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS chunks_tri_bd BEFORE DELETE ON chunks BEGIN
+        INSERT INTO chunks_tri(chunks_tri, rowid, text)
+        SELECT 'delete', id, text FROM chunks_text WHERE id = old.id;
+    END;
+    """)
+
+def _read_one(rel: str, path: str, st, max_bytes: int):
+    """Worker stage: read + decode + hash + compress + chunk one file (runs on the pool)."""
+    if st.st_size > max_bytes:
+        # too large, index metadata only
+        content = f"[SKIPPED: too large {st.st_size} bytes]"
+    else:
+        content = Path(path).read_text(errors="ignore")
+    return rel, st, _hash_text(content), _pack(content), _chunk_spans(content)
+
+def index_workspace(root: str, db_path: str, max_bytes: int = 250_000, exclude=None, full: bool = False,
+                    workers: int = None, batch_size: int = None, progress=None, cancel=None):
+    """
+    Incremental by default: a file whose (mtime, size) matches its stored row
+    is not re-read, and rows for files that disappeared are deleted.
+    full=True re-reads every file (content is still only rewritten if the sha changed).
+
+    Pipeline: walker (this thread) -> bounded thread pool reading/hashing
+    -> single writer (this thread) doing executemany batches in one transaction.
+    workers / batch_size default to INDEX_WORKERS / INDEX_BATCH_SIZE.
+
+    progress(**counts) is called at most ~4x/second with files/bytes scanned so far
+    and `total` (the previous file count, an estimate). cancel() returning True
+    stops the walk: already-read files are kept, nothing is pruned, and the
+    result carries "cancelled": True.
+
+    Returns counts: indexed_files, added, changed, removed, unchanged.
+    """
     exclude = set(exclude or []) | DEFAULT_EXCLUDES
+    rootp = Path(root).resolve()
+
+    def targets():
+        # excluded folders are pruned by the walker, never descended into
+        for rel, entry in walk_files(str(rootp), exclude, TEXT_EXTS):
+            try:
+                yield rel, entry.path, entry.stat()
+            except OSError:
+                continue
+
+    return _index(db_path, targets(), None, max_bytes, full, workers, batch_size, progress, cancel)
+
+def index_paths(root: str, db_path: str, paths, max_bytes: int = 250_000, exclude=None,
+                workers: int = None, batch_size: int = None):
+    """
+    Re-index only the given workspace-relative paths (files or directories),
+    e.g. a debounced batch from the watcher. A path that no longer exists
+    drops its row - or every row under it, for a vanished directory.
+    Same counts as index_workspace().
+    """
+    exclude = set(exclude or []) | DEFAULT_EXCLUDES
+    rootp = Path(root).resolve()
+    scopes = []
+    # a dir scope already covers files/dirs below it: walking both would index them twice
+    for rel in sorted({os.path.normpath(p).strip(os.sep) for p in paths if p} - {"", "."}):
+        if not any(rel.startswith(s + os.sep) for s in scopes):
+            scopes.append(rel)
+
+    def targets():
+        for rel in scopes:
+            if any(part in exclude for part in Path(rel).parts):
+                continue
+            abs_path = rootp / rel
+            if abs_path.is_dir():
+                for sub, entry in walk_files(str(abs_path), exclude, TEXT_EXTS):
+                    try:
+                        yield f"{rel}/{sub}", entry.path, entry.stat()
+                    except OSError:
+                        continue
+            elif abs_path.suffix.lower() in TEXT_EXTS and abs_path.is_file():
+                try:
+                    yield rel, str(abs_path), abs_path.stat()
+                except OSError:
+                    continue
+
+    return _index(db_path, targets(), scopes, max_bytes, False, workers, batch_size)
+
+# one index run at a time per process (full reindex vs watcher batches)
+_INDEX_LOCK = threading.Lock()
+
+def _index(db_path: str, targets, scopes, max_bytes: int, full: bool, workers: int, batch_size: int,
+           progress=None, cancel=None):
+    """
+    Shared pipeline. `targets` yields (rel, abs_path, stat); `scopes` limits which
+    stored rows are compared / pruned (None = the whole index).
+    """
+    workers = workers or _env_int("INDEX_WORKERS", min(8, os.cpu_count() or 2))
+    batch_size = batch_size or _env_int("INDEX_BATCH_SIZE", 256)
+    with _INDEX_LOCK:
+        return _index_locked(db_path, targets, scopes, max_bytes, full, workers, batch_size, progress, cancel)
+
+def _index_locked(db_path, targets, scopes, max_bytes, full, workers, batch_size, progress, cancel):
     init_db(db_path)
-    con = sqlite3.connect(db_path)
+    con = _connect(db_path)
     cur = con.cursor()
 
-    rootp = Path(root).resolve()
-    count = 0
+    if scopes is None:
+        rows = cur.execute("SELECT path, mtime, size, sha FROM files").fetchall()
+    else:
+        rows = []
+        for scope in scopes:
+            # the path itself, or anything below it ('0' sorts right after '/')
+            rows += cur.execute(
+                "SELECT path, mtime, size, sha FROM files WHERE path = ? OR (path > ? AND path < ?)",
+                (scope, scope + "/", scope + "0"),
+            ).fetchall()
+    known = {r[0]: (r[1], r[2], r[3]) for r in rows}
+    seen = set()
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    scanned_bytes, last_report = 0, 0.0
 
-    for p in rootp.rglob("*"):
+    def report(final=False):
+        nonlocal last_report
+        now = time.monotonic()
+        if progress is not None and (final or now - last_report >= 0.25):
+            last_report = now
+            progress(files=len(seen), bytes=scanned_bytes,
+                     total=len(known) if scopes is None else None, **stats)
+    blobs, upserts, chunks, touches = [], [], [], []
+
+    def flush(force=False):
+        if upserts and (force or len(upserts) >= batch_size):
+            # blob first: ref-count and chunk/FTS triggers read from it
+            cur.executemany("INSERT OR IGNORE INTO blobs(sha, codec, data) VALUES(?,?,?)", blobs)
+            cur.executemany(
+                "DELETE FROM chunks WHERE file_id = (SELECT id FROM files WHERE path=?)",
+                [(u[0],) for u in upserts],
+            )
+            cur.executemany(UPSERT_SQL, upserts)
+            cur.executemany(
+                "INSERT INTO chunks(file_id, sha, start_line, end_line) "
+                "VALUES((SELECT id FROM files WHERE path=?),?,?,?)",
+                chunks,
+            )
+            blobs.clear()
+            upserts.clear()
+            chunks.clear()
+        if touches and (force or len(touches) >= batch_size):
+            cur.executemany("UPDATE files SET mtime=?, size=? WHERE path=?", touches)
+            touches.clear()
+
+    def collect(fut):
         try:
-            if p.is_dir():
-                if p.name in exclude:
-                    # skip deep walking excluded folders
-                    continue
-                continue
+            rel, st, sha, (codec, data), spans = fut.result()
+        except Exception:
+            return
+        old = known.get(rel)
+        if old and old[2] == sha:
+            # touched but identical: refresh stat only, leave content/FTS alone
+            if (old[0], old[1]) != (st.st_mtime, st.st_size):
+                touches.append((st.st_mtime, st.st_size, rel))
+            stats["unchanged"] += 1
+        else:
+            blobs.append((sha, codec, data))
+            upserts.append((rel, st.st_mtime, st.st_size, sha))
+            chunks.extend((rel, sha, a, b) for a, b in spans)
+            stats["changed" if old else "added"] += 1
+        flush()
 
-            rel = str(p.relative_to(rootp))
-            if any(part in exclude for part in p.parts):
-                continue
+    max_inflight = workers * 4
 
-            # only index text-like files
-            if p.suffix.lower() not in {
-                ".py",".js",".ts",".tsx",".json",".md",".txt",".sh",".html",".css",".yml",".yaml",".toml",".ini"
-            }:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        inflight = set()
+        for rel, path, st in targets:
+            if cancel is not None and cancel():
+                stats["cancelled"] = True
+                break
+            # mark before reading: a transient read error must not delete the row
+            seen.add(rel)
+            scanned_bytes += st.st_size
+            report()
+            old = known.get(rel)
+            if old and not full and old[0] == st.st_mtime and old[1] == st.st_size:
+                stats["unchanged"] += 1
                 continue
 
-            st = p.stat()
-            if st.st_size > max_bytes:
-                # too large, index metadata only
-                content = f"[SKIPPED: too large {st.st_size} bytes]"
-                sha = _hash_text(content)
-            else:
-                content = p.read_text(errors="ignore")
-                sha = _hash_text(content)
-
-            cur.execute("""
-            INSERT INTO files(path, mtime, size, sha, content)
-            VALUES(?,?,?,?,?)
-            ON CONFLICT(path) DO UPDATE SET
-              mtime=excluded.mtime,
-              size=excluded.size,
-              sha=excluded.sha,
-              content=excluded.content
-            """, (rel, st.st_mtime, st.st_size, sha, content))
-            count += 1
-        except Exception:
-            continue
+            inflight.add(pool.submit(_read_one, rel, path, st, max_bytes))
+            if len(inflight) >= max_inflight:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    collect(fut)
+
+        for fut in inflight:
+            collect(fut)
+    flush(force=True)
+
+    # a cancelled walk never saw the rest of the tree: don't prune it
+    gone = [] if stats.get("cancelled") else [(path,) for path in known.keys() - seen]
+    if gone:
+        cur.executemany("DELETE FROM files WHERE path=?", gone)
+    stats["removed"] = len(gone)
+    # bodies no path points at anymore
+    cur.execute("DELETE FROM blobs WHERE refs <= 0")
 
     con.commit()
     con.close()
-    return count
+    stats["indexed_files"] = len(seen)
+    report(final=True)
+    return stats
 
-def search(db_path: str, q: str, limit: int = 10):
-    if not Path(db_path).exists():
-        return []
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
+def _fts_query(q: str) -> str:
+    """
+    Turn search box input into a safe FTS5 MATCH expression.
+    - "quoted text" stays a phrase
+    - word* is a prefix query
+    - everything else is ANDed term by term
+    """
+    parts = []
+    for m in re.finditer(r'"([^"]*)"|(\S+)', q):
+        phrase, word = m.group(1), m.group(2)
+        if phrase is not None:
+            phrase = phrase.strip()
+            if phrase:
+                parts.append('"' + phrase.replace('"', '""') + '"')
+            continue
+        prefix = word.endswith("*")
+        word = word.strip("*").replace('"', '""')
+        if word:
+            parts.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(parts)
+
+def _like_search(cur, q: str, limit: int):
     q2 = f"%{q}%"
     cur.execute("""
         SELECT path, substr(content, 1, 1200)
-        FROM files
+        FROM files_text
         WHERE path LIKE ? OR content LIKE ?
         LIMIT ?
     """, (q2, q2, limit))
-    rows = cur.fetchall()
-    con.close()
-    return [{"path": r[0], "snippet": r[1]} for r in rows]
+    return [{"path": r[0], "snippet": r[1]} for r in cur.fetchall()]
+
+def _split_highlight(text: str, first_line: int):
+    """
+    highlight() output with \x01/\x02 markers -> (plain text, matches)
+    where matches are {"line", "start", "end"} (0-based columns).
+    """
+    plain, matches = [], []
+    line, col, open_at = first_line, 0, None
+    for ch in text:
+        if ch == "\x01":
+            open_at = col
+        elif ch == "\x02":
+            if open_at is not None:
+                matches.append({"line": line, "start": open_at, "end": col})
+            open_at = None
+        else:
+            plain.append(ch)
+            if ch == "\n":
+                # a phrase match can wrap; split it per line
+                if open_at is not None:
+                    matches.append({"line": line, "start": open_at, "end": col})
+                    open_at = 0
+                line, col = line + 1, 0
+            else:
+                col += 1
+    return "".join(plain), matches
+
+def _regex_literals(pattern: str):
+    """
+    Literal runs (>= 3 chars) every match of `pattern` must contain.
+    Only top-level literals are used, which is always a safe (superset) filter.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    runs, run = [], []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        runs.append("".join(run))
+        run = []
+    runs.append("".join(run))
+    return [r for r in runs if len(r) >= 3]
+
+def _has_table(cur, name: str) -> bool:
+    return bool(cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+    ).fetchone())
+
+def _grep_search(cur, rx, literals, limit: int):
+    """
+    Zoekt-style code search: trigram postings narrow the candidate chunks
+    (all literals must occur), then `rx` verifies and yields exact offsets.
+    Stops as soon as `limit` chunks with new matches are found.
+    """
+    if literals and _has_table(cur, "chunks_tri"):
+        match = " AND ".join('"' + lit.replace('"', '""') + '"' for lit in literals)
+        rows = cur.execute("""
+            SELECT t.id, t.path, t.text, c.start_line, c.end_line
+            FROM chunks_tri
+            JOIN chunks_text t ON t.id = chunks_tri.rowid
+            JOIN chunks c ON c.id = t.id
+            WHERE chunks_tri MATCH ?
+        """, (match,))
+    else:
+        # no usable literal (or no trigram index): verify every chunk
+        rows = cur.execute("""
+            SELECT t.id, t.path, t.text, c.start_line, c.end_line
+            FROM chunks_text t JOIN chunks c ON c.id = t.id
+        """)
+
+    hits, seen = [], set()
+    for _, path, text, start, end in rows:
+        text = text or ""
+        matches = []
+        line_starts = [0] + [i + 1 for i, ch in enumerate(text) if ch == "\n"]
+        for m in rx.finditer(text):
+            if m.end() == m.start():
+                continue
+            idx = bisect_right(line_starts, m.start()) - 1
+            col = m.start() - line_starts[idx]
+            line_end = text.find("\n", m.start())
+            end_col = (min(m.end(), line_end) if line_end != -1 else m.end()) - line_starts[idx]
+            key = (path, start + idx, col)
+            # chunks overlap: report a match only once
+            if key in seen:
+                continue
+            seen.add(key)
+            matches.append({"line": start + idx, "start": col, "end": end_col})
+        if not matches:
+            continue
+        hits.append({
+            "path": path,
+            "start_line": start,
+            "end_line": end,
+            "score": len(matches),
+            "snippet": text,
+            "matches": matches,
+        })
+        if len(hits) >= limit:
+            break
+    return hits
+
+def search(db_path: str, q: str, limit: int = 10):
+    """
+    Workspace search, three modes picked from the query:
+      re:<pattern>      regex (trigram-narrowed, verified with `re`)
+      code fragment     anything with punctuation, e.g. `_post_json(` or `api/generate`:
+                        literal substring via the trigram index (smart case)
+      words / "phrase"  BM25-ranked FTS (prefix* supported)
+    Every hit is a line range: {path, start_line, end_line, score, snippet, matches}.
+    """
+    if not Path(db_path).exists():
+        return []
+    con = _connect(db_path)
+    cur = con.cursor()
+    try:
+        if q.startswith("re:"):
+            pattern = q[3:]
+            try:
+                rx = re.compile(pattern, re.MULTILINE)
+            except re.error:
+                return []
+            return _grep_search(cur, rx, _regex_literals(pattern), limit)
+        if re.search(r'[^\w\s"*]', q) and len(q.strip()) >= 3:
+            lit = q.strip()
+            # smart case, like rg: lowercase query matches any case
+            rx = re.compile(re.escape(lit), 0 if lit != lit.lower() else re.IGNORECASE)
+            return _grep_search(cur, rx, [lit], limit)
+        return _ranked_search(cur, q, limit)
+    finally:
+        con.close()
+
+def _ranked_search(cur, q: str, limit: int):
+    """
+    Ranked chunk search: BM25 over FTS5 (path weighted above text).
+    Overlapping chunks of the same file are collapsed to the best one.
+    Falls back to LIKE when FTS5 is unavailable or the query has no terms.
+    """
+    match = _fts_query(q)
+    if not _has_table(cur, "chunks_fts") or not match:
+        return _like_search(cur, q, limit)
+    try:
+        cur.execute("""
+            SELECT c.id, c.start_line, c.end_line, ranked.path, ranked.hl, ranked.score
+            FROM (
+                SELECT rowid AS id, path,
+                       highlight(chunks_fts, 1, char(1), char(2)) AS hl,
+                       bm25(chunks_fts, 4.0, 1.0) AS score
+                FROM chunks_fts
+                WHERE chunks_fts MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ) ranked
+            JOIN chunks c ON c.id = ranked.id
+            ORDER BY ranked.score
+        """, (match, limit * 3))
+        rows = cur.fetchall()
+    except sqlite3.OperationalError:
+        return _like_search(cur, q, limit)
+
+    hits, taken = [], {}
+    for _, start, end, path, hl, score in rows:
+        if any(start <= e and s <= end for s, e in taken.get(path, [])):
+            continue
+        taken.setdefault(path, []).append((start, end))
+        text, matches = _split_highlight(hl or "", start)
+        hits.append({
+            "path": path,
+            "start_line": start,
+            "end_line": end,
+            "score": round(-score, 3),
+            "snippet": text,
+            "matches": matches,
+        })
+        if len(hits) >= limit:
+            break
+    return hits
@@ -1,31 +1,76 @@
-import os, json, requests
+import os, json, queue, threading, time
 from typing import Tuple
 
+import http_pool
+from local_model import POOL as MODEL_POOL
+from provider_health import HEALTH
+import response_cache
+from response_cache import RESPONSES
+
+TEMPERATURE = 0.2
+
 def env(k, d=""):
     return os.getenv(k, d)
 
 def ok(provider: str, reply: str):
     return {"ok": True, "provider": provider, "reply": reply}
 
-def fail(provider: str, err: str):
-    return {"ok": False, "provider": provider, "error": err}
+def fail(provider: str, err: str, unconfigured: bool = False):
+    # unconfigured = missing key/model: skipped, not counted as an outage
+    res = {"ok": False, "provider": provider, "error": err}
+    if unconfigured:
+        res["unconfigured"] = True
+    return res
+
+class NotConfigured(RuntimeError):
+    pass
+
+def env_float(k, d):
+    try:
+        return float(env(k, "") or d)
+    except ValueError:
+        return d
+
+# set per thread while a provider runs under AI_DEADLINE / AI_HEDGE:
+# deadline (monotonic) caps socket timeouts, cancel stops a race loser
+_CALL = threading.local()
 
 def post_json(url, headers=None, payload=None, timeout=60):
-    r = requests.post(url, headers=headers or {}, json=payload or {}, timeout=timeout)
-    return r.status_code, r.text
+    deadline = getattr(_CALL, "deadline", None)
+    cancel = getattr(_CALL, "cancel", None)
+    if deadline is not None:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError("deadline exceeded")
+        timeout = min(timeout, left)
+    if cancel is None:
+        r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout)
+        return r.status_code, r.text
+    if cancel.is_set():
+        raise RuntimeError("cancelled")
+    # chunked read: a loser drops out as soon as the race is decided
+    r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout, stream=True)
+    try:
+        body = bytearray()
+        for chunk in r.iter_content(16384):
+            if cancel.is_set():
+                raise RuntimeError("cancelled")
+            body += chunk
+        return r.status_code, body.decode(r.encoding or "utf-8", "replace")
+    finally:
+        r.close()
 
 def local_llama(prompt: str):
     model_path = env("LOCAL_MODEL_PATH","")
     if not model_path:
-        return fail("local", "LOCAL_MODEL_PATH missing")
+        return fail("local", "LOCAL_MODEL_PATH missing", unconfigured=True)
     try:
-        from llama_cpp import Llama
+        import llama_cpp  # noqa: F401  (only checking it is installed)
     except Exception:
-        return fail("local", "llama-cpp-python not installed (optional)")
+        return fail("local", "llama-cpp-python not installed (optional)", unconfigured=True)
     try:
-        llm = Llama(model_path=model_path, n_ctx=4096)
-        out = llm(prompt, max_tokens=512)
-        text = out["choices"][0]["text"].strip()
+        # shared, lazily loaded model (local_model.POOL)
+        text = MODEL_POOL.complete(prompt, max_tokens=512).strip()
         return ok("local", text or "[empty]")
     except Exception as e:
         return fail("local", str(e))
@@ -45,7 +90,7 @@ def ollama(prompt: str):
 def gemini(prompt: str):
     key = env("GEMINI_API_KEY","")
     if not key:
-        return fail("gemini", "GEMINI_API_KEY missing")
+        return fail("gemini", "GEMINI_API_KEY missing", unconfigured=True)
     model = env("GEMINI_MODEL","gemini-1.5-flash")
     try:
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
@@ -62,12 +107,12 @@ def gemini(prompt: str):
 def openai(prompt: str):
     key = env("OPENAI_API_KEY","")
     if not key:
-        return fail("openai", "OPENAI_API_KEY missing")
+        return fail("openai", "OPENAI_API_KEY missing", unconfigured=True)
     model = env("OPENAI_MODEL","gpt-4o-mini")
     try:
         url = "https://api.openai.com/v1/chat/completions"
         headers = {"Authorization": f"Bearer {key}", "Content-Type":"application/json"}
-        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":0.2}
+        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":TEMPERATURE}
         code, txt = post_json(url, headers=headers, payload=payload, timeout=60)
         if code != 200:
             return fail("openai", f"HTTP {code}: {txt[:240]}")
@@ -80,13 +125,13 @@ def openai(prompt: str):
 def deepseek(prompt: str):
     key = env("DEEPSEEK_API_KEY","")
     if not key:
-        return fail("deepseek", "DEEPSEEK_API_KEY missing")
+        return fail("deepseek", "DEEPSEEK_API_KEY missing", unconfigured=True)
     model = env("DEEPSEEK_MODEL","deepseek-chat")
     base = env("DEEPSEEK_BASE_URL","https://api.deepseek.com").rstrip("/")
     try:
         url = f"{base}/v1/chat/completions"
         headers = {"Authorization": f"Bearer {key}", "Content-Type":"application/json"}
-        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":0.2}
+        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":TEMPERATURE}
         code, txt = post_json(url, headers=headers, payload=payload, timeout=60)
         if code != 200:
             return fail("deepseek", f"HTTP {code}: {txt[:240]}")
@@ -99,13 +144,13 @@ def deepseek(prompt: str):
 def xai(prompt: str):
     key = env("XAI_API_KEY","")
     if not key:
-        return fail("xai", "XAI_API_KEY missing")
+        return fail("xai", "XAI_API_KEY missing", unconfigured=True)
     model = env("XAI_MODEL","grok-2-latest")
     base = env("XAI_BASE_URL","https://api.x.ai/v1").rstrip("/")
     try:
         url = f"{base}/chat/completions"
         headers = {"Authorization": f"Bearer {key}", "Content-Type":"application/json"}
-        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":0.2}
+        payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":TEMPERATURE}
         code, txt = post_json(url, headers=headers, payload=payload, timeout=60)
         if code != 200:
             return fail("xai", f"HTTP {code}: {txt[:240]}")
@@ -115,7 +160,15 @@ def xai(prompt: str):
     except Exception as e:
         return fail("xai", str(e))
 
-def fallback(prompt: str):
+def fallback(prompt: str, ctx=None):
+    if ctx:
+        # offline, but retrieval already found the relevant code
+        lines = ["FlashTM8 Ultimate (offline) - closest workspace matches:\n"]
+        for i, c in enumerate(ctx[:8], 1):
+            lines.append(f"{i}) {c.get('path')}:{c.get('start_line')}-{c.get('end_line')} (score={c.get('score')})")
+            lines.append((c.get("snippet") or "").strip()[:800])
+            lines.append("")
+        return ok("fallback", "\n".join(lines))
     return ok(
         "fallback",
         "FlashTM8 Ultimate is running ✅\n"
@@ -123,32 +176,296 @@ def fallback(prompt: str):
         "Try: Index Workspace → Search 'run.sh' → Ask how to start bots."
     )
 
-def generate_reply(prompt: str) -> Tuple[str, dict]:
-    mode = env("AI_PROVIDER","auto").strip().lower()
+def stream_lines(url, headers=None, payload=None, timeout=60):
+    # streamed POST -> non-empty text lines as they arrive
+    r = http_pool.post(url, headers=headers or {}, json=payload or {}, timeout=timeout, stream=True)
+    try:
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.text[:240]}")
+        for line in r.iter_lines():
+            if line:
+                yield line.decode("utf-8", "replace")
+    finally:
+        r.close()
+
+def stream_ollama(prompt: str):
+    base = env("OLLAMA_BASE_URL","http://127.0.0.1:11434").rstrip("/")
+    model = env("OLLAMA_MODEL","llama3")
+    for line in stream_lines(f"{base}/api/generate", payload={"model": model, "prompt": prompt, "stream": True}, timeout=60):
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        if data.get("response"):
+            yield data["response"]
+        if data.get("done"):
+            return
+
+def stream_chat_completions(url, key, model, prompt):
+    # OpenAI-compatible SSE: data: {choices[0].delta.content} ... data: [DONE]
+    headers = {"Authorization": f"Bearer {key}", "Content-Type":"application/json"}
+    payload = {"model": model, "messages":[{"role":"user","content":prompt}], "temperature":TEMPERATURE, "stream": True}
+    for line in stream_lines(url, headers=headers, payload=payload, timeout=60):
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        choices = json.loads(data).get("choices") or [{}]
+        text = (choices[0].get("delta") or {}).get("content")
+        if text:
+            yield text
+
+def stream_openai(prompt: str):
+    key = env("OPENAI_API_KEY","")
+    if not key:
+        raise NotConfigured("OPENAI_API_KEY missing")
+    yield from stream_chat_completions("https://api.openai.com/v1/chat/completions", key, env("OPENAI_MODEL","gpt-4o-mini"), prompt)
+
+def stream_deepseek(prompt: str):
+    key = env("DEEPSEEK_API_KEY","")
+    if not key:
+        raise NotConfigured("DEEPSEEK_API_KEY missing")
+    base = env("DEEPSEEK_BASE_URL","https://api.deepseek.com").rstrip("/")
+    yield from stream_chat_completions(f"{base}/v1/chat/completions", key, env("DEEPSEEK_MODEL","deepseek-chat"), prompt)
+
+def stream_xai(prompt: str):
+    key = env("XAI_API_KEY","")
+    if not key:
+        raise NotConfigured("XAI_API_KEY missing")
+    base = env("XAI_BASE_URL","https://api.x.ai/v1").rstrip("/")
+    yield from stream_chat_completions(f"{base}/chat/completions", key, env("XAI_MODEL","grok-2-latest"), prompt)
+
+# token-streaming twins; providers not listed answer in one piece
+STREAMERS = {
+    ollama: ("ollama", stream_ollama),
+    openai: ("openai", stream_openai),
+    deepseek: ("deepseek", stream_deepseek),
+    xai: ("xai", stream_xai),
+}
+
+NAMES = {local_llama: "local", ollama: "ollama", gemini: "gemini", openai: "openai", xai: "xai", deepseek: "deepseek"}
+
+def call(fn, prompt: str):
+    # one provider call through its circuit breaker (provider_health)
+    return HEALTH.call(NAMES[fn], fn, prompt)
+
+def probe_get(url, headers=None):
+    r = http_pool.get(url, headers=headers or {}, timeout=5)
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP {r.status_code}")
+
+def bearer(key_env):
+    return {"Authorization": f"Bearer {env(key_env,'')}"}
 
-    chain = []
+# cheap reachability checks for the prober: model lists, no tokens spent
+PROBES = {
+    "local": lambda: os.path.exists(env("LOCAL_MODEL_PATH","")),
+    "ollama": lambda: probe_get(env("OLLAMA_BASE_URL","http://127.0.0.1:11434").rstrip("/") + "/api/tags"),
+    "gemini": lambda: probe_get("https://generativelanguage.googleapis.com/v1beta/models?key=" + env("GEMINI_API_KEY","")),
+    "openai": lambda: probe_get("https://api.openai.com/v1/models", bearer("OPENAI_API_KEY")),
+    "xai": lambda: probe_get(env("XAI_BASE_URL","https://api.x.ai/v1").rstrip("/") + "/models", bearer("XAI_API_KEY")),
+    "deepseek": lambda: probe_get(env("DEEPSEEK_BASE_URL","https://api.deepseek.com").rstrip("/") + "/v1/models", bearer("DEEPSEEK_API_KEY")),
+}
+
+def start_health_prober():
+    HEALTH.start_prober(PROBES)
+
+def chain_for(mode: str):
     if mode == "auto":
-        chain = [local_llama, ollama, gemini, openai, xai, deepseek, fallback]
-    elif mode == "local":
-        chain = [local_llama, fallback]
-    elif mode == "ollama":
-        chain = [ollama, fallback]
-    elif mode == "gemini":
-        chain = [gemini, fallback]
-    elif mode == "openai":
-        chain = [openai, fallback]
-    elif mode == "xai":
-        chain = [xai, fallback]
-    elif mode == "deepseek":
-        chain = [deepseek, fallback]
-    else:
-        chain = [fallback]
+        return [local_llama, ollama, gemini, openai, xai, deepseek, fallback]
+    if mode == "local":
+        return [local_llama, fallback]
+    if mode == "ollama":
+        return [ollama, fallback]
+    if mode == "gemini":
+        return [gemini, fallback]
+    if mode == "openai":
+        return [openai, fallback]
+    if mode == "xai":
+        return [xai, fallback]
+    if mode == "deepseek":
+        return [deepseek, fallback]
+    return [fallback]
+
+def hedged(chain, prompt: str, ctx, deadline: float):
+    # AI_HEDGE=1: start the first provider, add the next every AI_HEDGE_DELAY s
+    # (or right away when one fails), first good answer wins. Losers see the
+    # cancel flag between body chunks; local llama can't be interrupted and
+    # finishes in the background.
+    delay = max(0.0, env_float("AI_HEDGE_DELAY", 2.0))
+    racers = [fn for fn in chain if fn is not fallback]
+    cancel = threading.Event()
+    results = queue.Queue()
+
+    def run(fn):
+        def attempt(p):
+            res = fn(p)
+            if not res.get("ok") and cancel.is_set():
+                res["cancelled"] = True   # lost the race, not a health signal
+            return res
+        _CALL.deadline, _CALL.cancel = deadline, cancel
+        try:
+            res = HEALTH.call(NAMES[fn], attempt, prompt)
+        finally:
+            _CALL.deadline = _CALL.cancel = None
+        results.put(res)
+
+    started, pending = 0, 0
+    next_start = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if started < len(racers) and (pending == 0 or now >= next_start):
+                threading.Thread(target=run, args=(racers[started],), name="hedge", daemon=True).start()
+                started += 1
+                pending += 1
+                next_start = now + delay
+                continue
+            if pending == 0:
+                break
+            wait = deadline - now
+            if started < len(racers):
+                wait = min(wait, next_start - now)
+            try:
+                res = results.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                continue
+            pending -= 1
+            if res.get("ok"):
+                return res.get("provider","unknown"), res
+            next_start = time.monotonic()
+    finally:
+        cancel.set()
+    return "fallback", fallback(prompt, ctx)
+
+def generate_uncached(prompt: str, ctx=None) -> Tuple[str, dict]:
+    # prompt already carries any packed context; ctx is only for the offline fallback
+    # AI_DEADLINE=s bounds the whole walk (each timeout is cut to what's left);
+    # AI_HEDGE=1 in auto mode races providers instead (hedged);
+    # providers with an open circuit breaker are skipped (provider_health)
+    mode = env("AI_PROVIDER","auto").strip().lower()
+    chain = chain_for(mode)
+    hedge = mode == "auto" and env("AI_HEDGE","0").lower() in ("1","true","yes","on")
+    budget = env_float("AI_DEADLINE", 30.0 if hedge else 0.0)
+    deadline = time.monotonic() + budget if budget > 0 else None
+
+    if hedge:
+        return hedged(chain, prompt, ctx, deadline or time.monotonic() + 30.0)
 
     last = None
     for fn in chain:
-        res = fn(prompt)
+        if fn is fallback:
+            res = fn(prompt, ctx)
+        elif deadline is not None and time.monotonic() >= deadline:
+            continue
+        else:
+            _CALL.deadline = deadline
+            try:
+                res = call(fn, prompt)
+            finally:
+                _CALL.deadline = None
         last = res
         if res.get("ok"):
             return res.get("provider","unknown"), res
 
-    return "fallback", last or fallback(prompt)
+    return "fallback", last or fallback(prompt, ctx)
+
+def stream_uncached(prompt: str, ctx=None):
+    """
+    Streaming generate_reply: yields ("provider", name), ("token", text)...,
+    ("done", name) - or ("error", msg). Failing before the first token moves on
+    to the next provider; after that a failure ends the stream with an error.
+    """
+    errors = []
+    for fn in chain_for(env("AI_PROVIDER","auto").strip().lower()):
+        if fn in STREAMERS:
+            name, stream = STREAMERS[fn]
+            br = HEALTH.get(name)
+            if not br.allow():
+                errors.append(f"{name}: circuit open")
+                continue
+            t0 = time.monotonic()
+            verdict = None   # (ok, error, configured) once known
+            it = stream(prompt)
+            try:
+                try:
+                    first = next(it)
+                except StopIteration:
+                    verdict = (False, "[empty]", True)
+                    errors.append(f"{name}: [empty]")
+                    continue
+                except Exception as e:
+                    verdict = (False, str(e), not isinstance(e, NotConfigured))
+                    errors.append(f"{name}: {e}")
+                    continue
+                yield "provider", name
+                yield "token", first
+                try:
+                    for text in it:
+                        yield "token", text
+                except Exception as e:
+                    verdict = (False, str(e), True)
+                    yield "error", f"{name}: {e}"
+                    return
+                verdict = (True, None, True)
+                yield "done", name
+                return
+            finally:
+                it.close()   # closes the upstream response if the client left
+                if verdict is None:
+                    br.record(None)
+                else:
+                    br.record(verdict[0], (time.monotonic() - t0) * 1000, verdict[1], configured=verdict[2])
+
+        res = fn(prompt, ctx) if fn is fallback else call(fn, prompt)
+        if res.get("ok"):
+            yield "provider", res["provider"]
+            yield "token", res.get("reply","")
+            yield "done", res["provider"]
+            return
+        errors.append(f"{res.get('provider')}: {res.get('error')}")
+
+    yield "error", "; ".join(errors) or "no provider"
+
+def cache_key(prompt: str, ctx) -> str:
+    return response_cache.make_key(
+        prompt,
+        mode=env("AI_PROVIDER","auto").strip().lower(),
+        models=[env(k) for k in ("LOCAL_MODEL_PATH","OLLAMA_MODEL","GEMINI_MODEL","OPENAI_MODEL","XAI_MODEL","DEEPSEEK_MODEL")],
+        temperature=TEMPERATURE,
+        ctx=response_cache.context_hash(ctx),
+    )
+
+def generate_reply(prompt: str, ctx=None, use_cache: bool = True) -> Tuple[str, dict]:
+    # persistent response cache in front of the chain; use_cache=False bypasses it
+    key = cache_key(prompt, ctx) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            res = ok(hit["provider"], hit["reply"])
+            res.update(cached=True, age=hit["age"])
+            return hit["provider"], res
+    provider, res = generate_uncached(prompt, ctx)
+    if key and res.get("ok") and provider != "fallback":
+        RESPONSES.put(key, provider, res.get("reply",""))
+    return provider, res
+
+def generate_reply_stream(prompt: str, ctx=None, use_cache: bool = True):
+    # same cache for the token stream: a hit arrives as a single token
+    key = cache_key(prompt, ctx) if use_cache and response_cache.enabled() else None
+    if key:
+        hit = RESPONSES.get(key)
+        if hit:
+            yield "provider", hit["provider"]
+            yield "token", hit["reply"]
+            yield "done", hit["provider"]
+            return
+    parts = []
+    for kind, value in stream_uncached(prompt, ctx):
+        if kind == "token":
+            parts.append(value)
+        elif kind == "done" and key and value != "fallback":
+            RESPONSES.put(key, value, "".join(parts).strip())
+        yield kind, value
@@ -1,11 +1,18 @@
-import os
+import os, json
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, send_file
 from dotenv import load_dotenv
 
-from workspace_index import index_workspace, search as search_index
-from ai_providers import generate_reply
-from tools import safe_exec, safe_write, safe_read
+from workspace_index import index_workspace, index_paths, search as search_index, DEFAULT_EXCLUDES, TEXT_EXTS
+from ai_providers import generate_reply, generate_reply_stream, start_health_prober
+from tools import safe_exec, safe_write, safe_read, resolve_read
+from watcher import WorkspaceWatcher, watch_enabled
+import retrieval
+from jobs import JobManager, sse_events
+from local_model import POOL as MODEL_POOL, warm_enabled
+from content_cache import CACHE, invalidate_paths
+from provider_health import HEALTH
+from response_cache import RESPONSES
 
 HERE = Path(__file__).resolve().parent
 APPROOT = HERE.parent
@@ -21,7 +28,33 @@ def mask(v: str):
     if len(v) <= 8: return "****"
     return v[:4] + "…" + v[-4:]
 
+WATCHER = None
+JOBS = JobManager()
+
+def start_watcher():
+    # WATCH_ENABLED=1: re-index touched files in the background, one watcher per process
+    global WATCHER
+    if WATCHER is None and watch_enabled():
+        root = env("WORKSPACE_ROOT", str(Path.cwd()))
+        db = env("INDEX_DB_PATH", str(APPROOT/"runtime/index.db"))
+        maxb = int(env("MAX_FILE_BYTES","250000"))
+        WATCHER = WorkspaceWatcher.from_env(
+            root,
+            lambda rels: (
+                invalidate_paths(root, rels),
+                index_paths(root, db, rels, maxb),
+                retrieval.schedule_build(db),
+            ),
+            exclude=DEFAULT_EXCLUDES,
+            exts=TEXT_EXTS,
+        ).start()
+    return WATCHER
+
 def create_app():
+    start_watcher()
+    if warm_enabled():
+        MODEL_POOL.warm()
+    start_health_prober()
     app = Flask(__name__, template_folder=str(HERE/"templates"), static_folder=str(HERE/"static"))
 
     @app.get("/")
@@ -30,12 +63,19 @@ def create_app():
 
     @app.get("/api/health")
     def health():
+        job = JOBS.running("index")
         return jsonify({
             "ok": True,
             "provider": env("AI_PROVIDER","auto"),
             "workspace_root": env("WORKSPACE_ROOT",""),
             "exec": env("EXEC_ENABLED","0"),
             "write": env("WRITE_ENABLED","0"),
+            "watcher": WATCHER.status() if WATCHER else None,
+            "index_job": job.snapshot() if job else None,
+            "cache": CACHE.stats(),
+            "local_model": MODEL_POOL.status(),
+            "providers": HEALTH.snapshot(),
+            "response_cache": RESPONSES.stats(),
         })
 
     @app.post("/api/index")
@@ -43,8 +83,50 @@ def create_app():
         root = env("WORKSPACE_ROOT", str(Path.cwd()))
         db = env("INDEX_DB_PATH", str(APPROOT/"runtime/index.db"))
         maxb = int(env("MAX_FILE_BYTES","250000"))
-        count = index_workspace(root, db, maxb)
-        return jsonify({"ok": True, "indexed_files": count, "db": db})
+        data = request.get_json(silent=True) or {}
+        full = bool(data.get("full", False))
+
+        # runs in the background: 202 + job, 409 if one is running, {"wait": true} blocks
+        def run(job):
+            stats = index_workspace(root, db, maxb, full=full, progress=job.update, cancel=job.cancelled)
+            # a no-op pass leaves the chunks as they were: only build if the vectors are missing
+            touched = any(stats.get(k) for k in ("added", "changed", "removed"))
+            if not job.cancelled() and (touched or not retrieval.vectors_path(db).exists()):
+                stats["vectors"] = retrieval.build_vectors(db)
+            return stats
+
+        job, created = JOBS.submit("index", run)
+        if data.get("wait"):
+            version = job.version
+            while not job.done:
+                version = job.wait_change(version)
+            return jsonify({"ok": job.status == "done", **(job.result or {}), "db": db, "job": job.snapshot()})
+        if not created:
+            return jsonify({"ok": False, "error":"an index job is already running", "job": job.snapshot()}), 409
+        return jsonify({"ok": True, "job": job.snapshot(), "db": db}), 202
+
+    @app.get("/api/index/jobs")
+    def api_index_jobs():
+        return jsonify({"ok": True, "jobs": JOBS.list()})
+
+    @app.get("/api/index/jobs/<job_id>")
+    def api_index_job(job_id):
+        job = JOBS.get(job_id)
+        if job is None:
+            return jsonify({"ok": False, "error":"unknown job"}), 404
+        return jsonify({"ok": True, "job": job.snapshot()})
+
+    @app.get("/api/index/jobs/<job_id>/events")
+    def api_index_job_events(job_id):
+        job = JOBS.get(job_id)
+        if job is None:
+            return jsonify({"ok": False, "error":"unknown job"}), 404
+        return Response(sse_events(job), mimetype="text/event-stream",
+                        headers={"Cache-Control":"no-cache", "X-Accel-Buffering":"no"})
+
+    @app.post("/api/index/jobs/<job_id>/cancel")
+    def api_index_job_cancel(job_id):
+        return jsonify({"ok": JOBS.cancel(job_id)})
 
     @app.post("/api/search")
     def api_search():
@@ -55,20 +137,63 @@ def create_app():
         hits = search_index(db, q, limit=12)
         return jsonify({"ok": True, "hits": hits})
 
+    @app.post("/api/semantic")
+    def api_semantic():
+        data = request.get_json(silent=True) or {}
+        q = (data.get("q") or "").strip()
+        if not q:
+            return jsonify({"ok": False, "error":"missing q"}), 400
+        db = env("INDEX_DB_PATH", str(APPROOT/"runtime/index.db"))
+        k = max(1, min(int(data.get("k") or 8), 50))
+        return jsonify({"ok": True, "hits": retrieval.semantic_search(db, q, k)})
+
     @app.post("/api/chat")
     def api_chat():
-        msg = (request.json or {}).get("message","").strip()
+        data = request.json or {}
+        msg = (data.get("message") or "").strip()
         if not msg:
             return jsonify({"ok": False, "error":"missing message"}), 400
 
-        provider, res = generate_reply(msg)
+        ctx = []
+        if retrieval.enabled() and data.get("context", True):
+            db = env("INDEX_DB_PATH", str(APPROOT/"runtime/index.db"))
+            ctx = retrieval.build_context(db, msg)
+        # "cache": false forces a fresh answer
+        provider, res = generate_reply(retrieval.pack_prompt(msg, ctx), ctx, use_cache=data.get("cache", True))
         if isinstance(res, str):
             res = {"ok": True, "provider": provider, "reply": res}
 
         if not res.get("ok"):
             return jsonify({"ok": False, "provider": provider, "error": res.get("error","unknown")})
 
-        return jsonify({"ok": True, "provider": provider, "reply": res.get("reply","")})
+        return jsonify({
+            "ok": True, "provider": provider, "reply": res.get("reply",""), "cached": bool(res.get("cached")),
+            "context": [{k: c[k] for k in ("path","start_line","end_line","score")} for c in ctx],
+        })
+
+    @app.post("/api/chat/stream")
+    def api_chat_stream():
+        # SSE: meta (retrieved context), provider, token..., done | error
+        data = request.get_json(silent=True) or {}
+        msg = (data.get("message") or "").strip()
+        if not msg:
+            return jsonify({"ok": False, "error":"missing message"}), 400
+
+        ctx = []
+        if retrieval.enabled() and data.get("context", True):
+            db = env("INDEX_DB_PATH", str(APPROOT/"runtime/index.db"))
+            ctx = retrieval.build_context(db, msg)
+        prompt = retrieval.pack_prompt(msg, ctx)
+
+        def events():
+            meta = [{k: c[k] for k in ("path","start_line","end_line","score")} for c in ctx]
+            yield f"event: meta\ndata: {json.dumps({'context': meta})}\n\n"
+            for kind, value in generate_reply_stream(prompt, ctx, use_cache=data.get("cache", True)):
+                key = "text" if kind == "token" else ("error" if kind == "error" else "provider")
+                yield f"event: {kind}\ndata: {json.dumps({key: value})}\n\n"
+
+        return Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control":"no-cache", "X-Accel-Buffering":"no"})
 
     @app.get("/api/config")
     def api_config():
@@ -128,9 +253,26 @@ def create_app():
 
     @app.post("/api/read")
     def api_read():
-        p = (request.json or {}).get("path","").strip()
+        data = request.json or {}
+        p = data.get("path","").strip()
+        root = env("WORKSPACE_ROOT", str(Path.cwd()))
+        try:
+            offset = max(0, int(data.get("offset") or 0))
+            length = max(1, min(int(data.get("length") or 20000), 4 << 20))
+            line = int(data["line"]) if data.get("line") is not None else None
+            lines = max(1, min(int(data.get("lines") or 200), 5000))
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error":"bad offset/length/line"}), 400
+        return jsonify(safe_read(p, root, offset, length, line, lines))
+
+    @app.get("/api/raw")
+    def api_raw():
+        # werkzeug answers Range requests (206/416) from the open file, no full read
         root = env("WORKSPACE_ROOT", str(Path.cwd()))
-        return jsonify(safe_read(p, root))
+        p = resolve_read(request.args.get("path",""), root)
+        if p is None:
+            return jsonify({"ok": False, "error":"File not found"}), 404
+        return send_file(p, mimetype="application/octet-stream", conditional=True)
 
     @app.post("/api/exec")
     def api_exec():
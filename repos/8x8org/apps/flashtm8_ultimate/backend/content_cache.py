@@ -0,0 +1,110 @@
+"""
+Process-wide LRU cache for file / blob contents, bounded by bytes.
+
+Keys carry their own validity, so a changed file simply misses:
+  (abs_path, mtime_ns, size)   file bodies read from disk
+  ("blob", sha)                content-addressed index blobs (split into lines)
+invalidate(path) drops every cached version of a path right away (indexer /
+watcher), so stale versions don't sit in the budget until they age out.
+
+Env: CONTENT_CACHE_MB=64 (0 disables), CONTENT_CACHE_FILE_MAX=1048576
+(larger files are never cached whole; ranged reads go to mmap instead).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+def _env_int(k: str, d: int) -> int:
+    try:
+        return max(0, int(os.getenv(k, "") or d))
+    except ValueError:
+        return d
+
+class ContentCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # key -> (value, nbytes)
+        self._by_path = {}            # path -> {keys}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes: int):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            self._by_path.setdefault(key[0], set()).add(key)
+            while self._bytes > self.max_bytes and self._items:
+                k, (_, n) = self._items.popitem(last=False)
+                self._bytes -= n
+                self._unlink(k)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, size_of=len):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value, size_of(value))
+        return value
+
+    def _unlink(self, key):
+        keys = self._by_path.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_path[key[0]]
+
+    def invalidate(self, path: str) -> int:
+        with self._lock:
+            keys = self._by_path.pop(path, ())
+            for k in keys:
+                _, n = self._items.pop(k)
+                self._bytes -= n
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._by_path.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+CACHE = ContentCache(_env_int("CONTENT_CACHE_MB", 64) << 20)
+FILE_MAX = _env_int("CONTENT_CACHE_FILE_MAX", 1 << 20)
+
+def file_key(path: str, st) -> tuple:
+    return (path, st.st_mtime_ns, st.st_size)
+
+def invalidate_paths(root: str, rel_paths) -> int:
+    """Drop cached bodies of workspace-relative paths (watcher batches)."""
+    base = os.path.realpath(root)
+    return sum(CACHE.invalidate(os.path.join(base, rel)) for rel in rel_paths)
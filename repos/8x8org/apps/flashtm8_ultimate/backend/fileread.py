@@ -0,0 +1,138 @@
+"""
+Ranged reads for big files (logs, bundles) without loading them whole.
+
+- read_range(): a byte window; small files come whole from the shared LRU
+  (content_cache), big ones through mmap
+- read_lines(): a line page; a sparse line-offset index (every LINE_STRIDE-th
+  line start) is built once per (path, mtime, size) and cached, so
+  "lines 500000-500100" seeks straight to a checkpoint instead of rescanning
+- parse_range(): single `bytes=a-b` / `bytes=a-` / `bytes=-n` HTTP Range header
+"""
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Optional, Tuple
+
+from content_cache import CACHE, FILE_MAX, file_key
+
+LINE_STRIDE = 64          # one checkpoint per this many lines (8 bytes each)
+SCAN_BLOCK = 4 << 20      # index build reads the file in blocks of this size
+CACHE_FILES = 16          # line indexes kept (LRU)
+
+_INDEX = OrderedDict()
+_LOCK = threading.Lock()
+
+def _map(f, size: int):
+    # mmap can't map empty files
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+def _read_all(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def read_range(path: str, offset: int = 0, length: int = 200_000) -> Tuple[bytes, int]:
+    """(bytes in [offset, offset+length), file size)."""
+    st = os.stat(path)
+    size = st.st_size
+    offset = max(0, min(offset, size))
+    end = min(size, offset + max(0, length))
+    if size <= FILE_MAX:
+        data = CACHE.get_or_load(file_key(path, st), lambda: _read_all(path))
+        return data[offset:end], size
+    with open(path, "rb") as f:
+        mm = _map(f, size)
+        if mm is None:
+            return b"", size
+        try:
+            return mm[offset:end], size
+        finally:
+            mm.close()
+
+def line_index(path: str):
+    """(checkpoints, total_lines, size): checkpoints[k] = byte offset of line k*LINE_STRIDE (0-based)."""
+    st = os.stat(path)
+    key = file_key(path, st)
+    with _LOCK:
+        hit = _INDEX.get(key)
+        if hit is not None:
+            _INDEX.move_to_end(key)
+            return hit
+
+    marks = array("Q", [0])
+    lines, pos, line_start = 0, 0, 0
+    with open(path, "rb") as f:
+        mm = _map(f, st.st_size)
+        try:
+            while mm is not None and pos < st.st_size:
+                block = mm[pos:pos + SCAN_BLOCK]
+                # line lengths (incl. newline) of the complete lines in this block
+                parts = block.split(b"\n")
+                if len(parts) > 1:
+                    ends = list(accumulate(len(p) + 1 for p in parts[:-1]))
+                    # ends[i] is where line lines+i+1 starts: keep those divisible by the stride
+                    for k in range((-(lines + 1)) % LINE_STRIDE, len(ends), LINE_STRIDE):
+                        if pos + ends[k] < st.st_size:
+                            marks.append(pos + ends[k])
+                    lines += len(ends)
+                    pos += ends[-1]
+                    line_start = pos
+                else:
+                    pos += len(block)
+                if len(block) < SCAN_BLOCK:
+                    break
+        finally:
+            if mm is not None:
+                mm.close()
+    # a last line without trailing newline still counts
+    total = lines + (1 if line_start < st.st_size else 0)
+    res = (marks, total, st.st_size)
+    with _LOCK:
+        _INDEX[key] = res
+        while len(_INDEX) > CACHE_FILES:
+            _INDEX.popitem(last=False)
+    return res
+
+def read_lines(path: str, start_line: int = 1, count: int = 200, max_bytes: int = 1 << 20):
+    """
+    Lines [start_line, start_line+count) (1-based) -> (text, total_lines).
+    Seeks to the nearest checkpoint and skips < LINE_STRIDE lines from there.
+    """
+    marks, total, size = line_index(path)
+    first = max(0, start_line - 1)
+    if first >= total or count <= 0:
+        return "", total
+    cp = min(first // LINE_STRIDE, len(marks) - 1)
+    out = []
+    with open(path, "rb") as f:
+        f.seek(marks[cp])
+        for _ in range(first - cp * LINE_STRIDE):
+            f.readline()
+        used = 0
+        for _ in range(count):
+            line = f.readline(max_bytes - used)
+            if not line:
+                break
+            out.append(line)
+            used += len(line)
+            if used >= max_bytes:
+                break
+    return b"".join(out).decode("utf-8", "ignore"), total
+
+def parse_range(header: Optional[str], size: int):
+    """(start, end_inclusive) for a single-range header, None if absent, ValueError if unsatisfiable."""
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[6:].split(",")[0].strip()
+    a, _, b = spec.partition("-")
+    if a:
+        start = int(a)
+        end = min(int(b), size - 1) if b else size - 1
+    else:
+        n = int(b)
+        start, end = max(0, size - n), size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
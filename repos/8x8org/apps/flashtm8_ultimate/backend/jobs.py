@@ -0,0 +1,146 @@
+"""
+Background jobs (workspace indexing) so HTTP workers stay free.
+
+- one job per kind at a time: submitting while one runs returns the running job
+- progress(files=, bytes=, total=, ...) updates rate / ETA and wakes SSE readers
+- cancel() is cooperative: the job function polls job.cancelled()
+- the last few finished jobs are kept for status lookups
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+KEEP_FINISHED = 20
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.version = 0
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def update(self, **counts):
+        elapsed = max(time.time() - (self.started or self.created), 1e-6)
+        files, total = counts.get("files", 0), counts.get("total")
+        rate = files / elapsed
+        counts["rate"] = round(rate, 1)
+        counts["bytes_rate"] = round(counts.get("bytes", 0) / elapsed)
+        # total is an estimate (last run's file count); no ETA once we're past it
+        counts["eta"] = round((total - files) / rate, 1) if total and rate and total > files else None
+        with self._cond:
+            self.progress = counts
+            self.version += 1
+            self._cond.notify_all()
+
+    def _finish(self, status: str, result=None, error=None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait_change(self, version: int, timeout: float = 15.0) -> int:
+        """Block until the job moved past `version` (or timeout); returns the current version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def snapshot(self) -> dict:
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "elapsed": round(end - self.started, 2) if self.started else 0,
+        }
+
+class JobManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def running(self, kind: str):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and not job.done:
+                    return job
+        return None
+
+    def submit(self, kind: str, fn):
+        """
+        Start fn(job) in a daemon thread. Returns (job, created); created is False
+        when a job of the same kind is already running (that job is returned).
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and not job.done:
+                    return job, False
+            job = Job(kind)
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.done]
+            for old in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+                self._jobs.pop(old.id, None)
+
+        def run():
+            job.started = time.time()
+            job.status = "running"
+            try:
+                res = fn(job)
+            except Exception as e:
+                job._finish("failed", error=str(e))
+                return
+            job._finish("cancelled" if job.cancelled() else "done", result=res)
+
+        threading.Thread(target=run, name=f"job-{kind}-{job.id}", daemon=True).start()
+        return job, True
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancel.set()
+        return True
+
+    def list(self) -> list:
+        with self._lock:
+            return [j.snapshot() for j in reversed(self._jobs.values())]
+
+def sse_events(job: Job, heartbeat: float = 15.0):
+    """Server-sent events for one job: a `progress` event per change, then `end`."""
+    version = -1
+    while True:
+        seen = job.wait_change(version, heartbeat)
+        if seen == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = seen
+        event = "end" if job.done else "progress"
+        yield f"event: {event}\ndata: {json.dumps(job.snapshot())}\n\n"
+        if job.done:
+            return
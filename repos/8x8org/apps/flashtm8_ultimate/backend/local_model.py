@@ -0,0 +1,176 @@
+"""
+Process-wide llama.cpp model manager (the "local" provider).
+
+- lazy: the GGUF is loaded on first use, not per chat message
+- LOCAL_MODEL_WARM=1 loads it in the background at startup
+- LOCAL_MODEL_POOL contexts (default 1) are checked out one request at a time;
+  extra requests wait up to LOCAL_MODEL_WAIT seconds for a free one
+- unloaded after LOCAL_MODEL_IDLE_TTL idle seconds (default 600, 0 = keep)
+- changing LOCAL_MODEL_PATH / LOCAL_MODEL_CTX (e.g. from /api/config)
+  retires the old instances and loads the new model on the next request
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+def _env_int(k: str, d: int) -> int:
+    try:
+        return int(os.getenv(k, "") or d)
+    except ValueError:
+        return d
+
+class ModelPool:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._free = []          # idle (generation, llm), most recently used last
+        self._config = None
+        self._gen = 0            # bumped when the wanted model/settings change
+        self._created = 0        # live instances, busy or idle
+        self._in_use = 0
+        self._last_used = 0.0
+        self._reaper = None
+        self.loads = 0
+        self.load_seconds = None
+        self.last_error = None
+
+    def _wanted(self):
+        return (
+            os.getenv("LOCAL_MODEL_PATH", ""),
+            _env_int("LOCAL_MODEL_CTX", 4096),
+            _env_int("LOCAL_MODEL_THREADS", 0) or None,
+        )
+
+    def _load(self, config):
+        from llama_cpp import Llama
+        path, n_ctx, n_threads = config
+        t0 = time.monotonic()
+        llm = Llama(model_path=path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        self.load_seconds = round(time.monotonic() - t0, 2)
+        self.loads += 1
+        return llm
+
+    def _close(self, llm):
+        """Drop one instance (caller holds the lock)."""
+        self._created -= 1
+        close = getattr(llm, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+        self._cond.notify_all()
+
+    def _drain(self):
+        while self._free:
+            self._close(self._free.pop()[1])
+
+    @contextmanager
+    def acquire(self):
+        config = self._wanted()
+        deadline = time.monotonic() + _env_int("LOCAL_MODEL_WAIT", 120)
+        item, create = None, False
+        with self._cond:
+            if config != self._config:
+                # new model/settings: idle instances go now, busy ones on release
+                self._drain()
+                self._config = config
+                self._gen += 1
+            gen = self._gen
+            while True:
+                if self._free:
+                    item = self._free.pop()
+                    break
+                if self._created < max(1, _env_int("LOCAL_MODEL_POOL", 1)):
+                    self._created += 1
+                    create = True
+                    break
+                if self._gen != gen:
+                    # settings changed while we waited: follow them
+                    gen, config = self._gen, self._config
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("local model busy")
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        try:
+            if create:
+                try:
+                    item = (gen, self._load(config))
+                except BaseException:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify_all()
+                    raise
+                self._start_reaper()
+            yield item[1]
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._last_used = time.monotonic()
+                if item is not None:
+                    if item[0] == self._gen:
+                        self._free.append(item)
+                        self._cond.notify_all()
+                    else:
+                        self._close(item[1])
+
+    def complete(self, prompt: str, **kw) -> str:
+        try:
+            with self.acquire() as llm:
+                out = llm(prompt, **kw)
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        self.last_error = None
+        return out["choices"][0]["text"]
+
+    def warm(self):
+        """Load in the background so the first chat doesn't pay for it."""
+        def run():
+            try:
+                with self.acquire():
+                    pass
+            except Exception as e:
+                self.last_error = str(e)
+        threading.Thread(target=run, name="llama-warm", daemon=True).start()
+
+    def unload(self):
+        with self._cond:
+            self._drain()
+
+    def _start_reaper(self):
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name="llama-idle", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            ttl = _env_int("LOCAL_MODEL_IDLE_TTL", 600)
+            time.sleep(max(5, min(ttl or 60, 60)))
+            if ttl <= 0:
+                continue
+            with self._cond:
+                if self._in_use == 0 and self._created and time.monotonic() - self._last_used > ttl:
+                    self._drain()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "model": (self._config or self._wanted())[0] or None,
+                "loaded": self._created,
+                "in_use": self._in_use,
+                "loads": self.loads,
+                "load_seconds": self.load_seconds,
+                "idle_seconds": round(time.monotonic() - self._last_used, 1) if self._last_used else None,
+                "last_error": self.last_error,
+            }
+
+POOL = ModelPool()
+
+def warm_enabled() -> bool:
+    return os.getenv("LOCAL_MODEL_WARM", "0").lower() in ("1", "true", "yes", "on")
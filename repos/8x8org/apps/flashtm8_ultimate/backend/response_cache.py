@@ -0,0 +1,157 @@
+"""
+Persistent prompt -> reply cache (SQLite, runtime/response_cache.db).
+
+Keyed by sha256 of the normalized prompt (case / whitespace / trailing
+punctuation folded) plus whatever shapes the answer: provider mode, model
+names, temperature and a hash of the retrieved context chunks. Entries expire
+after RESPONSE_CACHE_TTL seconds (86400); past RESPONSE_CACHE_MB (16) the
+least recently hit rows go first. RESPONSE_CACHE=0 turns it off, and a request
+can skip it with "cache": false. Offline fallback answers are never stored.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / "runtime" / "response_cache.db"
+
+def _env_num(k: str, d: float) -> float:
+    try:
+        return float(os.getenv(k, "") or d)
+    except ValueError:
+        return d
+
+def enabled() -> bool:
+    return os.getenv("RESPONSE_CACHE", "1").lower() not in ("0", "false", "no", "off")
+
+def normalize(prompt: str) -> str:
+    return " ".join(prompt.lower().split()).rstrip("?!. ")
+
+def context_hash(ctx) -> str:
+    """Which chunks were retrieved (and their content) - a re-indexed file changes it."""
+    if not ctx:
+        return ""
+    h = hashlib.sha256()
+    for c in ctx:
+        h.update(f"{c.get('path')}:{c.get('start_line')}-{c.get('end_line')}\0".encode())
+        h.update((c.get("snippet") or "").encode("utf-8", "ignore"))
+    return h.hexdigest()
+
+def make_key(prompt: str, **parts) -> str:
+    blob = json.dumps([normalize(prompt), sorted(parts.items())], default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path=None):
+        self.path = str(path or os.getenv("RESPONSE_CACHE_PATH", "") or DEFAULT_PATH)
+        self._lock = threading.Lock()
+        self._ready = False
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def _connect(self):
+        if not self._ready:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""CREATE TABLE IF NOT EXISTS responses(
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                reply TEXT,
+                created REAL,
+                last_hit REAL,
+                hits INTEGER DEFAULT 0,
+                bytes INTEGER
+            )""")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_hit ON responses(last_hit)")
+            self._ready = True
+        return con
+
+    def get(self, key: str):
+        now = time.time()
+        ttl = _env_num("RESPONSE_CACHE_TTL", 86400)
+        with self._lock:
+            con = self._connect()
+            try:
+                row = con.execute("SELECT provider, reply, created FROM responses WHERE key=?", (key,)).fetchone()
+                if row and ttl > 0 and now - row[2] > ttl:
+                    con.execute("DELETE FROM responses WHERE key=?", (key,))
+                    con.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                con.execute("UPDATE responses SET last_hit=?, hits=hits+1 WHERE key=?", (now, key))
+                con.commit()
+                self.hits += 1
+                return {"provider": row[0], "reply": row[1], "age": round(now - row[2], 1)}
+            finally:
+                con.close()
+
+    def put(self, key: str, provider: str, reply: str):
+        now = time.time()
+        size = len(reply.encode("utf-8", "ignore"))
+        with self._lock:
+            con = self._connect()
+            try:
+                con.execute(
+                    "INSERT OR REPLACE INTO responses(key, provider, reply, created, last_hit, hits, bytes) VALUES(?,?,?,?,?,0,?)",
+                    (key, provider, reply, now, now, size),
+                )
+                self.stores += 1
+                self._evict(con, now)
+                con.commit()
+            finally:
+                con.close()
+
+    def _evict(self, con, now: float):
+        ttl = _env_num("RESPONSE_CACHE_TTL", 86400)
+        if ttl > 0:
+            self.evictions += con.execute("DELETE FROM responses WHERE created < ?", (now - ttl,)).rowcount
+        budget = _env_num("RESPONSE_CACHE_MB", 16) * (1 << 20)
+        total = con.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+        while total > budget:
+            rows = con.execute("SELECT key, bytes FROM responses ORDER BY last_hit LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, n in rows:
+                con.execute("DELETE FROM responses WHERE key=?", (key,))
+                total -= n
+                self.evictions += 1
+                if total <= budget:
+                    break
+
+    def clear(self):
+        with self._lock:
+            con = self._connect()
+            try:
+                con.execute("DELETE FROM responses")
+                con.commit()
+            finally:
+                con.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = 0, 0
+            if os.path.exists(self.path):
+                con = self._connect()
+                try:
+                    entries, size = con.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+                finally:
+                    con.close()
+            total = self.hits + self.misses
+            return {
+                "enabled": enabled(),
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+RESPONSES = ResponseCache()
@@ -0,0 +1,300 @@
+"""
+Local semantic retrieval over the indexed chunks (CPU only, no model download).
+
+- each chunk becomes a signed hashing-trick vector of its identifiers / words
+  (snake_case and camelCase are also split into sub-words), tf is sublinear
+- vectors live next to the index as <index.db>.vec.npz, sparse (CSR: column
+  ids + float16 values, ~200 bytes per chunk); a rebuild only embeds chunks
+  whose (sha, line range) was not embedded before
+- watcher batches only schedule_build(): bursts of saves coalesce into one
+  background rebuild RETRIEVAL_REBUILD_DELAY seconds (20) later
+- idf is applied at query time and results are ranked by cosine similarity
+- build_context() packs the best chunks into a token budget for the prompt
+
+NumPy is optional: without it build_vectors() is a no-op and retrieval falls
+back to the BM25 search in workspace_index.
+
+Env:
+  RETRIEVAL_ENABLED=1     add workspace context to chat prompts
+  RETRIEVAL_K=8           chunks considered per question
+  RETRIEVAL_TOKENS=1500   prompt budget for the context (~4 chars per token)
+  RETRIEVAL_DIM=1024      hashing dimensions (changing it re-embeds everything)
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from workspace_index import _connect, _env_int, search as search_index
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+_CACHE = {}
+_LOCK = threading.Lock()        # guards _CACHE only; never held while loading or embedding
+_BUILD_LOCK = threading.Lock()  # one build at a time
+_TIMERS = {}
+_TIMERS_LOCK = threading.Lock()
+
+def enabled() -> bool:
+    return os.getenv("RETRIEVAL_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+
+def vectors_path(db_path: str) -> Path:
+    return Path(str(db_path) + ".vec.npz")
+
+def _tokens(text: str):
+    for word in _WORD_RE.findall(text):
+        low = word.lower()
+        if len(low) > 1:
+            yield low
+        parts = [p.lower() for p in _CAMEL_RE.findall(word)]
+        if len(parts) > 1:
+            for p in parts:
+                if len(p) > 1:
+                    yield p
+
+def _embed_row(text: str, dim: int) -> dict:
+    """Raw sublinear-tf hashing vector of one text: {column: weight}, zeros left out."""
+    counts = {}
+    for tok in _tokens(text):
+        h = zlib.crc32(tok.encode())
+        col = h % dim
+        counts[col] = counts.get(col, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    return {col: math.copysign(1.0 + math.log(abs(c)), c) for col, c in counts.items() if c}
+
+def _embed(texts, dim: int):
+    """Dense rows (float32) - only used for queries."""
+    mat = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for col, v in _embed_row(text, dim).items():
+            mat[i, col] = v
+    return mat
+
+def _row_sums(x, indptr):
+    """Per-row sums of a CSR value array (empty rows give 0)."""
+    out = np.zeros(len(indptr) - 1, dtype=np.float32)
+    rows = np.flatnonzero(np.diff(indptr))
+    if len(rows):
+        out[rows] = np.add.reduceat(x, indptr[:-1][rows])
+    return out
+
+def _key(sha: str, start: int, end: int) -> int:
+    # a chunk's text is fully determined by (blob sha, line range)
+    digest = hashlib.blake2b(f"{sha}:{start}:{end}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+def build_vectors(db_path: str, dim: int = None, batch: int = 500) -> dict:
+    """
+    Sync the vector file with the chunks table. Reuses every vector whose chunk
+    content is unchanged, embeds the rest. Returns {ok, chunks, embedded}.
+    """
+    if np is None:
+        return {"ok": False, "error": "numpy not installed"}
+    if not Path(db_path).exists():
+        return {"ok": False, "error": "index missing"}
+    dim = dim or _env_int("RETRIEVAL_DIM", 1024)
+    vpath = vectors_path(db_path)
+
+    with _BUILD_LOCK:
+        old = {}
+        if vpath.exists():
+            try:
+                with np.load(vpath) as z:
+                    if "indptr" in z.files and int(z["dim"]) == dim:
+                        old = {int(k): i for i, k in enumerate(z["keys"])}
+                        old_ptr, old_cols, old_vals = z["indptr"], z["cols"], z["vals"]
+            except (OSError, ValueError, KeyError):
+                old = {}
+
+        col_type = np.uint16 if dim <= 1 << 16 else np.int32
+        con = _connect(db_path)
+        try:
+            rows = con.execute("SELECT id, sha, start_line, end_line FROM chunks ORDER BY id").fetchall()
+            ids = np.array([r[0] for r in rows], dtype=np.int64)
+            keys = np.array([_key(r[1], r[2], r[3]) for r in rows], dtype=np.int64)
+            cols, vals = [None] * len(rows), [None] * len(rows)
+
+            missing = []
+            for i, k in enumerate(keys.tolist()):
+                j = old.get(k)
+                if j is None:
+                    missing.append(i)
+                else:
+                    a, b = old_ptr[j], old_ptr[j + 1]
+                    cols[i], vals[i] = old_cols[a:b], old_vals[a:b]
+
+            for n in range(0, len(missing), batch):
+                part = missing[n:n + batch]
+                qs = ",".join("?" * len(part))
+                text_of = dict(con.execute(
+                    f"SELECT id, text FROM chunks_text WHERE id IN ({qs})",
+                    [int(ids[i]) for i in part],
+                ).fetchall())
+                for i in part:
+                    row = _embed_row(text_of.get(int(ids[i]), ""), dim)
+                    order = sorted(row)
+                    cols[i] = np.array(order, dtype=col_type)
+                    vals[i] = np.array([row[c] for c in order], dtype=np.float16)
+        finally:
+            con.close()
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in cols], out=indptr[1:])
+        tmp = vpath.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f, dim=np.int64(dim), ids=ids, keys=keys, indptr=indptr,
+                cols=np.concatenate(cols).astype(col_type) if rows else np.zeros(0, dtype=col_type),
+                vals=np.concatenate(vals).astype(np.float16) if rows else np.zeros(0, dtype=np.float16),
+            )
+        os.replace(tmp, vpath)
+        with _LOCK:
+            _CACHE.pop(str(vpath), None)
+    return {"ok": True, "chunks": len(rows), "embedded": len(missing)}
+
+def schedule_build(db_path: str, delay: float = None) -> bool:
+    """
+    build_vectors() in the background after `delay` (RETRIEVAL_REBUILD_DELAY, 20 s).
+    Calls while one is pending are folded into it: the build reads the chunks
+    table when it runs, so it covers every batch indexed before then.
+    """
+    if np is None:
+        return False
+    delay = _env_int("RETRIEVAL_REBUILD_DELAY", 20) if delay is None else delay
+    with _TIMERS_LOCK:
+        if db_path in _TIMERS:
+            return False
+        timer = _TIMERS[db_path] = threading.Timer(delay, _scheduled_build, (db_path,))
+    timer.daemon = True
+    timer.start()
+    return True
+
+def _scheduled_build(db_path: str):
+    with _TIMERS_LOCK:
+        _TIMERS.pop(db_path, None)
+    try:
+        build_vectors(db_path)
+    except Exception:
+        pass    # next batch schedules another try; queries keep the old vectors
+
+def _load(db_path: str):
+    """(ids, keys, indptr, cols, vals, inv_norm, idf), cached per file mtime."""
+    vpath = vectors_path(db_path)
+    try:
+        mtime = vpath.stat().st_mtime_ns
+    except OSError:
+        return None
+    with _LOCK:
+        hit = _CACHE.get(str(vpath))
+    if hit and hit[0] == mtime:
+        return hit[1]
+    # loaded outside the lock: a concurrent miss may load twice, but nobody waits on a build
+    with np.load(vpath) as z:
+        if "indptr" not in z.files:
+            return None     # older dense format: the next build rewrites it
+        dim = int(z["dim"])
+        ids, keys, indptr, cols, vals = z["ids"], z["keys"], z["indptr"], z["cols"], z["vals"]
+    # a column occurs at most once per row, so its count is the document frequency
+    df = np.bincount(cols, minlength=dim)
+    idf = (np.log((len(ids) + 1) / (df + 1)) + 1.0).astype(np.float32)
+    norms = np.sqrt(_row_sums(np.square(vals * idf[cols]), indptr))
+    inv_norm = 1.0 / np.maximum(norms, 1e-9)
+    loaded = (ids, keys, indptr, cols, vals, inv_norm, idf)
+    with _LOCK:
+        _CACHE[str(vpath)] = (mtime, loaded)
+    return loaded
+
+def semantic_search(db_path: str, q: str, k: int = 8) -> list:
+    """
+    Top-k chunks by cosine similarity: [{path, start_line, end_line, score, snippet}].
+    Empty when numpy or the vector file is missing.
+    """
+    if np is None or not q.strip():
+        return []
+    loaded = _load(db_path)
+    if loaded is None:
+        return []
+    ids, keys, indptr, cols, vals, inv_norm, idf = loaded
+    if not len(ids):
+        return []
+
+    qv = _embed([q], len(idf))[0] * idf
+    norm = np.linalg.norm(qv)
+    if not norm:
+        return []
+    # cosine of idf-weighted vectors, straight off the sparse rows (idf once per side)
+    scores = _row_sums(vals * (qv * (idf / norm))[cols], indptr) * inv_norm
+    # over-fetch: rows may be stale if the index moved on since the last build
+    top = min(len(scores), k * 3)
+    order = np.argpartition(-scores, top - 1)[:top]
+    order = order[np.argsort(-scores[order])]
+
+    con = _connect(db_path)
+    try:
+        hits = []
+        for i in order.tolist():
+            if scores[i] <= 0 or len(hits) >= k:
+                break
+            row = con.execute("""
+                SELECT t.path, c.sha, c.start_line, c.end_line, t.text
+                FROM chunks c JOIN chunks_text t ON t.id = c.id
+                WHERE c.id = ?
+            """, (int(ids[i]),)).fetchone()
+            if not row or _key(row[1], row[2], row[3]) != int(keys[i]):
+                continue
+            hits.append({
+                "path": row[0],
+                "start_line": row[2],
+                "end_line": row[3],
+                "score": round(float(scores[i]), 3),
+                "snippet": row[4],
+            })
+        return hits
+    finally:
+        con.close()
+
+def build_context(db_path: str, q: str, k: int = None, budget_tokens: int = None) -> list:
+    """
+    Best chunks for a question, packed greedily into ~budget_tokens.
+    Overlapping windows of the same file count once. Uses BM25 hits when
+    semantic retrieval is unavailable.
+    """
+    k = k or _env_int("RETRIEVAL_K", 8)
+    budget = (budget_tokens or _env_int("RETRIEVAL_TOKENS", 1500)) * 4
+    hits = semantic_search(db_path, q, k)
+    if not hits:
+        # plain words only, so a question never lands in the literal/regex search modes
+        hits = search_index(db_path, re.sub(r"[^\w\s]", " ", q), limit=k)
+
+    ctx, taken, used = [], {}, 0
+    for h in hits:
+        span = (h.get("start_line", 0), h.get("end_line", 0))
+        if any(span[0] <= e and s <= span[1] for s, e in taken.get(h["path"], [])):
+            continue
+        cost = len(h.get("snippet") or "") + len(h["path"]) + 16
+        if used + cost > budget:
+            continue
+        taken.setdefault(h["path"], []).append(span)
+        used += cost
+        ctx.append({k2: h.get(k2) for k2 in ("path", "start_line", "end_line", "score", "snippet")})
+    return ctx
+
+def pack_prompt(question: str, ctx: list) -> str:
+    """Question + retrieved excerpts, in the order they were ranked."""
+    if not ctx:
+        return question
+    parts = ["Answer using the workspace excerpts below when they are relevant.\n"]
+    for c in ctx:
+        parts.append(f"--- {c['path']}:{c.get('start_line')}-{c.get('end_line')}")
+        parts.append((c.get("snippet") or "").rstrip())
+    parts.append("---\n")
+    parts.append("Question: " + question)
+    return "\n".join(parts)
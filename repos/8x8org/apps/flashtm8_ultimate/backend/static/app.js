@@ -4,6 +4,28 @@ async function post(url, body){
   return await r.json();
 }
 async function get(url){const r=await fetch(url);return await r.json();}
+// POST + read a text/event-stream body, onEvent(name, data) per event
+async function postStream(url, body, onEvent){
+  const r=await fetch(url,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(body||{})});
+  if(!r.ok||!r.body) throw new Error("HTTP "+r.status);
+  const reader=r.body.getReader(), dec=new TextDecoder();
+  let buf="";
+  for(;;){
+    const {value,done}=await reader.read();
+    if(done) break;
+    buf+=dec.decode(value,{stream:true});
+    let i;
+    while((i=buf.indexOf("\n\n"))>=0){
+      const block=buf.slice(0,i); buf=buf.slice(i+2);
+      let name="message", data="";
+      block.split("\n").forEach(l=>{
+        if(l.startsWith("event:")) name=l.slice(6).trim();
+        else if(l.startsWith("data:")) data+=l.slice(5).trim();
+      });
+      if(data) onEvent(name, JSON.parse(data));
+    }
+  }
+}
 
 function chat(cls, txt){
   const d=document.createElement("div");
@@ -34,8 +56,20 @@ async function refreshConfig(){
 el("btnIndex").onclick=async()=>{
   el("out").textContent="Indexing workspace...";
   const r=await post("/api/index",{});
-  el("out").textContent=JSON.stringify(r,null,2);
-  await refreshHealth();
+  if(!r.job){el("out").textContent=JSON.stringify(r,null,2);return;}
+  // stream progress of the background job (or the one already running)
+  const es=new EventSource(`/api/index/jobs/${r.job.id}/events`);
+  es.addEventListener("progress",e=>{
+    const p=JSON.parse(e.data).progress||{};
+    const eta=p.eta!=null?` • ETA ${p.eta}s`:"";
+    el("out").textContent=`Indexing workspace... ${p.files||0} files • ${((p.bytes||0)/1048576).toFixed(1)} MB • ${p.rate||0} files/s${eta}`;
+  });
+  es.addEventListener("end",async e=>{
+    es.close();
+    el("out").textContent=JSON.stringify(JSON.parse(e.data),null,2);
+    await refreshHealth();
+  });
+  es.onerror=()=>es.close();
 };
 
 el("btnSearch").onclick=async()=>{
@@ -51,12 +85,27 @@ el("btnSend").onclick=async()=>{
   if(!m) return;
   el("msg").value="";
   chat("msgU","You: "+m);
-  const r=await post("/api/chat",{message:m});
-  if(r.ok){
-    chat("msgB","FlashTM8: "+r.reply);
-    el("provider").textContent="Provider used: "+(r.provider||"unknown");
-  }else{
-    chat("msgB","FlashTM8: Error: "+(r.error||"unknown"));
+  chat("msgB","FlashTM8: …");
+  const d=el("chatlog").lastChild;
+  let text="", started=false;
+  try{
+    await postStream("/api/chat/stream",{message:m},(ev,data)=>{
+      if(ev==="provider") el("provider").textContent="Provider used: "+data.provider;
+      else if(ev==="token"){ started=true; text+=data.text; }
+      else if(ev==="error") text+=(text?"\n":"")+"Error: "+data.error;
+      else return;
+      d.textContent="FlashTM8: "+text;
+      el("chatlog").scrollTop=el("chatlog").scrollHeight;
+    });
+  }catch(e){
+    if(started){
+      // partial reply already shown: re-asking would call the provider twice
+      d.textContent="FlashTM8: "+text+"\nError: stream interrupted ("+e.message+")";
+      return;
+    }
+    // no streaming (old backend / buffering proxy): one-shot request
+    const r=await post("/api/chat",{message:m});
+    d.textContent="FlashTM8: "+(r.ok ? r.reply : "Error: "+(r.error||"unknown"));
     el("provider").textContent="Provider used: "+(r.provider||"unknown");
   }
 };
@@ -1,6 +1,8 @@
 import os, subprocess
 from pathlib import Path
 
+import fileread
+
 def _env(k, d=""):
     return os.getenv(k, d)
 
@@ -51,12 +53,28 @@ def safe_write(rel_path: str, content: str, root: str):
     p.write_text(content, encoding="utf-8")
     return {"ok": True, "path": str(p)}
 
-def safe_read(rel_path: str, root: str):
+def resolve_read(rel_path: str, root: str):
     rp = Path(root).resolve()
     p = (rp / rel_path).resolve()
     if not str(p).startswith(str(rp)) or not p.exists() or p.is_dir():
+        return None
+    return p
+
+def safe_read(rel_path: str, root: str, offset: int = 0, length: int = 20000, line=None, lines: int = 200):
+    # a window only: bytes [offset, offset+length), or `lines` lines from 1-based `line`
+    p = resolve_read(rel_path, root)
+    if p is None:
         return {"ok": False, "error": "File not found"}
     try:
-        return {"ok": True, "content": p.read_text(errors="ignore")[:20000]}
+        if line is not None:
+            text, total = fileread.read_lines(str(p), line, lines, length)
+            got = text.count("\n") + (0 if text.endswith("\n") or not text else 1)
+            end = line + got - 1
+            return {"ok": True, "content": text, "start_line": line, "end_line": end,
+                    "total_lines": total, "next_line": end + 1 if end < total else None}
+        data, size = fileread.read_range(str(p), offset, length)
+        end = offset + len(data)
+        return {"ok": True, "content": data.decode("utf-8", "ignore"), "offset": offset,
+                "size": size, "next_offset": end if end < size else None}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -1,6 +1,21 @@
-import os, sqlite3, hashlib
+import os, re, sqlite3, hashlib, threading, time, zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
+try:
+    import zstandard  # optional, better ratio/speed than zlib
+except ImportError:
+    zstandard = None
+
+from content_cache import CACHE
+from walker import walk_files
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
+
 DEFAULT_EXCLUDES = {
     ".git", ".venv", "node_modules", "__pycache__", ".pytest_cache",
     "dist", "build", ".mypy_cache", ".cache", ".idea", ".vscode"
@@ -11,91 +26,604 @@ TEXT_EXTS = {
     ".yml",".yaml",".toml",".ini",".env.example",".sql",".graphql"
 }
 
+# bump on index layout changes; older index DBs are dropped and rebuilt
+SCHEMA_VERSION = 4
+
+# line windows per chunk (with overlap); chunks are what search returns
+CHUNK_LINES = 40
+CHUNK_OVERLAP = 10
+
+UPSERT_SQL = """
+  INSERT INTO files(path, mtime, size, sha)
+  VALUES(?,?,?,?)
+  ON CONFLICT(path) DO UPDATE SET
+    mtime=excluded.mtime,
+    size=excluded.size,
+    sha=excluded.sha
+"""
+
 def _sha(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8", "ignore")).hexdigest()
 
+def _pack(text: str):
+    data = text.encode("utf-8", "ignore")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+def _unpack(codec, data) -> str:
+    if data is None:
+        return ""
+    if codec == "zstd":
+        if zstandard is None:
+            return ""
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8", "ignore")
+
+def _lines_size(lines) -> int:
+    # text + rough per-str overhead
+    return sum(map(len, lines)) + 56 * len(lines)
+
+def _unpack_lines(sha, codec, data, start, end) -> str:
+    """SQL helper: lines start..end (1-based, inclusive) of a blob."""
+    # shared byte-bounded LRU (content_cache), keyed by blob sha
+    lines = CACHE.get_or_load(("blob", sha), lambda: _unpack(codec, data).split("\n"), _lines_size)
+    return "\n".join(lines[start - 1:end])
+
+def _chunk_spans(text: str):
+    """Overlapping (start_line, end_line) windows over the text."""
+    n = max(1, text.count("\n") + (0 if text.endswith("\n") else 1))
+    step = CHUNK_LINES - CHUNK_OVERLAP
+    spans, start = [], 1
+    while True:
+        end = min(start + CHUNK_LINES - 1, n)
+        spans.append((start, end))
+        if end >= n:
+            return spans
+        start += step
+
+def _env_int(k: str, d: int) -> int:
+    try:
+        return max(1, int(os.getenv(k, "") or d))
+    except ValueError:
+        return d
+
+def _connect(db_path: str):
+    con = sqlite3.connect(db_path)
+    # index is a rebuildable cache: NORMAL sync under WAL is enough
+    con.execute("PRAGMA synchronous=NORMAL;")
+    # bodies live compressed in blobs; FTS view + triggers decompress via this
+    con.create_function("unpack_blob", 2, _unpack, deterministic=True)
+    con.create_function("unpack_lines", 5, _unpack_lines, deterministic=True)
+    return con
+
 def init_db(db_path: str):
+    """
+    files : metadata only (path/mtime/size/sha), so path scans never touch content
+    blobs : compressed body per distinct sha, ref-counted from files by triggers
+    chunks: overlapping line ranges per file; FTS indexes and returns these
+    """
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(db_path)
+    con = _connect(db_path)
     cur = con.cursor()
-    cur.execute("""
+    # WAL: /api/search keeps reading while a reindex writes
+    cur.execute("PRAGMA journal_mode=WAL;")
+    if cur.execute("PRAGMA user_version;").fetchone()[0] != SCHEMA_VERSION:
+        # index is only a cache: drop old layout, next /api/index refills it
+        cur.executescript("""
+          DROP TABLE IF EXISTS chunks_tri;
+          DROP TABLE IF EXISTS chunks_fts;
+          DROP VIEW IF EXISTS chunks_text;
+          DROP TABLE IF EXISTS chunks;
+          DROP TABLE IF EXISTS files_fts;
+          DROP VIEW IF EXISTS files_text;
+          DROP TABLE IF EXISTS files;
+          DROP TABLE IF EXISTS blobs;
+        """)
+        cur.execute(f"PRAGMA user_version={SCHEMA_VERSION};")
+    cur.executescript("""
       CREATE TABLE IF NOT EXISTS files (
-        path TEXT PRIMARY KEY,
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
         mtime REAL,
         size INTEGER,
-        sha TEXT,
-        content TEXT
+        sha TEXT
+      );
+
+      CREATE TABLE IF NOT EXISTS blobs (
+        sha TEXT PRIMARY KEY,
+        refs INTEGER NOT NULL DEFAULT 0,
+        codec TEXT NOT NULL,
+        data BLOB
+      );
+
+      CREATE TRIGGER IF NOT EXISTS files_ref_ai AFTER INSERT ON files BEGIN
+        UPDATE blobs SET refs = refs + 1 WHERE sha = new.sha;
+      END;
+      CREATE TRIGGER IF NOT EXISTS files_ref_ad AFTER DELETE ON files BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE sha = old.sha;
+      END;
+      CREATE TRIGGER IF NOT EXISTS files_ref_au AFTER UPDATE OF sha ON files BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE sha = old.sha;
+        UPDATE blobs SET refs = refs + 1 WHERE sha = new.sha;
+      END;
+
+      CREATE VIEW IF NOT EXISTS files_text AS
+        SELECT f.id AS id, f.path AS path, unpack_blob(b.codec, b.data) AS content
+        FROM files f JOIN blobs b ON b.sha = f.sha;
+
+      CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL,
+        sha TEXT NOT NULL,
+        start_line INTEGER NOT NULL,
+        end_line INTEGER NOT NULL
       );
+      CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id);
+
+      CREATE TRIGGER IF NOT EXISTS files_chunks_bd BEFORE DELETE ON files BEGIN
+        DELETE FROM chunks WHERE file_id = old.id;
+      END;
+
+      CREATE VIEW IF NOT EXISTS chunks_text AS
+        SELECT c.id AS id, f.path AS path,
+               unpack_lines(b.sha, b.codec, b.data, c.start_line, c.end_line) AS text
+        FROM chunks c
+        JOIN files f ON f.id = c.file_id
+        JOIN blobs b ON b.sha = c.sha;
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_path ON files(path);")
+    _init_fts(cur)
     con.commit()
     con.close()
 
-def index_workspace(root: str, db_path: str, max_bytes: int, extra_excludes=None):
+def _init_fts(cur):
+    """
+    FTS5 index over chunks_text(path, text), kept in sync by triggers on chunks.
+    External content: FTS holds only the index; highlight() cuts text from the blob.
+    """
+    try:
+        cur.execute("""
+          CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            path, text,
+            content='chunks_text', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+          );
+        """)
+    except sqlite3.OperationalError:
+        # no FTS5 in this sqlite build -> search() uses LIKE
+        return
+    # chunks keep their own sha and blobs are GC'd after the run, so deletes see the old text
+    cur.executescript("""
+      CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts(rowid, path, text)
+        SELECT id, path, text FROM chunks_text WHERE id = new.id;
+      END;
+      CREATE TRIGGER IF NOT EXISTS chunks_fts_bd BEFORE DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, path, text)
+        SELECT 'delete', id, path, text FROM chunks_text WHERE id = old.id;
+      END;
+    """)
+    _init_trigram(cur)
+
+def _init_trigram(cur):
+    """
+    Trigram postings over chunk text (FTS5 'trigram' tokenizer, sqlite >= 3.34).
+    Narrows candidates for substring / re: search; matches are verified in Python.
+    """
+    try:
+        cur.execute("""
+          CREATE VIRTUAL TABLE IF NOT EXISTS chunks_tri USING fts5(
+            text,
+            content='chunks_text', content_rowid='id',
+            tokenize='trigram case_sensitive 0'
+          );
+        """)
+    except sqlite3.OperationalError:
+        # tokenizer missing -> substring/regex search scans all chunks
+        return
+    cur.executescript("""
+      CREATE TRIGGER IF NOT EXISTS chunks_tri_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_tri(rowid, text)
+        SELECT id, text FROM chunks_text WHERE id = new.id;
+      END;
+      CREATE TRIGGER IF NOT EXISTS chunks_tri_bd BEFORE DELETE ON chunks BEGIN
+        INSERT INTO chunks_tri(chunks_tri, rowid, text)
+        SELECT 'delete', id, text FROM chunks_text WHERE id = old.id;
+      END;
+    """)
+
+def _read_one(rel: str, path: str, st, max_bytes: int):
+    """Pool stage: read, decode, hash, compress and chunk one file."""
+    if st.st_size > max_bytes:
+        content = f"[SKIPPED large file: {st.st_size} bytes]"
+    else:
+        content = Path(path).read_text(errors="ignore")
+    return rel, st, _sha(content), _pack(content), _chunk_spans(content)
+
+def index_workspace(root: str, db_path: str, max_bytes: int, extra_excludes=None, full: bool = False,
+                    workers: int = None, batch_size: int = None, progress=None, cancel=None):
+    """
+    Incremental: unchanged (mtime, size) -> not re-read; vanished files -> row deleted.
+    full=True re-reads everything (rows are still only rewritten when sha differs).
+
+    walker -> thread pool (read + hash, INDEX_WORKERS) -> one writer with
+    executemany batches (INDEX_BATCH_SIZE) inside a single transaction.
+
+    progress(**counts) is called a few times a second; cancel() -> True stops the
+    walk early (what was read is kept, nothing is pruned, "cancelled" is set).
+
+    Returns {indexed_files, added, changed, removed, unchanged}.
+    """
     rootp = Path(root).resolve()
     exclude = set(extra_excludes or []) | DEFAULT_EXCLUDES
-    init_db(db_path)
 
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
-    count = 0
-
-    for p in rootp.rglob("*"):
-        try:
-            if p.is_dir():
-                if p.name in exclude:
-                    continue
+    def targets():
+        # walker prunes excluded dirs and filters to TEXT_EXTS
+        for rel, entry in walk_files(str(rootp), exclude, TEXT_EXTS):
+            try:
+                yield rel, entry.path, entry.stat()
+            except OSError:
                 continue
 
-            # skip excluded dirs
-            if any(part in exclude for part in p.parts):
-                continue
+    return _index(db_path, targets(), None, max_bytes, full, workers, batch_size, progress, cancel)
+
+def index_paths(root: str, db_path: str, paths, max_bytes: int, extra_excludes=None,
+                workers: int = None, batch_size: int = None):
+    """
+    Re-index just these workspace-relative files/dirs (watcher batches).
+    Missing paths drop their rows, or everything below a vanished dir.
+    Same counts as index_workspace().
+    """
+    rootp = Path(root).resolve()
+    exclude = set(extra_excludes or []) | DEFAULT_EXCLUDES
+    scopes = []
+    # nested scopes are covered by their parent dir; walking both double-indexes
+    for rel in sorted({os.path.normpath(p).strip(os.sep) for p in paths if p} - {"", "."}):
+        if not any(rel.startswith(s + os.sep) for s in scopes):
+            scopes.append(rel)
 
-            # only index text-like extensions
-            ext = p.suffix.lower()
-            if ext not in TEXT_EXTS:
+    def targets():
+        for rel in scopes:
+            if any(part in exclude for part in Path(rel).parts):
                 continue
+            abs_path = rootp / rel
+            if abs_path.is_dir():
+                for sub, entry in walk_files(str(abs_path), exclude, TEXT_EXTS):
+                    try:
+                        yield f"{rel}/{sub}", entry.path, entry.stat()
+                    except OSError:
+                        continue
+            elif abs_path.suffix.lower() in TEXT_EXTS and abs_path.is_file():
+                try:
+                    yield rel, str(abs_path), abs_path.stat()
+                except OSError:
+                    continue
 
-            st = p.stat()
-            rel = str(p.relative_to(rootp))
+    return _index(db_path, targets(), scopes, max_bytes, False, workers, batch_size)
 
-            if st.st_size > max_bytes:
-                content = f"[SKIPPED large file: {st.st_size} bytes]"
-            else:
-                content = p.read_text(errors="ignore")
+# full reindex and watcher batches never run concurrently
+_INDEX_LOCK = threading.Lock()
+
+def _index(db_path: str, targets, scopes, max_bytes: int, full: bool, workers: int, batch_size: int,
+           progress=None, cancel=None):
+    """targets yields (rel, abs_path, stat); scopes limits compared/pruned rows (None = all)."""
+    workers = workers or _env_int("INDEX_WORKERS", min(8, os.cpu_count() or 2))
+    batch_size = batch_size or _env_int("INDEX_BATCH_SIZE", 256)
+    with _INDEX_LOCK:
+        return _index_locked(db_path, targets, scopes, max_bytes, full, workers, batch_size, progress, cancel)
 
-            sha = _sha(content)
+def _index_locked(db_path, targets, scopes, max_bytes, full, workers, batch_size, progress, cancel):
+    init_db(db_path)
+
+    con = _connect(db_path)
+    cur = con.cursor()
 
-            cur.execute("""
-              INSERT INTO files(path, mtime, size, sha, content)
-              VALUES(?,?,?,?,?)
-              ON CONFLICT(path) DO UPDATE SET
-                mtime=excluded.mtime,
-                size=excluded.size,
-                sha=excluded.sha,
-                content=excluded.content
-            """, (rel, st.st_mtime, st.st_size, sha, content))
+    if scopes is None:
+        rows = cur.execute("SELECT path, mtime, size, sha FROM files").fetchall()
+    else:
+        rows = []
+        for scope in scopes:
+            # the path itself or anything below it ('0' sorts right after '/')
+            rows += cur.execute(
+              "SELECT path, mtime, size, sha FROM files WHERE path = ? OR (path > ? AND path < ?)",
+              (scope, scope + "/", scope + "0"),
+            ).fetchall()
+    known = {r[0]: (r[1], r[2], r[3]) for r in rows}
+    seen = set()
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    scanned_bytes, last_report = 0, 0.0
 
-            count += 1
+    def report(final=False):
+        nonlocal last_report
+        now = time.monotonic()
+        if progress is not None and (final or now - last_report >= 0.25):
+            last_report = now
+            progress(files=len(seen), bytes=scanned_bytes,
+                     total=len(known) if scopes is None else None, **stats)
+    blobs, upserts, chunks, touches = [], [], [], []
+
+    def flush(force=False):
+        if upserts and (force or len(upserts) >= batch_size):
+            # blobs before files/chunks rows: triggers ref-count / index from them
+            cur.executemany("INSERT OR IGNORE INTO blobs(sha, codec, data) VALUES(?,?,?)", blobs)
+            cur.executemany(
+              "DELETE FROM chunks WHERE file_id = (SELECT id FROM files WHERE path=?)",
+              [(u[0],) for u in upserts],
+            )
+            cur.executemany(UPSERT_SQL, upserts)
+            cur.executemany(
+              "INSERT INTO chunks(file_id, sha, start_line, end_line) "
+              "VALUES((SELECT id FROM files WHERE path=?),?,?,?)",
+              chunks,
+            )
+            blobs.clear()
+            upserts.clear()
+            chunks.clear()
+        if touches and (force or len(touches) >= batch_size):
+            cur.executemany("UPDATE files SET mtime=?, size=? WHERE path=?", touches)
+            touches.clear()
+
+    def collect(fut):
+        try:
+            rel, st, sha, (codec, data), spans = fut.result()
         except Exception:
-            continue
+            return
+        old = known.get(rel)
+        if old and old[2] == sha:
+            # same bytes, new stat: don't rewrite content / FTS
+            if (old[0], old[1]) != (st.st_mtime, st.st_size):
+                touches.append((st.st_mtime, st.st_size, rel))
+            stats["unchanged"] += 1
+        else:
+            blobs.append((sha, codec, data))
+            upserts.append((rel, st.st_mtime, st.st_size, sha))
+            chunks.extend((rel, sha, a, b) for a, b in spans)
+            stats["changed" if old else "added"] += 1
+        flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        inflight = set()
+        for rel, path, st in targets:
+            if cancel is not None and cancel():
+                stats["cancelled"] = True
+                break
+            # seen before reading, so a read error never drops the row
+            seen.add(rel)
+            scanned_bytes += st.st_size
+            report()
+            old = known.get(rel)
+            if old and not full and old[0] == st.st_mtime and old[1] == st.st_size:
+                stats["unchanged"] += 1
+                continue
+
+            inflight.add(pool.submit(_read_one, rel, path, st, max_bytes))
+            # bounded queue: never hold more than a few files per worker in memory
+            if len(inflight) >= workers * 4:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    collect(fut)
+
+        for fut in inflight:
+            collect(fut)
+    flush(force=True)
+
+    # a cancelled walk never saw the rest of the tree: don't prune it
+    gone = [] if stats.get("cancelled") else [(path,) for path in known.keys() - seen]
+    if gone:
+        cur.executemany("DELETE FROM files WHERE path=?", gone)
+    stats["removed"] = len(gone)
+    # drop bodies no path references anymore
+    cur.execute("DELETE FROM blobs WHERE refs <= 0")
 
     con.commit()
     con.close()
-    return count
+    stats["indexed_files"] = len(seen)
+    report(final=True)
+    return stats
 
-def search(db_path: str, q: str, limit: int = 12):
-    if not Path(db_path).exists():
-        return []
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
+def _fts_query(q: str) -> str:
+    """
+    Search box input -> safe FTS5 MATCH expression.
+    "quoted text" = phrase, word* = prefix, other words are ANDed.
+    """
+    parts = []
+    for m in re.finditer(r'"([^"]*)"|(\S+)', q):
+        phrase, word = m.group(1), m.group(2)
+        if phrase is not None:
+            phrase = phrase.strip()
+            if phrase:
+                parts.append('"' + phrase.replace('"', '""') + '"')
+            continue
+        prefix = word.endswith("*")
+        word = word.strip("*").replace('"', '""')
+        if word:
+            parts.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(parts)
+
+def _like_search(cur, q: str, limit: int):
     q2 = f"%{q}%"
     cur.execute("""
       SELECT path, substr(content, 1, 1400)
-      FROM files
+      FROM files_text
       WHERE path LIKE ? OR content LIKE ?
       LIMIT ?
     """, (q2, q2, limit))
-    rows = cur.fetchall()
-    con.close()
-    return [{"path": r[0], "snippet": r[1]} for r in rows]
+    return [{"path": r[0], "snippet": r[1]} for r in cur.fetchall()]
+
+def _split_highlight(text: str, first_line: int):
+    """
+    highlight() text with \x01/\x02 markers -> (plain text, [{line, start, end}]).
+    Columns are 0-based; a match wrapping a newline is split per line.
+    """
+    plain, matches = [], []
+    line, col, open_at = first_line, 0, None
+    for ch in text:
+        if ch == "\x01":
+            open_at = col
+        elif ch == "\x02":
+            if open_at is not None:
+                matches.append({"line": line, "start": open_at, "end": col})
+            open_at = None
+        else:
+            plain.append(ch)
+            if ch == "\n":
+                if open_at is not None:
+                    matches.append({"line": line, "start": open_at, "end": col})
+                    open_at = 0
+                line, col = line + 1, 0
+            else:
+                col += 1
+    return "".join(plain), matches
+
+def _regex_literals(pattern: str):
+    """
+    Literal runs (>= 3 chars) every match of `pattern` must contain.
+    Only top-level literals are used, which is always a safe (superset) filter.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    runs, run = [], []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        runs.append("".join(run))
+        run = []
+    runs.append("".join(run))
+    return [r for r in runs if len(r) >= 3]
+
+def _has_table(cur, name: str) -> bool:
+    return bool(cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+    ).fetchone())
+
+def _grep_search(cur, rx, literals, limit: int):
+    """
+    Zoekt-style: trigram postings narrow candidate chunks (every literal must
+    occur), `rx` verifies and gives exact offsets. Stops after `limit` hits.
+    """
+    if literals and _has_table(cur, "chunks_tri"):
+        match = " AND ".join('"' + lit.replace('"', '""') + '"' for lit in literals)
+        rows = cur.execute("""
+          SELECT t.id, t.path, t.text, c.start_line, c.end_line
+          FROM chunks_tri
+          JOIN chunks_text t ON t.id = chunks_tri.rowid
+          JOIN chunks c ON c.id = t.id
+          WHERE chunks_tri MATCH ?
+        """, (match,))
+    else:
+        # no usable literal (or no trigram index): verify every chunk
+        rows = cur.execute("""
+          SELECT t.id, t.path, t.text, c.start_line, c.end_line
+          FROM chunks_text t JOIN chunks c ON c.id = t.id
+        """)
+
+    hits, seen = [], set()
+    for _, path, text, start, end in rows:
+        text = text or ""
+        matches = []
+        line_starts = [0] + [i + 1 for i, ch in enumerate(text) if ch == "\n"]
+        for m in rx.finditer(text):
+            if m.end() == m.start():
+                continue
+            idx = bisect_right(line_starts, m.start()) - 1
+            col = m.start() - line_starts[idx]
+            line_end = text.find("\n", m.start())
+            end_col = (min(m.end(), line_end) if line_end != -1 else m.end()) - line_starts[idx]
+            key = (path, start + idx, col)
+            # chunks overlap: report a match only once
+            if key in seen:
+                continue
+            seen.add(key)
+            matches.append({"line": start + idx, "start": col, "end": end_col})
+        if not matches:
+            continue
+        hits.append({
+            "path": path,
+            "start_line": start,
+            "end_line": end,
+            "score": len(matches),
+            "snippet": text,
+            "matches": matches,
+        })
+        if len(hits) >= limit:
+            break
+    return hits
+
+def search(db_path: str, q: str, limit: int = 12):
+    """
+    Mode is picked from the query:
+      re:<pattern>     -> regex, trigram-narrowed
+      code fragment    -> literal substring (has punctuation: `post_json(`, `api/generate`), smart case
+      words/"phrase"   -> BM25 FTS, prefix* ok
+    Hits: {path, start_line, end_line, score, snippet, matches:[{line,start,end}]}
+    """
+    if not Path(db_path).exists():
+        return []
+    con = _connect(db_path)
+    cur = con.cursor()
+    try:
+        if q.startswith("re:"):
+            pattern = q[3:]
+            try:
+                rx = re.compile(pattern, re.MULTILINE)
+            except re.error:
+                return []
+            return _grep_search(cur, rx, _regex_literals(pattern), limit)
+        if re.search(r'[^\w\s"*]', q) and len(q.strip()) >= 3:
+            lit = q.strip()
+            # smart case, like rg: lowercase query matches any case
+            rx = re.compile(re.escape(lit), 0 if lit != lit.lower() else re.IGNORECASE)
+            return _grep_search(cur, rx, [lit], limit)
+        return _ranked_search(cur, q, limit)
+    finally:
+        con.close()
+
+def _ranked_search(cur, q: str, limit: int):
+    """
+    BM25-ranked chunk search (path weighted above text); overlapping chunks
+    of one file collapse to the best. LIKE fallback if FTS5 is missing.
+    """
+    match = _fts_query(q)
+    if not _has_table(cur, "chunks_fts") or not match:
+        return _like_search(cur, q, limit)
+    try:
+        cur.execute("""
+          SELECT c.id, c.start_line, c.end_line, ranked.path, ranked.hl, ranked.score
+          FROM (
+              SELECT rowid AS id, path,
+                     highlight(chunks_fts, 1, char(1), char(2)) AS hl,
+                     bm25(chunks_fts, 4.0, 1.0) AS score
+              FROM chunks_fts
+              WHERE chunks_fts MATCH ?
+              ORDER BY score
+              LIMIT ?
+          ) ranked
+          JOIN chunks c ON c.id = ranked.id
+          ORDER BY ranked.score
+        """, (match, limit * 3))
+        rows = cur.fetchall()
+    except sqlite3.OperationalError:
+        return _like_search(cur, q, limit)
+
+    hits, taken = [], {}
+    for _, start, end, path, hl, score in rows:
+        if any(start <= e and s <= end for s, e in taken.get(path, [])):
+            continue
+        taken.setdefault(path, []).append((start, end))
+        text, matches = _split_highlight(hl or "", start)
+        hits.append({
+            "path": path,
+            "start_line": start,
+            "end_line": end,
+            "score": round(-score, 3),
+            "snippet": text,
+            "matches": matches,
+        })
+        if len(hits) >= limit:
+            break
+    return hits
@@ -53,6 +53,7 @@ python -m pip install -U \
   rich \
   python-dotenv \
   requests \
+  httpx \
   gitpython \
   httptools \
   pyyaml \